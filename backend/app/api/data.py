@@ -1,5 +1,43 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Header, UploadFile, File, Query
+from typing import Optional
+from app.models.schemas import DataInfo, DataPreview
+from app.services.data_service import DataService
 
 router = APIRouter()
 
-# データ管理のエンドポイント（後で実装）
+@router.post("/upload", response_model=DataInfo)
+async def upload_data(
+    file: UploadFile = File(...),
+    x_session_id: Optional[str] = Header(None)
+):
+    """CSVデータをアップロード"""
+    if not x_session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+
+    service = DataService(x_session_id)
+    return await service.upload(file)
+
+@router.get("/{data_id}", response_model=DataInfo)
+async def get_data_info(
+    data_id: str,
+    x_session_id: Optional[str] = Header(None)
+):
+    """データの情報を取得"""
+    if not x_session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+
+    service = DataService(x_session_id)
+    return await service.get_info(data_id)
+
+@router.get("/{data_id}/preview", response_model=DataPreview)
+async def get_data_preview(
+    data_id: str,
+    rows: int = Query(10, ge=1, le=1000),
+    x_session_id: Optional[str] = Header(None)
+):
+    """データのプレビュー（先頭行）を取得"""
+    if not x_session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+
+    service = DataService(x_session_id)
+    return await service.get_preview(data_id, rows)
@@ -1,12 +1,19 @@
-from fastapi import APIRouter
-from typing import List
+from fastapi import APIRouter, Header, Response
+from typing import List, Optional
 from app.models.schemas import DistributionDefinition
+from app.services.definition_registry import etag_matches
 from app.services.distribution_service import DistributionService
 
 router = APIRouter()
 
 @router.get("", response_model=List[DistributionDefinition])
-async def get_distributions():
+async def get_distributions(if_none_match: Optional[str] = Header(None)):
     """利用可能な分布一覧を取得"""
     service = DistributionService()
-    return service.get_all_distributions()
+    body, etag = service.get_serialized()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    # ボディとETagは1回だけ取得する（途中で再読み込みされても、返すボディのETagで判定する）
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
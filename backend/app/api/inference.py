@@ -1,5 +1,112 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Header, Query
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from app.models.schemas import (
+    PosteriorPredictiveConfig,
+    PriorPredictiveConfig,
+    SampleConfig,
+    SegmentBatchConfig,
+    TaskResponse,
+    TaskStatus,
+)
+from app.services.inference_service import InferenceService
 
 router = APIRouter()
 
-# 推論実行のエンドポイント（後で実装）
+@router.post("/models/{model_id}/build", response_model=TaskResponse)
+async def build_model(
+    model_id: str,
+    x_session_id: Optional[str] = Header(None)
+):
+    """PyMCモデルを構築"""
+    if not x_session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+
+    service = InferenceService(x_session_id)
+    return await service.submit_build(model_id)
+
+@router.post("/models/{model_id}/sample", response_model=TaskResponse)
+async def sample(
+    model_id: str,
+    config: SampleConfig,
+    x_session_id: Optional[str] = Header(None)
+):
+    """サンプリングを実行"""
+    if not x_session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+
+    service = InferenceService(x_session_id)
+    return await service.submit_sample(model_id, config)
+
+@router.post("/models/{model_id}/segments", response_model=TaskResponse)
+async def sample_segments(
+    model_id: str,
+    config: SegmentBatchConfig,
+    x_session_id: Optional[str] = Header(None)
+):
+    """セグメントごとのデータで同じモデルを一括で当てはめる"""
+    if not x_session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+
+    service = InferenceService(x_session_id)
+    return await service.submit_segment_batch(model_id, config)
+
+@router.post("/models/{model_id}/prior-predictive", response_model=TaskResponse)
+async def prior_predictive(
+    model_id: str,
+    config: PriorPredictiveConfig,
+    x_session_id: Optional[str] = Header(None)
+):
+    """事前予測を実行"""
+    if not x_session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+
+    service = InferenceService(x_session_id)
+    return await service.submit_prior_predictive(model_id, config)
+
+@router.post("/models/{model_id}/posterior-predictive", response_model=TaskResponse)
+async def posterior_predictive(
+    model_id: str,
+    config: PosteriorPredictiveConfig,
+    x_session_id: Optional[str] = Header(None)
+):
+    """事後予測を実行"""
+    if not x_session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+
+    service = InferenceService(x_session_id)
+    return await service.submit_posterior_predictive(model_id, config)
+
+@router.get("/tasks/{task_id}", response_model=TaskStatus)
+async def get_task_status(
+    task_id: str,
+    x_session_id: Optional[str] = Header(None)
+):
+    """タスクの状態を取得"""
+    if not x_session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+
+    service = InferenceService(x_session_id)
+    return await service.get_task_status(task_id)
+
+@router.get("/tasks/{task_id}/events")
+async def stream_task_events(
+    task_id: str,
+    session_id: Optional[str] = Query(None),
+    x_session_id: Optional[str] = Header(None)
+):
+    """タスクの進捗をServer-Sent Eventsで配信
+
+    EventSourceはヘッダーを付けられないため、セッションIDはクエリでも受け付ける。
+    """
+    session_id = x_session_id or session_id
+    if not session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+
+    service = InferenceService(session_id)
+    events = await service.stream_events(task_id)
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, HTTPException, Header
 from typing import Optional
-from app.models.schemas import ModelCreate, ModelResponse
+from app.models.schemas import ModelCreate, ModelResponse, ModelSnapshot, ValidationResult
 from app.services.model_service import ModelService
+from app.services.validation_service import ValidationService
 
 router = APIRouter()
 
@@ -29,6 +30,31 @@ async def get_model(
     service = ModelService(x_session_id)
     return await service.get_model(model_id)
 
+@router.get("/{model_id}/snapshot", response_model=ModelSnapshot)
+async def get_model_snapshot(
+    model_id: str,
+    since: Optional[int] = None,
+    x_session_id: Optional[str] = Header(None)
+):
+    """モデル・ノード・エッジを一括取得（sinceを指定すると差分のみ）"""
+    if not x_session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+
+    service = ModelService(x_session_id)
+    return await service.get_snapshot(model_id, since)
+
+@router.post("/{model_id}/validate", response_model=ValidationResult)
+async def validate_model(
+    model_id: str,
+    x_session_id: Optional[str] = Header(None)
+):
+    """グラフを検査（循環・未接続のパラメータ・形状の不整合など）"""
+    if not x_session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+
+    service = ValidationService(x_session_id)
+    return await service.validate(model_id)
+
 @router.delete("/{model_id}")
 async def delete_model(
     model_id: str,
@@ -1,6 +1,14 @@
 from fastapi import APIRouter, HTTPException, Header
 from typing import Optional, List
-from app.models.schemas import NodeCreate, NodeUpdate, NodeResponse, EdgeCreate, EdgeResponse
+from app.models.schemas import (
+    NodeCreate,
+    NodeUpdate,
+    NodeResponse,
+    EdgeCreate,
+    EdgeResponse,
+    GraphBatchRequest,
+    GraphBatchResponse,
+)
 from app.services.node_service import NodeService
 
 router = APIRouter()
@@ -96,3 +104,16 @@ async def delete_edge(
     service = NodeService(x_session_id)
     await service.delete_edge(model_id, edge_id)
     return {"message": "Edge deleted successfully"}
+
+@router.post("/{model_id}/graph:batch", response_model=GraphBatchResponse)
+async def apply_graph_batch(
+    model_id: str,
+    batch: GraphBatchRequest,
+    x_session_id: Optional[str] = Header(None)
+):
+    """ノード・エッジの作成/更新/削除を一括で適用"""
+    if not x_session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+
+    service = NodeService(x_session_id)
+    return await service.apply_batch(model_id, batch)
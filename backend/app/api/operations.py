@@ -1,12 +1,19 @@
-from fastapi import APIRouter
-from typing import List
+from fastapi import APIRouter, Header, Response
+from typing import List, Optional
 from app.models.schemas import OperationDefinition
+from app.services.definition_registry import etag_matches
 from app.services.operation_service import OperationService
 
 router = APIRouter()
 
 @router.get("", response_model=List[OperationDefinition])
-async def get_operations():
+async def get_operations(if_none_match: Optional[str] = Header(None)):
     """利用可能な演算一覧を取得"""
     service = OperationService()
-    return service.get_all_operations()
+    body, etag = service.get_serialized()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    # ボディとETagは1回だけ取得する（途中で再読み込みされても、返すボディのETagで判定する）
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,17 @@
+from fastapi import APIRouter, HTTPException, Header
+from typing import Optional
+from app.models.schemas import QueueStatus
+from app.services.queue_service import QueueService
+
+router = APIRouter()
+
+@router.get("", response_model=QueueStatus)
+async def get_queues(
+    x_session_id: Optional[str] = Header(None)
+):
+    """キューごとの待機中のタスク数・待ち時間と、このセッションの実行数・上限"""
+    if not x_session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+
+    service = QueueService(x_session_id)
+    return await service.get_status()
@@ -0,0 +1,107 @@
+from fastapi import APIRouter, HTTPException, Header, Query
+from fastapi.responses import FileResponse
+from typing import List, Optional
+from app.models.schemas import ResultInfo, ResultSummary, VariableValues
+from app.services.result_service import ResultService, parse_isel
+
+router = APIRouter()
+
+@router.get("/{result_id}", response_model=ResultInfo)
+async def get_result(
+    result_id: str,
+    x_session_id: Optional[str] = Header(None)
+):
+    """推論結果の情報と変数一覧を取得"""
+    if not x_session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+
+    service = ResultService(x_session_id)
+    return await service.get_info(result_id)
+
+@router.get("/{result_id}/summary", response_model=ResultSummary)
+async def get_summary(
+    result_id: str,
+    group: str = Query("posterior"),
+    var_names: Optional[List[str]] = Query(None),
+    sort: Optional[str] = Query(None),  # 例: -r_hat（収束の悪い順）, ess_bulk
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    x_session_id: Optional[str] = Header(None)
+):
+    """パラメータ推定結果のサマリー（mean, sd, HDI, r_hat, ESS）"""
+    if not x_session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+
+    service = ResultService(x_session_id)
+    return await service.get_summary(result_id, group, var_names, sort, offset, limit)
+
+@router.get("/{result_id}/variables/{name}", response_model=VariableValues)
+async def get_variable(
+    result_id: str,
+    name: str,
+    group: str = Query("posterior"),
+    chains: Optional[List[int]] = Query(None),
+    draw_start: Optional[int] = Query(None, ge=0),
+    draw_stop: Optional[int] = Query(None, ge=0),
+    thin: int = Query(1, ge=1),
+    isel: List[str] = Query([]),  # 例: school:0:10, school:1,4,7
+    x_session_id: Optional[str] = Header(None)
+):
+    """変数の値を取得（チェーン・ドロー範囲・間引き・次元の選択で必要な部分だけ）"""
+    if not x_session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+
+    service = ResultService(x_session_id)
+    return await service.get_variable(
+        result_id, name, group, chains, draw_start, draw_stop, thin, parse_isel(isel)
+    )
+
+async def _plot_response(
+    kind: str,
+    result_id: str,
+    var_names: Optional[List[str]],
+    thin: int,
+    width: float,
+    height: Optional[float],
+    dpi: int,
+    x_session_id: Optional[str],
+) -> FileResponse:
+    if not x_session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+
+    service = ResultService(x_session_id)
+    path = await service.get_plot(result_id, kind, var_names, thin, width, height, dpi)
+    # 画像はパラメータから決まるキーで保存しているので内容は変わらない
+    return FileResponse(
+        path, media_type="image/png", headers={"Cache-Control": "private, max-age=86400"}
+    )
+
+@router.get("/{result_id}/trace")
+async def get_trace_plot(
+    result_id: str,
+    var_names: Optional[List[str]] = Query(None),
+    thin: int = Query(1, ge=1),
+    width: float = Query(12, gt=0, le=40),
+    height: Optional[float] = Query(None, gt=0, le=80),
+    dpi: int = Query(100, ge=50, le=300),
+    x_session_id: Optional[str] = Header(None)
+):
+    """トレースプロット画像（初回リクエスト時に描画）"""
+    return await _plot_response(
+        "trace", result_id, var_names, thin, width, height, dpi, x_session_id
+    )
+
+@router.get("/{result_id}/forest")
+async def get_forest_plot(
+    result_id: str,
+    var_names: Optional[List[str]] = Query(None),
+    thin: int = Query(1, ge=1),
+    width: float = Query(8, gt=0, le=40),
+    height: Optional[float] = Query(None, gt=0, le=80),
+    dpi: int = Query(100, ge=50, le=300),
+    x_session_id: Optional[str] = Header(None)
+):
+    """フォレストプロット画像（初回リクエスト時に描画）"""
+    return await _plot_response(
+        "forest", result_id, var_names, thin, width, height, dpi, x_session_id
+    )
@@ -0,0 +1,17 @@
+from fastapi import APIRouter, HTTPException, Header
+from typing import Optional
+from app.models.schemas import StorageStatus
+from app.services.storage_manager import StorageManager
+
+router = APIRouter()
+
+@router.get("", response_model=StorageStatus)
+async def get_storage(
+    x_session_id: Optional[str] = Header(None)
+):
+    """このセッションのストレージ使用量・上限と期限"""
+    if not x_session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+
+    service = StorageManager(x_session_id)
+    return await service.get_status()
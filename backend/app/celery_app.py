@@ -1,11 +1,21 @@
 from celery import Celery
+from kombu import Queue
 from app.config import settings
+from app.utils.structured_log import configure_logging
+
+configure_logging()
 
 celery_app = Celery(
     "bayesian_model_gui",
     broker=settings.CELERY_BROKER_URL,
     backend=settings.CELERY_RESULT_BACKEND,
-    include=["app.services.tasks"]
+    # queuesはキューの待ち時間を記録するシグナル、worker_bootstrapはワーカーの起動時の
+    # 準備（推論ライブラリの読み込み・標準分布のコンパイル）、metrics_serviceはタスクの計測と
+    # 相関IDの引き継ぎを登録する
+    include=[
+        "app.services.tasks", "app.services.queues", "app.services.worker_bootstrap",
+        "app.services.metrics_service",
+    ]
 )
 
 celery_app.conf.update(
@@ -17,4 +27,23 @@ celery_app.conf.update(
     task_track_started=True,
     task_time_limit=3600,
     task_soft_time_limit=3300,
+    # interactive: 構築・事前予測・小さなサンプリング、batch: それ以外の推論（app.services.queues）
+    task_queues=(Queue("interactive"), Queue("batch")),
+    task_default_queue="batch",
+    task_routes={
+        "app.services.tasks.build_model_task": {"queue": "interactive"},
+        "app.services.tasks.prior_predictive_task": {"queue": "interactive"},
+    },
+    task_annotations={
+        "app.services.tasks.build_model_task": {
+            "time_limit": settings.INTERACTIVE_TIME_LIMIT,
+            "soft_time_limit": settings.INTERACTIVE_TIME_LIMIT - 30,
+        },
+        "app.services.tasks.prior_predictive_task": {
+            "time_limit": settings.INTERACTIVE_TIME_LIMIT,
+            "soft_time_limit": settings.INTERACTIVE_TIME_LIMIT - 30,
+        },
+    },
+    # 長いタスクを先取りして抱え込まない（空いたワーカーが次のタスクを取る）
+    worker_prefetch_multiplier=1,
 )
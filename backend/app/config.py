@@ -8,9 +8,43 @@ class Settings(BaseSettings):
     CELERY_BROKER_URL: str = "redis://localhost:6379/0"
     CELERY_RESULT_BACKEND: str = "redis://localhost:6379/0"
 
-    SESSION_TIMEOUT: int = 86400
+    # APIプロセスの非同期Redisコネクションプール
+    REDIS_MAX_CONNECTIONS: int = 64
+    REDIS_POOL_TIMEOUT: float = 5.0
+    REDIS_SOCKET_TIMEOUT: float = 5.0
+
+    SESSION_TIMEOUT: int = 86400  # 最終アクセスからこの秒数でセッションのファイルとキーを消す
+    MODEL_CHANGE_LOG_SIZE: int = 1000  # 差分同期用に保持するモデルごとの変更件数
     MAX_FILE_SIZE: int = 104857600
     STORAGE_PATH: str = "/app/storage"
+    SESSION_STORAGE_QUOTA: int = 1073741824  # セッションごとのデータと結果の合計バイト数の上限
+    STORAGE_SWEEP_INTERVAL: int = 600  # 期限切れのセッションを消すスイーパーの実行間隔（秒）
+    STORAGE_SWEEP_BATCH: int = 100  # スイーパーが1回にまとめて消すセッション数
+    METRICS_FLUSH_INTERVAL: int = 10  # APIのプロセスがメトリクスをRedisに書き出す間隔（秒）
+    RESULT_MAX_ELEMENTS: int = 1000000  # 結果APIが1回に返す値の最大要素数
+    # 事後予測でチャンクあたりに生成する値の要素数（ドロー数 × 行数）の目安
+    POSTERIOR_PREDICTIVE_CHUNK_ELEMENTS: int = 10000000
+
+    # プロット描画用のプロセスプール（推論ワーカーとは別）
+    PLOT_MAX_WORKERS: int = 2
+    PLOT_MAX_PENDING: int = 16  # 同時に描画待ちにできる画像数（超えたら503）
+    PLOT_MAX_ELEMENTS: int = 100  # 1枚に描くスカラーパラメータ数の上限
+
+    # Celeryのキュー: interactive（構築・事前予測・小さなサンプリング）と batch（それ以外の推論）
+    INTERACTIVE_MAX_COST: float = 20000000  # 推定コストがこれ以下のサンプリングはinteractiveに投入
+    INTERACTIVE_TIME_LIMIT: int = 600  # interactiveのタスクの時間の上限（秒）
+    # セッションごとに同時に実行中・待機中にできるタスク数（キューごと）
+    SESSION_MAX_INTERACTIVE_TASKS: int = 8
+    SESSION_MAX_BATCH_TASKS: int = 2
+
+    # ワーカーの起動時に推論ライブラリを読み込み、標準分布のlogp/dlogpをコンパイルしておく
+    WORKER_PREWARM: bool = True
+    # PyTensorのコンパイル結果を置く共有ディレクトリ（未指定ならSTORAGE_PATH/.pytensor）
+    PYTENSOR_COMPILE_DIR: str = ""
+
+    # ワーカーのコンパイル済みモデルキャッシュ（プロセスごと）
+    MODEL_CACHE_MAX_BYTES: int = 2147483648
+    MODEL_CACHE_MAX_ENTRIES: int = 16
 
     CORS_ORIGINS: Union[str, List[str]] = ["http://localhost:3000", "http://localhost"]
 
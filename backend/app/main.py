@@ -1,12 +1,42 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import models, nodes, data, inference, distributions, operations
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from app.api import models, nodes, data, inference, results, distributions, operations, queues, storage
 from app.config import settings
+from app.services.metrics_service import flush_metrics, get_metrics_text, run_metrics_flusher
+from app.services.plot_service import plot_renderer
+from app.services.storage_manager import run_sweeper, touch_session
+from app.utils.metrics import metrics
+from app.utils.redis_client import async_redis_client
+from app.utils.structured_log import REQUEST_ID_HEADER, configure_logging, correlation_id, new_correlation_id
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 期限切れのセッションのファイルとキーを定期的に消す
+    sweeper = asyncio.create_task(run_sweeper())
+    # このプロセスのメトリクスを定期的にRedisに書き出す
+    flusher = asyncio.create_task(run_metrics_flusher())
+    yield
+    sweeper.cancel()
+    flusher.cancel()
+    await run_in_threadpool(flush_metrics)
+    # 共有コネクションプールとプロット描画プロセスを閉じる
+    await async_redis_client.close()
+    plot_renderer.shutdown()
 
 app = FastAPI(
     title="階層ベイズモデルGUI API",
     description="グラフィカルモデル構築とPyMC推論のためのAPI",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -17,12 +47,54 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def touch_session_activity(request: Request, call_next):
+    """セッションの期限をリクエストごとに1回だけ延長する（キーごとにTTLを付け直さない）"""
+    session_id = request.headers.get("x-session-id")
+    if session_id:
+        try:
+            await touch_session(session_id)
+        except Exception as e:
+            logger.warning("Session touch error", extra={"fields": {"error": repr(e)}})
+    return await call_next(request)
+
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    """リクエストごとの相関IDの設定と、ルートごとのレイテンシ・ステータスの記録（最も外側で実行）"""
+    request_id = request.headers.get(REQUEST_ID_HEADER) or new_correlation_id()
+    token = correlation_id.set(request_id)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+    finally:
+        duration = time.perf_counter() - start
+        # パスではなくルートのテンプレート（/api/results/{result_id}など）で集計する
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        metrics.observe("http_request_duration_seconds", duration, method=request.method, route=path)
+        metrics.inc("http_responses_total", method=request.method, route=path, status=str(status))
+        logger.info(
+            "Request handled",
+            extra={"fields": {
+                "method": request.method, "route": path, "status": status,
+                "duration_seconds": round(duration, 4),
+            }},
+        )
+        correlation_id.reset(token)
+
 app.include_router(models.router, prefix="/api/models", tags=["models"])
 app.include_router(nodes.router, prefix="/api/models", tags=["nodes"])
 app.include_router(data.router, prefix="/api/data", tags=["data"])
 app.include_router(inference.router, prefix="/api", tags=["inference"])
+app.include_router(results.router, prefix="/api/results", tags=["results"])
 app.include_router(distributions.router, prefix="/api/distributions", tags=["distributions"])
 app.include_router(operations.router, prefix="/api/operations", tags=["operations"])
+app.include_router(queues.router, prefix="/api/queues", tags=["queues"])
+app.include_router(storage.router, prefix="/api/storage", tags=["storage"])
 
 @app.get("/")
 async def root():
@@ -31,3 +103,9 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """APIと全ワーカーのメトリクス（Prometheusのテキスト形式）"""
+    text = await run_in_threadpool(get_metrics_text)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any, Union
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+from typing import Optional, List, Dict, Any, Union, Literal
 from datetime import datetime
 
 class ModelCreate(BaseModel):
@@ -55,6 +55,13 @@ class EdgeCreate(BaseModel):
     source_handle: Optional[str] = None
     target_handle: Optional[str] = None
 
+class EdgeUpdate(BaseModel):
+    # 接続元・接続先は変更できない（付け替えは削除と作成で行う）
+    model_config = ConfigDict(extra="forbid")
+
+    source_handle: Optional[str] = None
+    target_handle: Optional[str] = None
+
 class EdgeResponse(BaseModel):
     edge_id: str
     source: str
@@ -95,3 +102,224 @@ class OperationDefinition(BaseModel):
     handles: List[HandleDefinition]
     broadcasting: bool = True
     description: Optional[str] = None
+
+class GraphOperation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    kind: Literal["node", "edge"]
+    id: Optional[str] = None  # update/deleteの対象ID
+    ref: Optional[str] = None  # create時のクライアント側一時ID（同じバッチ内のエッジから参照可能）
+    data: Optional[Dict[str, Any]] = None  # NodeCreate/NodeUpdate/EdgeCreate/EdgeUpdateの内容
+
+class GraphBatchRequest(BaseModel):
+    operations: List[GraphOperation]
+
+class GraphOperationResult(BaseModel):
+    op: str
+    kind: str
+    id: str
+    ref: Optional[str] = None
+    node: Optional[NodeResponse] = None
+    edge: Optional[EdgeResponse] = None
+
+class GraphBatchResponse(BaseModel):
+    results: List[GraphOperationResult]
+    version: int  # 適用後のモデルのバージョン
+
+class ModelSnapshot(BaseModel):
+    meta: ModelResponse
+    version: int
+    full: bool = True  # Falseの場合、nodes/edgesはsince以降に変更されたものだけ
+    nodes: List[NodeResponse] = []
+    edges: List[EdgeResponse] = []
+    deleted_nodes: List[str] = []
+    deleted_edges: List[str] = []
+
+class ValidationIssue(BaseModel):
+    severity: Literal["error", "warning"]
+    code: str  # cycle, missing_parameter, shape_mismatch など
+    message: str
+    node_id: Optional[str] = None
+    edge_id: Optional[str] = None
+
+class ValidationResult(BaseModel):
+    model_id: str
+    version: int  # 検査したグラフのバージョン
+    valid: bool  # errorがなければTrue（warningは含めない）
+    issues: List[ValidationIssue] = []
+    shapes: Dict[str, Optional[str]] = {}  # node_id → 推定した形状（例: "(n_observations,)"）
+    checked_nodes: int  # 今回検査し直したノード数（変更がなければ0）
+
+class ColumnInfo(BaseModel):
+    name: str
+    kind: str  # int, float, bool, categorical
+    dtype: str
+    null_count: int
+    min: Optional[float] = None
+    max: Optional[float] = None
+    mean: Optional[float] = None
+    n_categories: Optional[int] = None
+
+class DataInfo(BaseModel):
+    data_id: str
+    filename: str
+    n_rows: int
+    columns: List[ColumnInfo]
+    size_bytes: int
+    created_at: datetime
+
+class DataPreview(BaseModel):
+    data_id: str
+    columns: List[str]
+    rows: List[Dict[str, Any]]
+
+class SampleConfig(BaseModel):
+    sampler: Literal["NUTS", "VI"] = "NUTS"
+    # NUTSの実行系（nutpie / numpyroがワーカーで使えなければpymcで実行）
+    backend: Literal["pymc", "nutpie", "numpyro"] = "pymc"
+    draws: int = Field(2000, ge=1)
+    tune: int = Field(1000, ge=0)
+    chains: int = Field(4, ge=1)
+    target_accept: float = Field(0.8, gt=0, lt=1)
+    n_iterations: int = Field(10000, ge=1)  # VIの反復回数
+    # VIのみ: 指定すると観測行からこの行数ずつ無作為に選んだミニバッチで反復する（尤度は全行数に合わせて拡大）
+    batch_size: Optional[int] = Field(None, ge=1)
+    convergence_tolerance: Optional[float] = Field(None, gt=0)  # VIのみ: パラメータの相対変化がこれを下回ったら打ち切る
+    convergence_every: int = Field(100, ge=1)  # 収束を調べる反復の間隔
+    chains_per_task: Optional[int] = Field(None, ge=1)  # 指定するとこの数ずつ別ワーカーで並列実行（NUTSのみ）
+    # 構造が同じグラフの前回の調整結果（ステップサイズ・質量行列・最後のドロー）から始める（pymcのNUTSのみ）
+    warm_start: bool = False
+    warm_start_tune: int = Field(200, ge=0)  # 前回の調整結果を使えた場合の調整ドロー数（tuneより短ければ）
+    random_seed: Optional[int] = None
+
+class SegmentBatchConfig(SampleConfig):
+    """同じグラフをセグメントごとのデータで当てはめる一括実行（推論の設定はSampleConfigと同じ）"""
+    # セグメントの指定（どちらか一方）
+    partition_column: Optional[str] = None  # グラフが対応付けたデータのカテゴリ列。値ごとの行を1セグメントにする
+    data_ids: Optional[List[str]] = None  # データごとに1セグメント（各ノードと同じ名前の列を使う）
+    max_concurrency: int = Field(4, ge=1)  # 同時に実行するサブタスク数の上限
+    save_traces: bool = True  # セグメントごとのトレースも結果として保存する
+
+    @model_validator(mode="after")
+    def check_segments(self) -> "SegmentBatchConfig":
+        if (self.partition_column is None) == (not self.data_ids):
+            raise ValueError("Specify either partition_column or data_ids")
+        if self.data_ids and len(set(self.data_ids)) != len(self.data_ids):
+            raise ValueError("data_ids must be unique")
+        if self.chains_per_task is not None or self.batch_size is not None:
+            raise ValueError("chains_per_task and batch_size are not supported for segment batches")
+        return self
+
+class PriorPredictiveConfig(BaseModel):
+    draws: int = Field(500, ge=1)
+    random_seed: Optional[int] = None
+
+class PosteriorPredictiveConfig(BaseModel):
+    result_id: str  # 事後分布のサンプリング結果
+    random_seed: Optional[int] = None
+    # 予測するデータ（省略時は学習に使ったデータ）。データノードと同じ名前の列を使う
+    data_id: Optional[str] = None
+    chunk_rows: Optional[int] = Field(None, ge=1)  # 1回に予測する行数（省略時はドロー数から自動）
+    thin: int = Field(1, ge=1)  # 事後分布のドローをこの間隔で間引く
+    # 指定すると全ドローではなく行ごとの要約統計量だけを保存する
+    reductions: Optional[List[Literal["mean", "sd", "quantiles", "hdi"]]] = None
+    quantiles: List[float] = [0.05, 0.5, 0.95]
+    hdi_prob: float = Field(0.94, gt=0, lt=1)
+
+    @field_validator("quantiles")
+    @classmethod
+    def check_quantiles(cls, v: List[float]) -> List[float]:
+        if not v or any(not 0 <= q <= 1 for q in v):
+            raise ValueError("quantiles must be between 0 and 1")
+        return v
+
+class TaskResponse(BaseModel):
+    task_id: str
+    status: str
+    message: str
+    result_id: Optional[str] = None  # 同一条件の結果が既にある場合
+    queue: Optional[str] = None  # 投入したキュー（interactive / batch）
+
+class ResultVariable(BaseModel):
+    group: str  # posterior, sample_stats, prior, posterior_predictive など
+    name: str
+    dims: List[str]
+    shape: List[int]
+    dtype: str
+
+class ResultInfo(BaseModel):
+    result_id: str
+    model_id: str
+    kind: str  # sample, prior_predictive, posterior_predictive, segment_batch
+    created_at: datetime
+    config: Optional[Dict[str, Any]] = None
+    backend: Optional[str] = None  # 実際に使ったNUTSの実行系（sampleのみ）
+    backend_fallback: Optional[str] = None  # 指定と異なる場合はその理由
+    warm_start: Optional[Dict[str, Any]] = None  # 前回の調整結果を使った場合（source_result_id, tune, tune_saved）
+    vi: Optional[Dict[str, Any]] = None  # VIの実行情報（iterations, converged, final_loss, ミニバッチならbatch_size, n_rows）
+    segment: Optional[str] = None  # 一括実行の1セグメントの結果の場合、そのセグメント名
+    segments: Optional[List[Dict[str, Any]]] = None  # segment_batchのみ: セグメントごとの segment, result_id, n_rows, error
+    variables: List[ResultVariable]
+
+class VariableValues(BaseModel):
+    result_id: str
+    group: str
+    name: str
+    dims: List[str]
+    shape: List[int]  # 選択後の形状
+    coords: Dict[str, List[Any]]
+    values: Any  # 多次元のリスト（NaNはnull）
+
+class ParameterSummary(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    name: str  # 例: beta[0]
+    variable: str
+    mean: Optional[float] = None
+    sd: Optional[float] = None
+    hdi_low: Optional[float] = Field(None, alias="hdi_3%")
+    hdi_high: Optional[float] = Field(None, alias="hdi_97%")
+    mcse_mean: Optional[float] = None
+    mcse_sd: Optional[float] = None
+    ess_bulk: Optional[float] = None
+    ess_tail: Optional[float] = None
+    r_hat: Optional[float] = None
+
+class ResultSummary(BaseModel):
+    result_id: str
+    model_id: str
+    total: int  # フィルタ後のパラメータ数（ページングの全体件数）
+    offset: int
+    limit: int
+    parameters: List[ParameterSummary]
+
+class TaskStatus(BaseModel):
+    task_id: str
+    status: str  # pending, running, completed, failed
+    progress: Optional[int] = None
+    message: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    chains: Optional[Dict[str, int]] = None  # チェーンごとの進捗（並列実行時）
+    segments: Optional[Dict[str, str]] = None  # セグメントごとの状態（一括実行時: pending, running, completed, failed）
+
+class QueueInfo(BaseModel):
+    name: str  # interactive, batch
+    depth: Optional[int] = None  # 待機中のタスク数（ブローカーから取得できなければNone）
+    recent_tasks: int  # 待ち時間の統計に使った直近のタスク数
+    wait_p50: Optional[float] = None  # 投入から開始までの待ち時間（秒）
+    wait_p95: Optional[float] = None
+    wait_max: Optional[float] = None
+    session_active: int  # このセッションの実行中・待機中のタスク数
+    session_limit: int  # その上限
+
+class QueueStatus(BaseModel):
+    queues: List[QueueInfo]
+
+class StorageStatus(BaseModel):
+    used_bytes: int  # セッションのデータと結果の合計バイト数
+    quota_bytes: int  # その上限（超えたら最終アクセスの古い結果から消す）
+    data_bytes: int
+    result_bytes: int
+    n_data: int
+    n_results: int
+    last_activity: Optional[datetime] = None
+    expires_at: Optional[datetime] = None  # この時刻までアクセスがなければファイルとモデルを消す
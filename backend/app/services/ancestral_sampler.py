@@ -0,0 +1,264 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from scipy import special
+from app.services.distribution_service import distribution_registry
+from app.services.model_builder import (
+    OBSERVATION_DIM,
+    data_variable_name,
+    parse_shape,
+    topological_order,
+)
+from app.services.operation_service import operation_registry
+
+# 事前予測をPyMC/PyTensorのコンパイルなしで行う祖先サンプリング。
+# DAGをトポロジカル順にたどり、各ノードの全ドローをNumPyでまとめて生成する。
+# 次元・プレートの扱いはbuild_pymc_modelと同じ（結果の変数名・次元名も揃える）。
+#
+# 値は常に先頭にドローの軸を持つ配列で、ドローに依存しない値（データ・定数）は
+# 長さ1の軸を持つ。
+
+class UnsupportedGraph(Exception):
+    """祖先サンプリングで扱えない分布・演算を含む場合（PyMCで実行する）"""
+
+# pymc_class → (パラメータ名, サンプラー(rng, size, **params))
+_DISTRIBUTIONS: Dict[str, Tuple[Tuple[str, ...], Callable]] = {
+    "pm.Normal": (("mu", "sigma"), lambda rng, size, mu, sigma: rng.normal(mu, sigma, size)),
+    "pm.HalfNormal": (("sigma",), lambda rng, size, sigma: np.abs(rng.normal(0.0, sigma, size))),
+    "pm.Gamma": (("alpha", "beta"), lambda rng, size, alpha, beta: rng.gamma(alpha, 1.0 / beta, size)),
+    "pm.Beta": (("alpha", "beta"), lambda rng, size, alpha, beta: rng.beta(alpha, beta, size)),
+    "pm.Bernoulli": (("p",), lambda rng, size, p: rng.binomial(1, p, size)),
+    "pm.Poisson": (("mu",), lambda rng, size, mu: rng.poisson(mu, size)),
+    "pm.Uniform": (("lower", "upper"), lambda rng, size, lower, upper: rng.uniform(lower, upper, size)),
+    "pm.Exponential": (("lam",), lambda rng, size, lam: rng.exponential(1.0 / lam, size)),
+    "pm.StudentT": (
+        ("nu", "mu", "sigma"),
+        lambda rng, size, nu, mu, sigma: mu + sigma * rng.standard_t(nu, size),
+    ),
+    "pm.Binomial": (
+        ("n", "p"),
+        lambda rng, size, n, p: rng.binomial(np.asarray(n).astype(np.int64), p, size),
+    ),
+}
+
+def _softmax(x: np.ndarray) -> np.ndarray:
+    # pm.math.softmaxと同じく、ドロー以外の全要素で正規化する
+    return special.softmax(x, axis=tuple(range(1, x.ndim))) if x.ndim > 1 else np.ones_like(x)
+
+def _dot(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """ドローの軸を除いて pm.math.dot と同じ規則で積を求める（1次元・2次元）"""
+    left_vector, right_vector = a.ndim == 2, b.ndim == 2
+    if a.ndim > 3 or b.ndim > 3:
+        raise UnsupportedGraph("dot of arrays with more than 2 dimensions")
+    if left_vector:
+        a = a[:, None, :]
+    if right_vector:
+        b = b[..., None]
+    out = np.matmul(a, b)
+    if right_vector:
+        out = out[..., 0]
+    if left_vector:
+        out = out[..., 0] if right_vector else out[..., 0, :]
+    return out
+
+# pymc_function → NumPyの実装
+_OPERATIONS: Dict[str, Callable] = {
+    "pm.math.add": np.add,
+    "pm.math.subtract": np.subtract,
+    "pm.math.multiply": np.multiply,
+    "pm.math.exp": np.exp,
+    "pm.math.log": np.log,
+    "pm.math.sqrt": np.sqrt,
+    "pm.math.abs_": np.abs,
+    "pm.math.sigmoid": special.expit,
+    "pm.math.softmax": _softmax,
+    "pm.math.dot": _dot,
+}
+
+def _expand(value: np.ndarray, ndim: int) -> np.ndarray:
+    """ドローの軸の直後に長さ1の軸を足し、ドロー以外の次元数をndimに揃える"""
+    missing = ndim - (value.ndim - 1)
+    if missing <= 0:
+        return value
+    return value.reshape(value.shape[:1] + (1,) * missing + value.shape[1:])
+
+def _broadcast(values: Sequence[np.ndarray]) -> List[np.ndarray]:
+    ndim = max(v.ndim - 1 for v in values)
+    return [_expand(v, ndim) for v in values]
+
+def check_supported(nodes: Dict[str, dict]):
+    """全ての分布・演算がNumPyで扱えるか確認（扱えなければUnsupportedGraph）"""
+    for node in nodes.values():
+        if node["node_type"] in ("latent", "hyperparameter", "observed"):
+            definition = distribution_registry.get(node.get("distribution"))
+            if definition is None or definition.multivariate or definition.pymc_class not in _DISTRIBUTIONS:
+                raise UnsupportedGraph(f"Distribution '{node.get('distribution')}'")
+            names, _ = _DISTRIBUTIONS[definition.pymc_class]
+            if {p.name for p in definition.parameters} - set(names):
+                raise UnsupportedGraph(f"Parameters of '{definition.name}'")
+        elif node["node_type"] == "operation":
+            definition = operation_registry.get(node.get("operation"))
+            if definition is None or definition.pymc_function not in _OPERATIONS:
+                raise UnsupportedGraph(f"Operation '{node.get('operation')}'")
+
+def sample_prior_predictive(
+    nodes: Dict[str, dict],
+    edges: Dict[str, dict],
+    data: Dict[str, np.ndarray],
+    plates: Dict[str, List[str]],
+    draws: int,
+    random_seed: Optional[int] = None,
+):
+    """事前分布・事前予測分布から draws 個ずつサンプリング
+
+    返り値は (groups, coords) で、groupsは {グループ名: {変数名: (次元名, 値)}}。
+    値は chain, draw（chainは1つ）を先頭の次元に持つ（trace_store.write_groups の形式）。
+    """
+    check_supported(nodes)
+    rng = np.random.default_rng(random_seed)
+    order = topological_order(nodes, edges)
+    parents: Dict[str, Dict[str, str]] = {node_id: {} for node_id in nodes}
+    for edge in edges.values():
+        parents[edge["target"]][edge.get("target_handle") or edge["source"]] = edge["source"]
+
+    n_observations = len(next(iter(data.values()))) if data else 0
+    coords: Dict[str, np.ndarray] = {OBSERVATION_DIM: np.arange(n_observations)}
+    plate_index: Dict[str, str] = {}
+    for node_id, node in nodes.items():
+        if node["node_type"] == "data" and node["code_name"] in plates:
+            coords[node["code_name"]] = np.asarray(plates[node["code_name"]], dtype=str)
+            plate_index[node["code_name"]] = node_id
+
+    def declared_dims(node: dict) -> Optional[List[str]]:
+        dims = parse_shape(node.get("shape"))
+        if not dims:
+            return None
+        names = []
+        for i, dim in enumerate(dims):
+            if isinstance(dim, int):
+                dim_name = f"{node['code_name']}_dim_{i}"
+                coords[dim_name] = np.arange(dim)
+                names.append(dim_name)
+            else:
+                names.append(dim)
+        return names
+
+    def data_dims(node: dict, values: np.ndarray) -> List[str]:
+        dims = declared_dims(node)
+        if dims is not None:
+            return dims
+        extra = []
+        for i, length in enumerate(values.shape[1:], start=1):
+            dim_name = f"{node['code_name']}_dim_{i}"
+            coords[dim_name] = np.arange(length)
+            extra.append(dim_name)
+        return [OBSERVATION_DIM, *extra]
+
+    values: Dict[str, np.ndarray] = {}
+    leads: Dict[str, Optional[str]] = {}
+
+    def align(source_id: str, target_lead: Optional[str]) -> np.ndarray:
+        value = values[source_id]
+        lead = leads.get(source_id)
+        if lead in plate_index and target_lead == OBSERVATION_DIM:
+            return np.take(value, data[plate_index[lead]], axis=1)
+        return value
+
+    def inferred_lead(operand_ids: Sequence[str]) -> Optional[str]:
+        operand_leads = [leads.get(i) for i in operand_ids]
+        if OBSERVATION_DIM in operand_leads:
+            return OBSERVATION_DIM
+        return next((lead for lead in operand_leads if lead in plate_index), None)
+
+    def default_dims(name: str, value: np.ndarray) -> List[str]:
+        dims = []
+        for i, length in enumerate(value.shape[1:]):
+            dim_name = f"{name}_dim_{i}"
+            coords[dim_name] = np.arange(length)
+            dims.append(dim_name)
+        return dims
+
+    groups = {"prior": {}, "prior_predictive": {}, "observed_data": {}, "constant_data": {}}
+
+    def sample(value: np.ndarray) -> np.ndarray:
+        # ドローに依存しない値も全ドロー分に展開し、chainの次元を付ける
+        return np.broadcast_to(value, (draws,) + value.shape[1:])[None]
+
+    for node_id in order:
+        node = nodes[node_id]
+        node_type = node["node_type"]
+        name = node["code_name"]
+
+        if node_type == "constant":
+            values[node_id] = np.asarray(node["constant_value"], dtype=float)[None]
+            leads[node_id] = None
+
+        elif node_type == "data":
+            dims = data_dims(node, data[node_id])
+            values[node_id] = np.asarray(data[node_id])[None]
+            leads[node_id] = dims[0]
+            groups["constant_data"][name] = (dims, np.asarray(data[node_id]))
+
+        elif node_type == "operation":
+            definition = operation_registry.get(node["operation"])
+            operand_ids = [parents[node_id][h.id] for h in definition.handles]
+            declared = declared_dims(node)
+            lead = declared[0] if declared else inferred_lead(operand_ids)
+            operands = [align(i, lead) for i in operand_ids]
+            function = _OPERATIONS[definition.pymc_function]
+            if function is not _dot:
+                operands = _broadcast(operands)
+            with np.errstate(all="ignore"):
+                result = function(*operands)
+            values[node_id] = result
+            leads[node_id] = lead if result.ndim > 1 else None
+            if declared:
+                dims = declared
+            elif result.ndim == 2 and lead is not None:
+                dims = [lead]
+            else:
+                dims = default_dims(name, result)
+            groups["prior"][name] = (["chain", "draw", *dims], sample(result))
+
+        else:
+            definition = distribution_registry.get(node["distribution"])
+            param_names, sampler = _DISTRIBUTIONS[definition.pymc_class]
+            if node_type == "observed":
+                dims = data_dims(node, data[node_id])
+            else:
+                dims = declared_dims(node) or []
+            lead = dims[0] if dims else None
+
+            constants = node.get("parameters") or {}
+            kwargs = {}
+            for param in definition.parameters:
+                if param.handle_id in parents[node_id]:
+                    kwargs[param.name] = align(parents[node_id][param.handle_id], lead)
+                elif constants.get(param.name) is not None:
+                    kwargs[param.name] = np.asarray(constants[param.name], dtype=float)[None]
+                elif param.default is not None:
+                    kwargs[param.name] = np.asarray(param.default, dtype=float)[None]
+                else:
+                    raise UnsupportedGraph(f"Parameter '{param.name}' of {name} is not set")
+
+            params = _broadcast(list(kwargs.values()))
+            if dims:
+                shape = tuple(len(coords[d]) for d in dims)
+                params = [_expand(p, len(shape)) for p in params]
+            else:
+                shape = np.broadcast_shapes(*(p.shape[1:] for p in params))
+            with np.errstate(all="ignore"):
+                result = sampler(rng, (draws,) + tuple(shape), **dict(zip(kwargs, params)))
+            values[node_id] = result
+            # build_pymc_modelと同じく、形状を宣言していない確率変数はスカラーとして扱う
+            leads[node_id] = lead
+
+            var_dims = dims if dims else default_dims(name, result)
+            if node_type == "observed":
+                groups["prior_predictive"][name] = (["chain", "draw", *var_dims], result[None])
+                groups["observed_data"][name] = (var_dims, np.asarray(data[node_id]))
+                groups["constant_data"][data_variable_name(node)] = (var_dims, np.asarray(data[node_id]))
+            else:
+                groups["prior"][name] = (["chain", "draw", *var_dims], result[None])
+
+    groups = {group: variables for group, variables in groups.items() if variables}
+    return groups, coords
@@ -0,0 +1,184 @@
+import json
+import re
+import shutil
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+import aiofiles
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.models.schemas import DataInfo, DataPreview
+from app.services.storage_manager import StorageManager, StorageQuotaExceeded
+from app.utils.columnar_store import convert_csv, load_categories, open_column, read_head
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+class DataService:
+    def __init__(self, session_id: str):
+        if not _ID_PATTERN.match(session_id):
+            raise HTTPException(status_code=400, detail="Invalid session ID")
+        self.session_id = session_id
+        self.data_path = Path(settings.STORAGE_PATH) / session_id / "data"
+
+    def _get_data_dir(self, data_id: str) -> Path:
+        if not _ID_PATTERN.match(data_id):
+            raise HTTPException(status_code=404, detail="Data not found")
+        return self.data_path / data_id
+
+    def _load_meta(self, data_id: str) -> dict:
+        meta_file = self._get_data_dir(data_id) / "meta.json"
+        if not meta_file.exists():
+            raise HTTPException(status_code=404, detail="Data not found")
+        with open(meta_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    async def upload(self, file: UploadFile) -> DataInfo:
+        """CSVをストリーミングで保存し、列ごとのバイナリ形式に変換"""
+        data_id = f"dat_{uuid.uuid4().hex[:8]}"
+        data_dir = self._get_data_dir(data_id)
+        data_dir.mkdir(parents=True, exist_ok=True)
+        csv_path = data_dir / "source.csv"
+        storage = StorageManager(self.session_id)
+        # 古い結果を全て消しても収まらない大きさなら読み込みの途中で打ち切る
+        available = await run_in_threadpool(storage.available_bytes)
+
+        try:
+            # チャンク単位で書き込み、ファイル全体をメモリに載せない
+            size = 0
+            async with aiofiles.open(csv_path, "wb") as out:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > settings.MAX_FILE_SIZE:
+                        raise HTTPException(status_code=413, detail="File too large")
+                    if size > available:
+                        raise HTTPException(status_code=413, detail="Storage quota exceeded")
+                    await out.write(chunk)
+
+            # 変換はCPU負荷が高いのでスレッドプールで実行
+            schema = await run_in_threadpool(convert_csv, csv_path, data_dir)
+        except HTTPException:
+            shutil.rmtree(data_dir, ignore_errors=True)
+            raise
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError, ValueError) as e:
+            shutil.rmtree(data_dir, ignore_errors=True)
+            raise HTTPException(status_code=400, detail=f"Failed to parse CSV: {e}")
+        finally:
+            # 変換後は元のCSVを保持しない
+            csv_path.unlink(missing_ok=True)
+
+        meta = {
+            "data_id": data_id,
+            "filename": file.filename or "data.csv",
+            "n_rows": schema["n_rows"],
+            "columns": schema["columns"],
+            "size_bytes": size,
+            "created_at": datetime.now().isoformat(),
+        }
+        async with aiofiles.open(data_dir / "meta.json", "w", encoding="utf-8") as f:
+            await f.write(json.dumps(meta, ensure_ascii=False))
+
+        # 変換後の大きさで使用量を記録し、上限を超えたら古い結果から消す
+        try:
+            await run_in_threadpool(storage.add, "data", data_id)
+        except StorageQuotaExceeded as e:
+            raise HTTPException(status_code=413, detail=str(e))
+
+        return DataInfo(**meta)
+
+    async def get_info(self, data_id: str) -> DataInfo:
+        """データの情報（スキーマと統計量）を取得"""
+        return DataInfo(**self._load_meta(data_id))
+
+    async def get_preview(self, data_id: str, rows: int = 10) -> DataPreview:
+        """先頭行だけを読み込んでプレビューを返す"""
+        meta = self._load_meta(data_id)
+        records = read_head(self._get_data_dir(data_id), meta["columns"], rows)
+        return DataPreview(
+            data_id=data_id,
+            columns=[c["name"] for c in meta["columns"]],
+            rows=records,
+        )
+
+    def open_columns(self, data_id: str, columns: List[str]) -> Dict[str, np.ndarray]:
+        """指定した列をメモリマップで開く（ワーカー用）"""
+        meta = self._load_meta(data_id)
+        data_dir = self._get_data_dir(data_id)
+        by_name = {c["name"]: c for c in meta["columns"]}
+
+        missing = [c for c in columns if c not in by_name]
+        if missing:
+            raise ValueError(f"Columns not found in {data_id}: {missing}")
+        return {c: open_column(data_dir, by_name[c]) for c in columns}
+
+    def open_mapped_columns(self, csv_mapping: Dict[str, str]) -> List[np.ndarray]:
+        """ノードのcsv_mappingが指す列をそれぞれメモリマップで開く
+
+        csv_mappingは {"data_id": ..., "column": "y"} または
+        {"data_id": ..., "columns": "x1,x2,x3"} の形式。
+        """
+        data_id = csv_mapping.get("data_id")
+        spec = csv_mapping.get("columns") or csv_mapping.get("column")
+        if not data_id or not spec:
+            raise ValueError(f"Invalid csv_mapping: {csv_mapping}")
+
+        names = [c.strip() for c in spec.split(",") if c.strip()]
+        arrays = self.open_columns(data_id, names)
+        return [arrays[c] for c in names]
+
+    def load_mapped_values(self, csv_mapping: Dict[str, str]) -> np.ndarray:
+        """ノードのcsv_mappingが指す列を取得
+
+        1列ならメモリマップをそのまま、複数列なら (n_rows, n_columns) の配列を返す。
+        """
+        columns = self.open_mapped_columns(csv_mapping)
+        if len(columns) == 1:
+            return columns[0]
+        return np.column_stack(columns)
+
+    def load_mapped_categories(self, csv_mapping: Dict[str, str]) -> Optional[List[str]]:
+        """csv_mappingがカテゴリ列1列を指す場合、そのカテゴリ値一覧を返す（それ以外はNone）"""
+        data_id = csv_mapping.get("data_id")
+        spec = csv_mapping.get("columns") or csv_mapping.get("column")
+        if not data_id or not spec or "," in spec:
+            return None
+
+        meta = self._load_meta(data_id)
+        info = next((c for c in meta["columns"] if c["name"] == spec.strip()), None)
+        if info is None or info["kind"] != "categorical":
+            return None
+        return load_categories(self._get_data_dir(data_id), info)
+
+    def describe_mapping(self, csv_mapping: Dict[str, str]) -> dict:
+        """csv_mappingが指す列の行数・列数などをメタデータだけから求める（値は読まない）
+
+        対応付けが不正な場合（データや列が存在しない）はValueError。
+        """
+        data_id = csv_mapping.get("data_id")
+        spec = csv_mapping.get("columns") or csv_mapping.get("column")
+        if not data_id or not spec:
+            raise ValueError(f"Invalid csv_mapping: {csv_mapping}")
+        names = [c.strip() for c in spec.split(",") if c.strip()]
+
+        try:
+            meta = self._load_meta(data_id)
+        except HTTPException:
+            raise ValueError(f"Data {data_id} not found")
+        by_name = {c["name"]: c for c in meta["columns"]}
+        missing = [c for c in names if c not in by_name]
+        if missing:
+            raise ValueError(f"Columns not found in {data_id}: {missing}")
+
+        categorical = len(names) == 1 and by_name[names[0]]["kind"] == "categorical"
+        return {
+            "n_rows": meta["n_rows"],
+            "n_columns": len(names),
+            "categorical": categorical,
+            "n_categories": by_name[names[0]]["n_categories"] if categorical else None,
+            "null_count": sum(by_name[c]["null_count"] for c in names),
+        }
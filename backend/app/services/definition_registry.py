@@ -0,0 +1,83 @@
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import Dict, Generic, List, Optional, Tuple, Type, TypeVar
+from pydantic import BaseModel
+
+T = TypeVar("T", bound=BaseModel)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Matchヘッダーが、返そうとしているレスポンスのETagと一致するか"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+class DefinitionRegistry(Generic[T]):
+    """分布・演算定義JSONのプロセス内キャッシュ
+
+    ファイルは初回アクセス時に1度だけ読み込んで検証し、以降はmtimeとサイズが
+    変わった場合のみ再読み込みする。APIレスポンス用のJSONバイト列とETagも
+    読み込み時に1度だけ生成する。
+    """
+
+    def __init__(self, files: List[Path], model_cls: Type[T]):
+        self.files = files
+        self.model_cls = model_cls
+        self._lock = threading.Lock()
+        self._signature: Optional[Tuple] = None
+        self._items: List[T] = []
+        self._by_name: Dict[str, T] = {}
+        # (レスポンスボディ, ETag) は1つのタプルで差し替え、読み出し側で組が食い違わないようにする
+        self._serialized: Tuple[bytes, str] = (b"[]", "")
+
+    def _file_signature(self) -> Tuple:
+        signature = []
+        for path in self.files:
+            try:
+                stat = path.stat()
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _refresh(self):
+        signature = self._file_signature()
+        if signature == self._signature:
+            return
+
+        with self._lock:
+            if signature == self._signature:
+                return
+
+            items = []
+            for path in self.files:
+                if path.exists():
+                    with open(path, "r", encoding="utf-8") as f:
+                        items.extend(self.model_cls(**d) for d in json.load(f))
+
+            body = json.dumps(
+                [item.model_dump(mode="json") for item in items], ensure_ascii=False
+            ).encode("utf-8")
+
+            self._items = items
+            # 同名の定義はカスタム定義（後から読み込んだもの）を優先
+            self._by_name = {item.name: item for item in items}
+            self._serialized = (body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+            self._signature = signature
+
+    def get_all(self) -> List[T]:
+        """全定義を取得"""
+        self._refresh()
+        return self._items
+
+    def get(self, name: str) -> Optional[T]:
+        """名前で定義を取得"""
+        self._refresh()
+        return self._by_name.get(name)
+
+    def get_serialized(self) -> Tuple[bytes, str]:
+        """シリアライズ済みのレスポンスボディとETagを取得（304の判定にもこの組を使う）"""
+        self._refresh()
+        return self._serialized
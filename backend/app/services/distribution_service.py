@@ -1,28 +1,28 @@
-import json
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
 from app.models.schemas import DistributionDefinition
+from app.services.definition_registry import DefinitionRegistry
+
+CONFIG_PATH = Path("/app/config/distributions")
+
+# 標準分布 → カスタム分布の順に読み込む（プロセス内で共有）
+distribution_registry = DefinitionRegistry(
+    [CONFIG_PATH / "distributions.json", CONFIG_PATH / "custom_distributions.json"],
+    DistributionDefinition,
+)
 
 class DistributionService:
     def __init__(self):
-        self.config_path = Path("/app/config/distributions")
+        self.registry = distribution_registry
 
     def get_all_distributions(self) -> List[DistributionDefinition]:
         """全ての分布定義を取得"""
-        distributions = []
-
-        # 標準分布を読み込み
-        standard_file = self.config_path / "distributions.json"
-        if standard_file.exists():
-            with open(standard_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                distributions.extend([DistributionDefinition(**d) for d in data])
+        return self.registry.get_all()
 
-        # カスタム分布を読み込み
-        custom_file = self.config_path / "custom_distributions.json"
-        if custom_file.exists():
-            with open(custom_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                distributions.extend([DistributionDefinition(**d) for d in data])
+    def get_distribution(self, name: str) -> Optional[DistributionDefinition]:
+        """分布名から定義を取得"""
+        return self.registry.get(name)
 
-        return distributions
+    def get_serialized(self) -> Tuple[bytes, str]:
+        """シリアライズ済みの分布一覧とETagを取得"""
+        return self.registry.get_serialized()
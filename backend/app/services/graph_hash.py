@@ -0,0 +1,84 @@
+import hashlib
+import json
+from typing import Dict
+import numpy as np
+
+# ハッシュに含めるノードの属性（位置やGUI表示名は構造に影響しないので除外）
+_NODE_FIELDS = (
+    "node_type",
+    "code_name",
+    "shape",
+    "distribution",
+    "parameters",
+    "operation",
+    "constant_value",
+)
+
+def canonical_graph(nodes: Dict[str, dict], edges: Dict[str, dict]) -> dict:
+    """ノードID・エッジIDに依存しないグラフの正規形
+
+    ノードはcode_nameで識別するため、同じ構造のグラフを別々に作成しても
+    同じ正規形になる。
+    """
+    names = {node_id: node["code_name"] for node_id, node in nodes.items()}
+    canonical_nodes = sorted(
+        ({field: node.get(field) for field in _NODE_FIELDS} for node in nodes.values()),
+        key=lambda n: n["code_name"],
+    )
+    canonical_edges = sorted(
+        (
+            names.get(edge["source"], edge["source"]),
+            edge.get("source_handle") or "",
+            names.get(edge["target"], edge["target"]),
+            edge.get("target_handle") or "",
+        )
+        for edge in edges.values()
+    )
+    return {"nodes": canonical_nodes, "edges": canonical_edges}
+
+def compute_graph_hash(nodes: Dict[str, dict], edges: Dict[str, dict]) -> str:
+    """グラフ構造のハッシュ（コンパイル済みモデルのキャッシュキー）"""
+    payload = json.dumps(
+        canonical_graph(nodes, edges), sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def compute_structure_hash(nodes: Dict[str, dict], edges: Dict[str, dict]) -> str:
+    """パラメータの値（事前分布の定数・定数ノードの値）を除いたグラフ構造のハッシュ
+
+    値だけを変えたグラフは同じハッシュになる（サンプラーの調整結果の再利用に使う）。
+    """
+    graph = canonical_graph(nodes, edges)
+    for node in graph["nodes"]:
+        node["parameters"] = sorted(node["parameters"] or {})
+        node["constant_value"] = None
+    payload = json.dumps(graph, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def compute_data_hash(nodes: Dict[str, dict]) -> str:
+    """ノードに対応付けられたデータのハッシュ
+
+    アップロード済みデータはdata_idごとに不変なので、data_idと列の対応だけで
+    データの同一性を判定できる。
+    """
+    mappings = sorted(
+        json.dumps([node["code_name"], node.get("csv_mapping") or {}], sort_keys=True, ensure_ascii=False)
+        for node in nodes.values()
+        if node["node_type"] in ("data", "observed")
+    )
+    payload = "\n".join(mappings)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def compute_data_layout(nodes: Dict[str, dict], data: Dict[str, np.ndarray]) -> str:
+    """ノードに対応付けられたデータの列数と型の種類（整数・実数など）のハッシュ
+
+    列数は "<code_name>_dim_<i>" の固定の座標、型はpm.Dataの型としてモデルに
+    埋め込まれ、pm.set_dataでは変えられないので、コンパイル済みモデルのキャッシュキーに含める。
+    行数と値は含めない。
+    """
+    layout = sorted(
+        [nodes[node_id]["code_name"], list(np.shape(values)[1:]), np.asarray(values).dtype.kind]
+        for node_id, values in data.items()
+    )
+    payload = json.dumps(layout, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
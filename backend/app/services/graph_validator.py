@@ -0,0 +1,468 @@
+from collections import deque
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+from app.services.distribution_service import distribution_registry
+from app.services.model_builder import OBSERVATION_DIM, GraphError, parse_shape
+from app.services.operation_service import operation_registry
+
+# ワーカーに投入する前にグラフを静的に検査する（PyMC/PyTensorは使わない）。
+# build_pymc_modelと同じ規則で形状を推定し、接続・パラメータ・ブロードキャストの
+# 誤りをノードごとに記録する。全体の計算量は O(V+E)。
+#
+# 形状は次元のタプルで、各次元は整数・"n_observations"・プレート名のいずれか。
+# 推定できない形状はNone（以降のノードの検査は行わない）。
+
+Dim = Union[int, str]
+Shape = Optional[Tuple[Dim, ...]]
+
+# 入力を受け付けないノード
+_SOURCE_NODE_TYPES = ("data", "constant")
+_DISTRIBUTION_NODE_TYPES = ("latent", "hyperparameter", "observed")
+_NODE_TYPES = _SOURCE_NODE_TYPES + _DISTRIBUTION_NODE_TYPES + ("operation",)
+
+class ShapeError(ValueError):
+    """形状が組み合わせられない場合のエラー"""
+
+def issue(code: str, message: str, node_id: str = None, edge_id: str = None, severity: str = "error") -> dict:
+    return {"severity": severity, "code": code, "message": message, "node_id": node_id, "edge_id": edge_id}
+
+def format_shape(shape: Shape) -> Optional[str]:
+    """("n_observations", 3) → "(n_observations, 3)"（parse_shapeの逆）"""
+    if shape is None:
+        return None
+    if len(shape) == 1:
+        return f"({shape[0]},)"
+    return "(" + ", ".join(str(d) for d in shape) + ")"
+
+def broadcast_shapes(*shapes: Tuple[Dim, ...]) -> Tuple[Dim, ...]:
+    """NumPyと同じ規則のブロードキャスト（名前付きの次元は同じ名前か1とだけ合う）"""
+    ndim = max((len(s) for s in shapes), default=0)
+    result = []
+    for axis in range(-ndim, 0):
+        dims = {s[axis] for s in shapes if len(s) >= -axis} - {1}
+        if len(dims) > 1:
+            raise ShapeError(f"Shapes {', '.join(format_shape(s) for s in shapes)} cannot be broadcast")
+        result.append(dims.pop() if dims else 1)
+    return tuple(result)
+
+def matmul_shape(left: Tuple[Dim, ...], right: Tuple[Dim, ...]) -> Shape:
+    """pm.math.dot の結果の形状（1次元・2次元のみ推定）"""
+    if not left or not right or len(left) > 2 or len(right) > 2:
+        return None
+    inner_left = left[-1]
+    inner_right = right[0] if len(right) == 1 else right[-2]
+    if inner_left != inner_right:
+        raise ShapeError(f"Inner dimensions of {format_shape(left)} and {format_shape(right)} do not match")
+    return left[:-1] + right[1:] if len(right) == 2 else left[:-1]
+
+def align(shape: Shape, target: Shape, plates: Dict[str, str]) -> Shape:
+    """グループ次元の値を行単位のノードに接続した場合の展開（alpha[group_idx]）"""
+    if shape and target and shape[0] in plates and target[0] == OBSERVATION_DIM:
+        return (OBSERVATION_DIM,) + shape[1:]
+    return shape
+
+def find_cycle(remaining: Set[str], parents: Dict[str, List[str]]) -> List[str]:
+    """トポロジカルソートで残ったノードから循環を1つ取り出す
+
+    残ったノードは必ず残ったノードを親に持つので、親をたどれば循環に入る。
+    """
+    start = min(remaining)
+    path, seen = [], {}
+    node_id = start
+    while node_id not in seen:
+        seen[node_id] = len(path)
+        path.append(node_id)
+        node_id = next(p for p in parents[node_id] if p in remaining)
+    cycle = path[seen[node_id]:]
+    cycle.reverse()
+    return cycle
+
+class GraphValidator:
+    """グラフを検査し、ノードごとの結果（形状・問題点）をキャッシュとして返す
+
+    cacheに前回の結果、dirtyに変更のあったノードIDを渡すと、変更されたノードと
+    その子孫だけを検査し直す（循環・名前の重複などグラフ全体の検査は毎回行う）。
+    describe_mappingはcsv_mappingから {"n_rows", "n_columns", "categorical",
+    "n_categories", "null_count"} を返す関数で、不正な対応付けにはValueErrorを送出する。
+    """
+
+    def __init__(
+        self,
+        nodes: Dict[str, dict],
+        edges: Dict[str, dict],
+        describe_mapping: Callable[[Dict[str, str]], dict],
+    ):
+        self.nodes = nodes
+        self.edges = edges
+        self.describe_mapping = describe_mapping
+
+    def run(self, cache: Optional[dict] = None, dirty: Optional[Set[str]] = None) -> Tuple[dict, List[dict], int]:
+        """(新しいキャッシュ, 問題点の一覧, 検査し直したノード数) を返す"""
+        nodes, edges = self.nodes, self.edges
+        issues: List[dict] = []
+        cached_nodes = (cache or {}).get("nodes", {})
+        if cache is None or dirty is None:
+            dirty = set(nodes)
+        else:
+            dirty = (set(dirty) & set(nodes)) | (set(nodes) - set(cached_nodes))
+
+        # 接続（存在しないノードを指すエッジは以降の検査から外す）
+        parents: Dict[str, List[str]] = {node_id: [] for node_id in nodes}
+        children: Dict[str, List[str]] = {node_id: [] for node_id in nodes}
+        incoming: Dict[str, List[dict]] = {node_id: [] for node_id in nodes}
+        for edge_id, edge in edges.items():
+            if edge["source"] not in nodes or edge["target"] not in nodes:
+                issues.append(issue("missing_node", "Edge references a missing node", edge_id=edge_id))
+                continue
+            parents[edge["target"]].append(edge["source"])
+            children[edge["source"]].append(edge["target"])
+            incoming[edge["target"]].append(edge)
+
+        # 変更されたノードの子孫は形状が変わりうるので検査し直す
+        queue = deque(dirty)
+        while queue:
+            for child in children[queue.popleft()]:
+                if child not in dirty:
+                    dirty.add(child)
+                    queue.append(child)
+
+        # トポロジカルソート（Kahn法）と循環の検出
+        indegree = {node_id: len(parents[node_id]) for node_id in nodes}
+        queue = deque(sorted(n for n, d in indegree.items() if d == 0))
+        order = []
+        while queue:
+            node_id = queue.popleft()
+            order.append(node_id)
+            for child in children[node_id]:
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    queue.append(child)
+        remaining = {n for n, d in indegree.items() if d > 0}
+        if remaining:
+            cycle = find_cycle(remaining, parents)
+            names = [nodes[n]["code_name"] for n in cycle]
+            issues.append(issue(
+                "cycle",
+                f"Graph contains a cycle: {' -> '.join(names + names[:1])}",
+                node_id=cycle[0],
+            ))
+
+        # 名前の重複（PyMCの変数名になる）
+        owners: Dict[str, str] = {}
+        for node_id in sorted(nodes):
+            node = nodes[node_id]
+            names = [node["code_name"]]
+            if node["node_type"] == "observed":
+                names.append(f"{node['code_name']}_observed")
+            for name in names:
+                if name in owners:
+                    issues.append(issue(
+                        "duplicate_name", f"Name '{name}' is used by more than one node", node_id=node_id
+                    ))
+                else:
+                    owners[name] = node_id
+
+        # データの対応付けを先に調べる（プレートがどのノードかで形状の解釈が変わる）
+        states: Dict[str, dict] = {}
+        for node_id, node in nodes.items():
+            if node_id in dirty:
+                states[node_id] = {"mapping": self._describe(node), "shape": None, "issues": []}
+            else:
+                states[node_id] = dict(cached_nodes[node_id])
+        plates = {
+            nodes[n]["code_name"]: n
+            for n, state in states.items()
+            if nodes[n]["node_type"] == "data" and (state["mapping"] or {}).get("categorical")
+        }
+        if cache is not None and sorted(plates) != cache.get("plates"):
+            for node_id in set(nodes) - dirty:
+                states[node_id] = {"mapping": cached_nodes[node_id]["mapping"], "shape": None, "issues": []}
+            dirty = set(nodes)
+
+        checked = 0
+        shapes: Dict[str, Shape] = {
+            n: (tuple(s["shape"]) if s["shape"] is not None else None) for n, s in states.items()
+        }
+        for node_id in order:
+            if node_id not in dirty:
+                continue
+            checked += 1
+            shape, node_issues = self._check_node(node_id, incoming[node_id], shapes, states, plates)
+            shapes[node_id] = shape
+            states[node_id]["shape"] = list(shape) if shape is not None else None
+            states[node_id]["issues"] = node_issues
+        for node_id in remaining:
+            if node_id in dirty:
+                checked += 1
+                states[node_id]["shape"] = None
+                states[node_id]["issues"] = []
+
+        # データ間の整合性（行数はn_observationsとして1つに決まる必要がある）
+        rows = {}
+        for node_id, state in states.items():
+            if state["mapping"] and state["mapping"].get("n_rows") is not None:
+                rows.setdefault(state["mapping"]["n_rows"], node_id)
+        if len(rows) > 1:
+            issues.append(issue(
+                "row_mismatch",
+                f"Mapped columns have different lengths: {sorted(rows)}",
+                node_id=rows[max(rows)],
+            ))
+        if nodes and not any(n["node_type"] == "observed" for n in nodes.values()):
+            issues.append(issue("no_observed", "Model has no observed node", severity="warning"))
+
+        for node_id in order + sorted(remaining):
+            issues.extend(states[node_id]["issues"])
+        new_cache = {"plates": sorted(plates), "nodes": states}
+        return new_cache, issues, checked
+
+    def _describe(self, node: dict) -> Optional[dict]:
+        if node["node_type"] not in ("data", "observed"):
+            return None
+        if not node.get("csv_mapping"):
+            return {"error": "No data column is mapped"}
+        try:
+            return self.describe_mapping(node["csv_mapping"])
+        except ValueError as e:
+            return {"error": str(e)}
+
+    def _declared(self, node_id: str, plates: Dict[str, str], node_issues: List[dict]) -> Shape:
+        """shape文字列を解釈（未指定は None ではなく空タプルで返す）"""
+        node = self.nodes[node_id]
+        try:
+            dims = parse_shape(node.get("shape"))
+        except GraphError as e:
+            node_issues.append(issue("invalid_shape", str(e), node_id=node_id))
+            return None
+        unknown = [d for d in dims if isinstance(d, str) and d != OBSERVATION_DIM and d not in plates]
+        if unknown:
+            node_issues.append(issue(
+                "unknown_dimension",
+                f"Unknown dimension {unknown} (use n_observations, an integer or a categorical data node)",
+                node_id=node_id,
+            ))
+            return None
+        return dims
+
+    def _check_node(
+        self,
+        node_id: str,
+        incoming: List[dict],
+        shapes: Dict[str, Shape],
+        states: Dict[str, dict],
+        plates: Dict[str, str],
+    ) -> Tuple[Shape, List[dict]]:
+        node = self.nodes[node_id]
+        node_type = node["node_type"]
+        node_issues: List[dict] = []
+
+        if node_type not in _NODE_TYPES:
+            node_issues.append(issue("unknown_node_type", f"Unknown node type '{node_type}'", node_id=node_id))
+            return None, node_issues
+        if node_type in _SOURCE_NODE_TYPES:
+            for edge in incoming:
+                node_issues.append(issue(
+                    "unexpected_input", f"{node_type} node does not accept inputs",
+                    node_id=node_id, edge_id=edge["edge_id"],
+                ))
+
+        if node_type == "constant":
+            value = node.get("constant_value")
+            if value is None:
+                node_issues.append(issue("missing_value", "Constant has no value", node_id=node_id))
+                return None, node_issues
+            return ((len(value),) if isinstance(value, list) else ()), node_issues
+
+        if node_type == "data":
+            return self._data_shape(node_id, states[node_id]["mapping"], plates, node_issues), node_issues
+
+        # 入力のハンドルの対応（1つのハンドルにつき1本）
+        connected: Dict[str, str] = {}
+        if node_type == "operation":
+            definition = operation_registry.get(node.get("operation"))
+            if definition is None:
+                node_issues.append(issue(
+                    "unknown_operation", f"Unknown operation '{node.get('operation')}'", node_id=node_id
+                ))
+                return None, node_issues
+            handles = [h.id for h in definition.handles]
+        else:
+            definition = distribution_registry.get(node.get("distribution"))
+            if definition is None:
+                node_issues.append(issue(
+                    "unknown_distribution", f"Unknown distribution '{node.get('distribution')}'", node_id=node_id
+                ))
+                return None, node_issues
+            handles = [p.handle_id for p in definition.parameters]
+
+        for edge in incoming:
+            handle = edge.get("target_handle")
+            if handle not in handles:
+                node_issues.append(issue(
+                    "unknown_handle", f"Input '{handle}' does not exist (expected one of {handles})",
+                    node_id=node_id, edge_id=edge["edge_id"],
+                ))
+            elif handle in connected:
+                node_issues.append(issue(
+                    "duplicate_input", f"More than one edge is connected to '{handle}'",
+                    node_id=node_id, edge_id=edge["edge_id"],
+                ))
+            else:
+                connected[handle] = edge["source"]
+
+        if node_type == "operation":
+            return self._operation_shape(node_id, definition, connected, shapes, plates, node_issues), node_issues
+        return self._distribution_shape(
+            node_id, definition, connected, shapes, states, plates, node_issues
+        ), node_issues
+
+    def _data_shape(
+        self, node_id: str, mapping: Optional[dict], plates: Dict[str, str], node_issues: List[dict]
+    ) -> Shape:
+        """データ・観測値の形状（n_observations[, 列数]）と、宣言された形状との整合性"""
+        if mapping is None or mapping.get("error"):
+            node_issues.append(issue(
+                "data_mapping", (mapping or {}).get("error", "No data column is mapped"), node_id=node_id
+            ))
+            return None
+        if mapping.get("categorical") and mapping.get("null_count"):
+            node_issues.append(issue(
+                "missing_values",
+                "Categorical column used as a group index has missing values",
+                node_id=node_id,
+            ))
+
+        mapped = (OBSERVATION_DIM,) if mapping["n_columns"] == 1 else (OBSERVATION_DIM, mapping["n_columns"])
+        declared = self._declared(node_id, plates, node_issues)
+        if declared is None:
+            return None
+        if not declared:
+            return mapped
+        if (
+            len(declared) != len(mapped)
+            or declared[0] != OBSERVATION_DIM
+            or (len(mapped) == 2 and declared[1] != mapped[1])
+        ):
+            node_issues.append(issue(
+                "shape_mismatch",
+                f"Declared shape {format_shape(declared)} does not match mapped data {format_shape(mapped)}",
+                node_id=node_id,
+            ))
+            return None
+        return declared
+
+    def _operation_shape(
+        self,
+        node_id: str,
+        definition,
+        connected: Dict[str, str],
+        shapes: Dict[str, Shape],
+        plates: Dict[str, str],
+        node_issues: List[dict],
+    ) -> Shape:
+        missing = [h.label for h in definition.handles if h.id not in connected]
+        if missing:
+            node_issues.append(issue(
+                "missing_operand",
+                f"Operation '{definition.name}' needs {len(definition.handles)} operands; not connected: {missing}",
+                node_id=node_id,
+            ))
+            return None
+
+        declared = self._declared(node_id, plates, node_issues)
+        operand_shapes = [shapes[connected[h.id]] for h in definition.handles]
+        if declared is None or any(s is None for s in operand_shapes):
+            return declared or None
+
+        target = declared
+        if not target:
+            # build_pymc_modelと同じく、行単位の被演算子があれば結果も行単位にする
+            leads = [s[0] for s in operand_shapes if s]
+            if OBSERVATION_DIM in leads:
+                target = (OBSERVATION_DIM,)
+            else:
+                target = next(((lead,) for lead in leads if lead in plates), ())
+        aligned = [align(s, target, plates) for s in operand_shapes]
+
+        try:
+            if definition.pymc_function in ("pm.math.dot", "pt.dot"):
+                result = matmul_shape(*aligned)
+            elif definition.broadcasting:
+                result = broadcast_shapes(*aligned)
+            elif len(aligned) == 1:
+                result = aligned[0]
+            else:
+                result = None
+        except ShapeError as e:
+            node_issues.append(issue("shape_mismatch", str(e), node_id=node_id))
+            return None
+
+        if declared and result is not None and result != declared:
+            node_issues.append(issue(
+                "shape_mismatch",
+                f"Declared shape {format_shape(declared)} does not match inferred {format_shape(result)}",
+                node_id=node_id,
+            ))
+            return None
+        return declared or result
+
+    def _distribution_shape(
+        self,
+        node_id: str,
+        definition,
+        connected: Dict[str, str],
+        shapes: Dict[str, Shape],
+        states: Dict[str, dict],
+        plates: Dict[str, str],
+        node_issues: List[dict],
+    ) -> Shape:
+        node = self.nodes[node_id]
+        constants = node.get("parameters") or {}
+        param_shapes: Dict[str, Shape] = {}
+        for param in definition.parameters:
+            if param.handle_id in connected:
+                param_shapes[param.name] = shapes[connected[param.handle_id]]
+            elif constants.get(param.name) is not None:
+                value = constants[param.name]
+                param_shapes[param.name] = (len(value),) if isinstance(value, list) else ()
+            elif param.default is None and param.required:
+                node_issues.append(issue(
+                    "missing_parameter", f"Parameter '{param.name}' is not set", node_id=node_id
+                ))
+
+        if node["node_type"] == "observed":
+            shape = self._data_shape(node_id, states[node_id]["mapping"], plates, node_issues)
+        else:
+            shape = self._declared(node_id, plates, node_issues)
+        if shape is None or definition.multivariate:
+            return None if definition.multivariate else shape
+
+        known = {name: s for name, s in param_shapes.items() if s is not None}
+        if not shape and node["node_type"] != "observed":
+            # 形状を宣言していない場合はパラメータの形状から決まる
+            try:
+                implicit = broadcast_shapes(*known.values()) if known else ()
+            except ShapeError as e:
+                node_issues.append(issue("shape_mismatch", str(e), node_id=node_id))
+                return None
+            if implicit:
+                node_issues.append(issue(
+                    "implicit_shape",
+                    f"Shape {format_shape(implicit)} is inferred from parameters; declare it to name the dimensions",
+                    node_id=node_id,
+                    severity="warning",
+                ))
+            return implicit if len(known) == len(param_shapes) else None
+
+        for name, param_shape in known.items():
+            aligned = align(param_shape, shape, plates)
+            try:
+                fits = broadcast_shapes(aligned, shape) == shape
+            except ShapeError:
+                fits = False
+            if not fits:
+                node_issues.append(issue(
+                    "shape_mismatch",
+                    f"Parameter '{name}' with shape {format_shape(aligned)} does not fit {format_shape(shape)}",
+                    node_id=node_id,
+                ))
+        return shape
@@ -0,0 +1,439 @@
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+from celery import chord
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from app.celery_app import celery_app
+from app.config import settings
+from app.models.schemas import (
+    PosteriorPredictiveConfig,
+    PriorPredictiveConfig,
+    SampleConfig,
+    SegmentBatchConfig,
+    TaskResponse,
+    TaskStatus,
+)
+from app.services.data_service import DataService
+from app.services.graph_hash import compute_data_hash, compute_graph_hash
+from app.services.model_builder import GraphError
+from app.services.progress import TERMINAL_PHASES, get_events_channel
+from app.services.queue_service import QueueService
+from app.services.queues import (
+    BATCH_QUEUE,
+    INTERACTIVE_QUEUE,
+    estimate_cost,
+    queue_options,
+    route_sample,
+)
+from app.services.segments import segment_names
+from app.services.tasks import (
+    build_model_task,
+    posterior_predictive_task,
+    prior_predictive_task,
+    run_prior_predictive_fast,
+    sample_chord,
+    sample_task,
+    segment_chord,
+)
+from app.services.validation_service import ValidationService
+from app.utils.metrics import metrics
+from app.utils.redis_client import async_redis_client
+
+# Celeryの状態 → APIのステータス
+_STATUS_MAP = {
+    "PENDING": "pending",
+    "RECEIVED": "pending",
+    "STARTED": "running",
+    "PROGRESS": "running",
+    "RETRY": "running",
+    "SUCCESS": "completed",
+    "FAILURE": "failed",
+    "REVOKED": "failed",
+}
+
+class InferenceService:
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+
+    def _get_task_key(self, task_id: str) -> str:
+        return f"sessions:{self.session_id}:tasks:{task_id}"
+
+    def _get_memo_key(self, request_key: str) -> str:
+        return f"sessions:{self.session_id}:memo:{request_key}"
+
+    async def _submit(
+        self,
+        signature,
+        kind: str,
+        model_id: str,
+        task_id: str = None,
+        queue: str = BATCH_QUEUE,
+        cost: Optional[dict] = None,
+    ) -> str:
+        """セッションの同時実行数の上限を確かめてからキューに投入する（上限なら429）
+
+        chordはサブタスク・結合タスクともにtask_routesの既定のキュー（batch）に入る。
+        """
+        task_id = task_id or str(uuid.uuid4())
+        queues = QueueService(self.session_id)
+        await queues.admit(queue, task_id)
+        if not isinstance(signature, chord):
+            signature.set(**queue_options(queue))
+        try:
+            # Celeryへの投入は同期I/Oなのでスレッドプールで行う
+            await run_in_threadpool(lambda: signature.apply_async(task_id=task_id))
+        except Exception:
+            await queues.release(queue, task_id)
+            raise
+
+        # セッションとタスクの対応を記録（他セッションからの参照を防ぐ）
+        await async_redis_client.set_json(
+            self._get_task_key(task_id),
+            {
+                "task_id": task_id,
+                "kind": kind,
+                "model_id": model_id,
+                "queue": queue,
+                "cost": cost,
+                "created_at": datetime.now().isoformat(),
+            },
+            ex=86400,
+        )
+        return task_id
+
+    async def submit_build(self, model_id: str) -> TaskResponse:
+        """モデル構築タスクを投入"""
+        await ValidationService(self.session_id).ensure_valid(model_id)
+        task_id = await self._submit(
+            build_model_task.s(model_id, self.session_id), "build", model_id, queue=INTERACTIVE_QUEUE
+        )
+        return TaskResponse(
+            task_id=task_id, status="pending", message="モデル構築タスクを開始しました", queue=INTERACTIVE_QUEUE
+        )
+
+    def _compute_request_key(
+        self, kind: str, nodes: Dict[str, dict], edges: Dict[str, dict], config: dict
+    ) -> str:
+        """グラフ・データ・設定（シードを含む）から推論リクエストのキーを求める"""
+        payload = json.dumps(
+            {
+                "kind": kind,
+                "graph": compute_graph_hash(nodes, edges),
+                "data": compute_data_hash(nodes),
+                "config": config,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _result_exists(self, result_id: str) -> bool:
+        # meta.jsonはトレースを書き終えてから作られる
+        result_dir = Path(settings.STORAGE_PATH) / self.session_id / "results" / result_id
+        return (result_dir / "meta.json").exists()
+
+    async def _complete_inline(
+        self, task_id: str, kind: str, model_id: str, memo_key: str, result: dict
+    ):
+        """APIプロセス内で実行し終えた処理を、完了したタスクとして記録する"""
+        await async_redis_client.set_json(
+            self._get_task_key(task_id),
+            {
+                "task_id": task_id,
+                "kind": kind,
+                "model_id": model_id,
+                "created_at": datetime.now().isoformat(),
+                "status": "completed",
+                "result": result,
+            },
+            ex=86400,
+        )
+        await async_redis_client.set_json(
+            memo_key,
+            {"status": "completed", "task_id": task_id, "result_id": result["result_id"]},
+            ex=86400,
+        )
+
+    async def _submit_memoized(
+        self,
+        make_signature,
+        kind: str,
+        model_id: str,
+        config: dict,
+        message: str,
+        run_inline=None,
+        route=None,
+    ) -> TaskResponse:
+        """同一条件の結果があれば返し、実行中なら合流し、なければ投入する
+
+        make_signature(task_id, memo_key)は投入するCeleryのシグネチャを返す。
+        シード未指定の場合は実行中のタスクへの合流だけを行い、
+        完了済みの結果は再利用しない（毎回異なる乱数で実行するため）。
+        run_inline(nodes, edges)を渡した場合はまずAPIプロセス内で実行し、
+        Noneが返ったとき（対応していないグラフ）だけCeleryに投入する。
+        route(nodes)は (キュー, 推定コスト) を返す（省略時はbatch）。
+        """
+        # グラフに誤りがあればワーカーに投入せずに拒否する
+        nodes, edges = await ValidationService(self.session_id).ensure_valid(model_id)
+        memo_key = self._get_memo_key(self._compute_request_key(kind, nodes, edges, config))
+
+        for _ in range(2):
+            memo = await async_redis_client.get_json(memo_key)
+            if memo is not None:
+                if memo["status"] == "completed":
+                    if config.get("random_seed") is not None and self._result_exists(memo["result_id"]):
+                        metrics.inc("cache_requests_total", cache="result_memo", outcome="hit")
+                        return TaskResponse(
+                            task_id=memo["task_id"],
+                            status="completed",
+                            message="同一条件の結果を再利用しました",
+                            result_id=memo["result_id"],
+                        )
+                else:
+                    state = await run_in_threadpool(
+                        lambda: celery_app.AsyncResult(memo["task_id"]).state
+                    )
+                    if _STATUS_MAP.get(state) in ("pending", "running"):
+                        metrics.inc("cache_requests_total", cache="result_memo", outcome="joined")
+                        return TaskResponse(
+                            task_id=memo["task_id"],
+                            status=_STATUS_MAP[state],
+                            message="同一条件の実行中タスクに合流しました",
+                        )
+                await async_redis_client.delete(memo_key)
+
+            # 実行中の印を先に確保し、同時に投入された重複リクエストを防ぐ
+            task_id = str(uuid.uuid4())
+            claimed = await async_redis_client.client.set(
+                memo_key,
+                json.dumps({"status": "running", "task_id": task_id}),
+                nx=True,
+                ex=3600,
+            )
+            if claimed:
+                metrics.inc("cache_requests_total", cache="result_memo", outcome="miss")
+                if run_inline is not None:
+                    try:
+                        result = await run_in_threadpool(run_inline, nodes, edges)
+                    except Exception:
+                        await async_redis_client.delete(memo_key)
+                        raise
+                    if result is not None:
+                        await self._complete_inline(task_id, kind, model_id, memo_key, result)
+                        return TaskResponse(
+                            task_id=task_id,
+                            status="completed",
+                            message="事前予測を実行しました",
+                            result_id=result["result_id"],
+                        )
+                queue, cost = await route(nodes) if route is not None else (BATCH_QUEUE, None)
+                try:
+                    await self._submit(make_signature(task_id, memo_key), kind, model_id, task_id, queue, cost)
+                except Exception:
+                    await async_redis_client.delete(memo_key)
+                    raise
+                return TaskResponse(task_id=task_id, status="pending", message=message, queue=queue)
+
+        raise HTTPException(status_code=409, detail="Conflicting inference request, please retry")
+
+    async def submit_sample(self, model_id: str, config: SampleConfig) -> TaskResponse:
+        """サンプリングタスクを投入
+
+        chains_per_taskが指定されていれば、チェーンを複数のワーカーに分散する
+        （pymcのみ。外部のサンプラーはチェーンを1つのタスク内でまとめて進める）。
+        """
+        dumped = config.model_dump()
+        parallel = (
+            config.sampler == "NUTS"
+            and config.backend == "pymc"
+            and config.chains_per_task is not None
+            and config.chains > config.chains_per_task
+        )
+
+        def make_signature(task_id: str, memo_key: str):
+            if parallel:
+                return sample_chord(model_id, self.session_id, dumped, task_id, memo_key)
+            return sample_task.s(model_id, self.session_id, dumped, memo_key=memo_key)
+
+        async def route(nodes):
+            # 推定コストの小さなサンプリングは長い推論の後ろで待たせない
+            cost = await run_in_threadpool(
+                estimate_cost, nodes, dumped, DataService(self.session_id).describe_mapping
+            )
+            if parallel:
+                return BATCH_QUEUE, cost
+            return route_sample(cost["cost"]), cost
+
+        return await self._submit_memoized(
+            make_signature,
+            "sample",
+            model_id,
+            dumped,
+            "サンプリングタスクを開始しました",
+            route=route,
+        )
+
+    async def submit_segment_batch(self, model_id: str, config: SegmentBatchConfig) -> TaskResponse:
+        """セグメントごとの一括実行を投入
+
+        セグメントはmax_concurrency個のサブタスクに振り分け、各サブタスクは
+        同じコンパイル済みモデルのデータを差し替えながら順に当てはめる。
+        """
+        nodes, _ = await ValidationService(self.session_id).ensure_valid(model_id)
+        for data_id in config.data_ids or []:
+            # 存在しないデータがあれば404
+            await DataService(self.session_id).get_info(data_id)
+        dumped = config.model_dump()
+        try:
+            names = await run_in_threadpool(segment_names, self.session_id, nodes, dumped)
+        except GraphError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if not names:
+            raise HTTPException(status_code=400, detail="No segments to fit")
+
+        return await self._submit_memoized(
+            lambda task_id, memo_key: segment_chord(
+                model_id, self.session_id, dumped, len(names), task_id, memo_key
+            ),
+            "segment_batch",
+            model_id,
+            dumped,
+            f"{len(names)}セグメントの一括実行を開始しました",
+        )
+
+    async def submit_prior_predictive(
+        self, model_id: str, config: PriorPredictiveConfig
+    ) -> TaskResponse:
+        """事前予測を実行
+
+        標準の分布・演算だけのグラフはコンパイルせずにAPIプロセス内で
+        祖先サンプリングし、完了した状態で返す。それ以外はタスクを投入する。
+        """
+        dumped = config.model_dump()
+        return await self._submit_memoized(
+            lambda task_id, memo_key: prior_predictive_task.s(
+                model_id, self.session_id, dumped, memo_key=memo_key
+            ),
+            "prior_predictive",
+            model_id,
+            dumped,
+            "事前予測タスクを開始しました",
+            run_inline=lambda nodes, edges: run_prior_predictive_fast(
+                self.session_id, model_id, nodes, edges, dumped
+            ),
+            route=_interactive_route,
+        )
+
+    async def submit_posterior_predictive(
+        self, model_id: str, config: PosteriorPredictiveConfig
+    ) -> TaskResponse:
+        """事後予測タスクを投入"""
+        if not self._result_exists(config.result_id):
+            raise HTTPException(status_code=404, detail="Result not found")
+        if config.data_id is not None:
+            # 予測するデータが存在しなければ404
+            await DataService(self.session_id).get_info(config.data_id)
+        dumped = config.model_dump()
+        return await self._submit_memoized(
+            lambda task_id, memo_key: posterior_predictive_task.s(
+                model_id, self.session_id, dumped, memo_key=memo_key
+            ),
+            "posterior_predictive",
+            model_id,
+            dumped,
+            "事後予測タスクを開始しました",
+        )
+
+    async def get_task_status(self, task_id: str) -> TaskStatus:
+        """タスクの状態を取得"""
+        record = await async_redis_client.get_json(self._get_task_key(task_id))
+        if record is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        if record.get("status") == "completed":
+            # APIプロセス内で実行済み（Celeryを経由していない）
+            return TaskStatus(task_id=task_id, status="completed", progress=100, result=record["result"])
+
+        async_result = celery_app.AsyncResult(task_id)
+        state, info = await run_in_threadpool(lambda: (async_result.state, async_result.info))
+
+        status = TaskStatus(task_id=task_id, status=_STATUS_MAP.get(state, "pending"))
+        if state == "SUCCESS":
+            status.progress = 100
+            status.result = info
+        elif state == "FAILURE":
+            status.message = str(info)
+        elif isinstance(info, dict):
+            status.progress = info.get("progress")
+            status.message = info.get("message")
+        else:
+            # チェーンを分散実行している場合は、サブタスクが記録した進捗を集計する
+            chains = await async_redis_client.client.hgetall(self._get_task_key(task_id) + ":chains")
+            if chains:
+                status.chains = {chain: int(p) for chain, p in chains.items()}
+                status.status = "running"
+                status.progress = sum(status.chains.values()) // len(status.chains)
+                status.message = f"サンプリング中... ({status.progress}%)"
+            # セグメントの一括実行は、終わったセグメントの割合を進捗とする
+            segments = await async_redis_client.client.hgetall(self._get_task_key(task_id) + ":segments")
+            if segments:
+                done = sum(s in ("completed", "failed") for s in segments.values())
+                status.segments = segments
+                status.status = "running"
+                status.progress = done * 100 // len(segments)
+                status.message = f"セグメント {done}/{len(segments)} 完了"
+        return status
+
+    async def stream_events(self, task_id: str):
+        """タスクの進捗をServer-Sent Eventsとして配信するジェネレータを返す
+
+        最初に現在の状態を送り、以降はワーカーがpub/subに配信したイベントを中継する。
+        タスクが終了したら（イベントが届かなくてもCeleryの状態で判定して）閉じる。
+        """
+        status = await self.get_task_status(task_id)
+
+        async def generate():
+            yield _format_event("status", status.model_dump())
+            if status.status in ("completed", "failed"):
+                return
+
+            pubsub = async_redis_client.pubsub()
+            await pubsub.subscribe(get_events_channel(self.session_id, task_id))
+            try:
+                last_check = last_sent = time.monotonic()
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    now = time.monotonic()
+                    if message is not None:
+                        event = json.loads(message["data"])
+                        yield _format_event("progress", event)
+                        last_sent = now
+                        if event.get("phase") in TERMINAL_PHASES:
+                            break
+                    elif now - last_check >= 5:
+                        # 完了イベントを取りこぼした場合や失敗時に備えて状態を確認
+                        last_check = now
+                        current = await self.get_task_status(task_id)
+                        if current.status in ("completed", "failed"):
+                            yield _format_event("status", current.model_dump())
+                            break
+                    if now - last_sent >= 15:
+                        # プロキシに切断されないようにコメント行を送る
+                        yield ": keepalive\n\n"
+                        last_sent = now
+                    await asyncio.sleep(0)
+            finally:
+                await pubsub.unsubscribe()
+                await pubsub.aclose()
+
+        return generate()
+
+async def _interactive_route(nodes):
+    return INTERACTIVE_QUEUE, None
+
+def _format_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List
+from celery.signals import before_task_publish, task_postrun, task_prerun, worker_process_shutdown
+from app.config import settings
+from app.services.model_cache import STATS_KEY
+from app.utils.metrics import METRICS_KEY, metrics, render
+from app.utils.redis_client import redis_client
+from app.utils.structured_log import CELERY_HEADER, correlation_id
+
+# メトリクスのRedisへの書き出しと/metricsの出力、Celeryのタスクの計測と相関IDの引き継ぎ。
+# APIは一定間隔（METRICS_FLUSH_INTERVAL）で、ワーカーはタスクの終了ごとに書き出す。
+
+logger = logging.getLogger(__name__)
+
+# 実行中のタスクの開始時刻と相関IDのトークン（task_id → (開始時刻, トークン)）
+_running: Dict[str, tuple] = {}
+
+def flush_metrics():
+    """このプロセスで溜めた増分をRedisに足し込む（失敗したら次回に再送）"""
+    pending = metrics.drain()
+    if not pending:
+        return
+    try:
+        with redis_client.client.pipeline(transaction=False) as pipe:
+            for key, value in pending.items():
+                pipe.hincrbyfloat(METRICS_KEY, key, value)
+            pipe.execute()
+    except Exception as e:
+        metrics.restore(pending)
+        logger.warning("Metrics flush error", extra={"fields": {"error": repr(e)}})
+
+async def run_metrics_flusher():
+    """APIプロセスで定期的にメトリクスを書き出す"""
+    from starlette.concurrency import run_in_threadpool
+
+    while True:
+        await asyncio.sleep(settings.METRICS_FLUSH_INTERVAL)
+        await run_in_threadpool(flush_metrics)
+
+def _cache_lines(values: Dict[str, float], model_stats: Dict[str, str]) -> List[str]:
+    """ワーカーのモデルキャッシュの件数と、キャッシュごとのヒット率"""
+    lines = [
+        "# HELP model_cache_events_total Compiled model cache events across workers",
+        "# TYPE model_cache_events_total counter",
+    ]
+    for event in ("hits", "misses", "evictions"):
+        lines.append(f'model_cache_events_total{{event="{event}"}} {int(model_stats.get(event, 0))}')
+
+    outcomes: Dict[str, Dict[str, float]] = {"model": {
+        "hit": float(model_stats.get("hits", 0)), "miss": float(model_stats.get("misses", 0)),
+    }}
+    for key, value in values.items():
+        if key.startswith('["cache_requests_total"'):
+            labels = json.loads(key)[1]
+            outcomes.setdefault(labels["cache"], {})[labels["outcome"]] = float(value)
+
+    lines += [
+        "# HELP cache_hit_ratio Hits / (hits + misses) by cache",
+        "# TYPE cache_hit_ratio gauge",
+    ]
+    for cache, counts in sorted(outcomes.items()):
+        total = counts.get("hit", 0) + counts.get("miss", 0)
+        if total:
+            lines.append(f'cache_hit_ratio{{cache="{cache}"}} {counts.get("hit", 0) / total:.6g}')
+    return lines
+
+def get_metrics_text() -> str:
+    """全プロセスの集計をPrometheusのテキスト形式で返す（このプロセスの分は先に書き出す）"""
+    flush_metrics()
+    values = redis_client.client.hgetall(METRICS_KEY)
+    model_stats = redis_client.client.hgetall(STATS_KEY)
+    return render(values, _cache_lines(values, model_stats))
+
+@before_task_publish.connect
+def _propagate_correlation_id(headers=None, **kwargs):
+    """投入するタスクのヘッダーに現在の相関ID（APIのリクエストまたは親タスク）を載せる"""
+    value = correlation_id.get()
+    if headers is not None and value and CELERY_HEADER not in headers:
+        headers[CELERY_HEADER] = value
+
+@task_prerun.connect
+def _start_task(task_id=None, task=None, **kwargs):
+    # ヘッダーがなければ、同じプロセスで実行中の呼び出し元（eager実行）の相関ID、それもなければtask_id
+    value = getattr(task.request, CELERY_HEADER, None) or (task.request.headers or {}).get(CELERY_HEADER)
+    token = correlation_id.set(value or correlation_id.get() or task_id)
+    _running[task_id] = (time.perf_counter(), token)
+    logger.info("Task started", extra={"fields": {"task": task.name, "task_id": task_id}})
+
+@task_postrun.connect
+def _finish_task(task_id=None, task=None, state=None, **kwargs):
+    start, token = _running.pop(task_id, (None, None))
+    if start is not None:
+        duration = time.perf_counter() - start
+        metrics.observe("celery_task_duration_seconds", duration, task=task.name, state=state or "UNKNOWN")
+        logger.info(
+            "Task finished",
+            extra={"fields": {
+                "task": task.name, "task_id": task_id, "state": state, "duration_seconds": round(duration, 3),
+            }},
+        )
+    if token is not None:
+        correlation_id.reset(token)
+    flush_metrics()
+
+@worker_process_shutdown.connect
+def _flush_on_shutdown(**kwargs):
+    flush_metrics()
@@ -0,0 +1,95 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from app.services.data_service import DataService
+from app.services.model_builder import GraphError
+
+# 列ごとのメモリマップ（columnar_store）から行の一部だけを読む。
+# ミニバッチADVIは無作為に選んだ行、事後予測は先頭から順に区切った行（チャンク）を使う。
+# どちらも全行をメモリに載せず、読んだ行のページだけを読み込む。
+
+def open_node_columns(session_id: str, nodes: Dict[str, dict]) -> Dict[str, List[np.ndarray]]:
+    """データノード・観測変数ノードのcsv_mappingが指す列をメモリマップで開く"""
+    service = DataService(session_id)
+    columns = {}
+    for node_id, node in nodes.items():
+        if node["node_type"] in ("data", "observed"):
+            if not node.get("csv_mapping"):
+                raise GraphError(f"Node {node['code_name']} has no csv_mapping")
+            columns[node_id] = service.open_mapped_columns(node["csv_mapping"])
+    return columns
+
+def open_prediction_columns(
+    session_id: str, nodes: Dict[str, dict], plates: Dict[str, List[str]], data_id: str
+) -> Tuple[Dict[str, List[np.ndarray]], Dict[str, np.ndarray]]:
+    """予測する新しいデータ（data_id）から、データノードが対応付けられた列と同じ名前の列を開く
+
+    返り値は (列, コードの変換表)。プレートのカテゴリ列は新しいデータでのコードを
+    学習時のカテゴリ値の並びでのコードに変換する（学習時にないカテゴリは-1）。
+    """
+    service = DataService(session_id)
+    columns, remaps = {}, {}
+    for node_id, node in nodes.items():
+        if node["node_type"] != "data":
+            continue
+        if not node.get("csv_mapping"):
+            raise GraphError(f"Node {node['code_name']} has no csv_mapping")
+        mapping = {**node["csv_mapping"], "data_id": data_id}
+        columns[node_id] = service.open_mapped_columns(mapping)
+        if node["code_name"] in plates:
+            categories = service.load_mapped_categories(mapping)
+            if categories is None:
+                raise GraphError(f"Column for plate {node['code_name']} is not categorical in {data_id}")
+            index = {c: i for i, c in enumerate(plates[node["code_name"]])}
+            remaps[node_id] = np.array([index.get(c, -1) for c in categories], dtype=np.int32)
+    return columns, remaps
+
+def row_count(columns: Dict[str, List[np.ndarray]]) -> int:
+    lengths = {len(c) for node_columns in columns.values() for c in node_columns}
+    if len(lengths) > 1:
+        raise GraphError(f"Mapped columns have different lengths: {sorted(lengths)}")
+    return lengths.pop() if lengths else 0
+
+def iter_row_chunks(
+    columns: Dict[str, List[np.ndarray]],
+    chunk_rows: int,
+    remaps: Optional[Dict[str, np.ndarray]] = None,
+) -> Iterator[Tuple[int, int, Dict[str, np.ndarray]]]:
+    """先頭から chunk_rows 行ずつ (開始行, 終了行, {ノードID: 値}) を返す"""
+    n_rows = row_count(columns)
+    for start in range(0, n_rows, chunk_rows):
+        end = min(start + chunk_rows, n_rows)
+        chunk = {}
+        for node_id, node_columns in columns.items():
+            values = [np.asarray(c[start:end]) for c in node_columns]
+            value = values[0] if len(values) == 1 else np.column_stack(values)
+            if remaps and node_id in remaps:
+                value = np.where(value >= 0, remaps[node_id][value], -1)
+                if (value < 0).any():
+                    raise GraphError(
+                        f"Rows {start}-{end} contain missing or unknown groups for the posterior"
+                    )
+            chunk[node_id] = value
+        yield start, end, chunk
+
+class MinibatchStream:
+    """全ノードで同じ行を無作為に（復元抽出で）選んだミニバッチを作る
+
+    選んだ行は昇順に並べてから読む（メモリマップの読み出しが前から順になる）。
+    """
+
+    def __init__(self, columns: Dict[str, List[np.ndarray]], batch_size: int, random_seed=None):
+        self.n_rows = row_count(columns)
+        if not self.n_rows:
+            raise GraphError("Minibatch VI requires mapped data")
+        self.columns = columns
+        self.batch_size = min(batch_size, self.n_rows)
+        self.rng = np.random.default_rng(random_seed)
+
+    def next(self) -> Dict[str, np.ndarray]:
+        """次のミニバッチ {ノードID: 値}（load_node_dataと同じ形状で行だけ少ない）"""
+        rows = np.sort(self.rng.integers(0, self.n_rows, size=self.batch_size))
+        batch = {}
+        for node_id, node_columns in self.columns.items():
+            values = [np.asarray(c[rows]) for c in node_columns]
+            batch[node_id] = values[0] if len(values) == 1 else np.column_stack(values)
+        return batch
@@ -0,0 +1,326 @@
+import re
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from app.services.data_service import DataService
+from app.services.distribution_service import distribution_registry
+from app.services.operation_service import operation_registry
+from app.utils.metrics import metrics
+from app.utils.redis_client import redis_client
+
+# 定義JSONの pymc_function のうち、pm.math に実体がないものの対応先
+_FUNCTION_ALIASES = {
+    "pm.math.add": "pt.add",
+    "pm.math.subtract": "pt.sub",
+    "pm.math.multiply": "pt.mul",
+    "pm.math.abs_": "pt.abs",
+}
+
+_SHAPE_TOKEN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+OBSERVATION_DIM = "n_observations"
+
+class GraphError(ValueError):
+    """モデルグラフが不正な場合のエラー"""
+
+def load_graph(session_id: str, model_id: str) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+    """Redisからノードとエッジを読み込む（ワーカー用）"""
+    prefix = f"sessions:{session_id}:models:{model_id}"
+    with metrics.timer("inference_phase_duration_seconds", phase="graph_load"):
+        nodes = redis_client.hgetall_json(f"{prefix}:nodes")
+        edges = redis_client.hgetall_json(f"{prefix}:edges")
+    return nodes, edges
+
+def topological_order(nodes: Dict[str, dict], edges: Dict[str, dict]) -> List[str]:
+    """親から子の順にノードIDを並べる（循環があればGraphError）"""
+    indegree = {node_id: 0 for node_id in nodes}
+    children: Dict[str, List[str]] = {node_id: [] for node_id in nodes}
+    for edge in edges.values():
+        if edge["source"] not in nodes or edge["target"] not in nodes:
+            raise GraphError(f"Edge {edge['edge_id']} references a missing node")
+        children[edge["source"]].append(edge["target"])
+        indegree[edge["target"]] += 1
+
+    queue = deque(sorted(n for n, d in indegree.items() if d == 0))
+    order = []
+    while queue:
+        node_id = queue.popleft()
+        order.append(node_id)
+        for child in children[node_id]:
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                queue.append(child)
+
+    if len(order) != len(nodes):
+        cyclic = sorted(nodes[n]["code_name"] for n, d in indegree.items() if d > 0)
+        raise GraphError(f"Graph contains a cycle: {cyclic}")
+    return order
+
+def resolve_pymc_attr(path: str):
+    """"pm.Normal" / "pm.math.exp" のようなパスを実体に解決（pm/pt配下のみ許可）"""
+    import pymc as pm
+    import pytensor.tensor as pt
+
+    path = _FUNCTION_ALIASES.get(path, path)
+    root, *attrs = path.split(".")
+    roots = {"pm": pm, "pt": pt}
+    if root not in roots or not attrs:
+        raise GraphError(f"Unsupported PyMC reference: {path}")
+
+    obj = roots[root]
+    for attr in attrs:
+        if attr.startswith("_") or not hasattr(obj, attr):
+            raise GraphError(f"Unsupported PyMC reference: {path}")
+        obj = getattr(obj, attr)
+    return obj
+
+def parse_shape(shape: str) -> Tuple[Any, ...]:
+    """形状文字列 "(n_observations, 3)" を ("n_observations", 3) に変換"""
+    if shape is None or not shape.strip():
+        return ()
+    body = shape.strip()
+    if body.startswith("(") and body.endswith(")"):
+        body = body[1:-1]
+
+    dims = []
+    for token in (t.strip() for t in body.split(",")):
+        if not token:
+            continue
+        if token.isdigit():
+            dims.append(int(token))
+        elif _SHAPE_TOKEN.match(token):
+            dims.append(token)
+        else:
+            raise GraphError(f"Invalid shape: {shape}")
+    return tuple(dims)
+
+def load_node_data(session_id: str, nodes: Dict[str, dict]) -> Dict[str, np.ndarray]:
+    """データノード・観測変数ノードのcsv_mappingが指す列を読み込む"""
+    service = DataService(session_id)
+    values = {}
+    for node_id, node in nodes.items():
+        if node["node_type"] in ("data", "observed"):
+            if not node.get("csv_mapping"):
+                raise GraphError(f"Node {node['code_name']} has no csv_mapping")
+            values[node_id] = service.load_mapped_values(node["csv_mapping"])
+    return values
+
+def load_plates(session_id: str, nodes: Dict[str, dict]) -> Dict[str, List[str]]:
+    """カテゴリ列を指すデータノードをプレート（グループの次元）として扱う
+
+    返り値は {データノードのcode_name: カテゴリ値一覧}。そのデータノードの値は
+    各行が属するグループのインデックスになり、shapeに同じ名前を書いたノードは
+    グループごとに1つの値を持つ。
+    """
+    service = DataService(session_id)
+    plates = {}
+    for node in nodes.values():
+        if node["node_type"] == "data" and node.get("csv_mapping"):
+            categories = service.load_mapped_categories(node["csv_mapping"])
+            if categories is not None:
+                plates[node["code_name"]] = categories
+    return plates
+
+def observation_count(data: Dict[str, np.ndarray]) -> int:
+    """データの行数（n_observations）を求める"""
+    lengths = {len(v) for v in data.values()}
+    if len(lengths) > 1:
+        raise GraphError(f"Mapped columns have different lengths: {sorted(lengths)}")
+    return lengths.pop() if lengths else 0
+
+def model_coords(data: Dict[str, np.ndarray], plates: Dict[str, List[str]]) -> Dict[str, Any]:
+    """可変長の次元とその座標（n_observationsは長さのみ）"""
+    coords: Dict[str, Any] = {OBSERVATION_DIM: observation_count(data)}
+    coords.update(plates)
+    return coords
+
+def data_variable_name(node: dict) -> str:
+    """観測値を保持するpm.Dataの変数名"""
+    if node["node_type"] == "observed":
+        return f"{node['code_name']}_observed"
+    return node["code_name"]
+
+Dims = Tuple[Optional[str], ...]
+
+def build_pymc_model(
+    nodes: Dict[str, dict],
+    edges: Dict[str, dict],
+    data: Dict[str, np.ndarray],
+    plates: Optional[Dict[str, List[str]]] = None,
+    total_size: Optional[int] = None,
+):
+    """ノード・エッジからベクトル化されたPyMCモデルを構築
+
+    プレートはグループ数に関係なく名前付きの次元（dims/coords）として表し、
+    ノードごとにバッチ化された確率変数を1つだけ作る。グループ次元を持つ値が
+    行（n_observations）単位のノードに接続された場合は、プレートのインデックス
+    （カテゴリ列のデータノード）で alpha[group_idx] のように展開する。
+
+    データノードと観測値はpm.MutableData、n_observationsとプレートは可変長の
+    次元として登録するため、同じ構造のモデルであればpm.set_dataと
+    set_dimで値を差し替えるだけで再利用できる。
+
+    total_sizeを指定するとdataは全行のうちのミニバッチとみなし、観測変数の
+    対数尤度を total_size / バッチの行数 倍する（ミニバッチADVI用）。
+    """
+    import pymc as pm
+
+    plates = plates or {}
+    parents: Dict[str, Dict[str, str]] = {node_id: {} for node_id in nodes}
+    for edge in edges.values():
+        handle = edge.get("target_handle") or edge["source"]
+        parents[edge["target"]][handle] = edge["source"]
+
+    order = topological_order(nodes, edges)
+    model = pm.Model()
+    model.add_coord(OBSERVATION_DIM, length=observation_count(data), mutable=True)
+
+    # プレート名 → グループのインデックスを持つデータノード
+    plate_index: Dict[str, str] = {}
+    for node_id, node in nodes.items():
+        if node["node_type"] == "data" and node["code_name"] in plates:
+            codes = data[node_id]
+            if codes.ndim != 1 or (codes < 0).any():
+                raise GraphError(f"Plate index {node['code_name']} must be a column without missing values")
+            model.add_coord(node["code_name"], values=plates[node["code_name"]], mutable=True)
+            plate_index[node["code_name"]] = node_id
+
+    def declared_dims(node: dict) -> Optional[Dims]:
+        """shape文字列を次元名に変換（整数の次元には "<code_name>_dim_<i>" の座標を作る）"""
+        dims = parse_shape(node.get("shape"))
+        if not dims:
+            return None
+        names = []
+        for i, dim in enumerate(dims):
+            if isinstance(dim, int):
+                name = f"{node['code_name']}_dim_{i}"
+                if name not in model.coords:
+                    model.add_coord(name, values=range(dim))
+                names.append(name)
+            elif dim == OBSERVATION_DIM or dim in plate_index:
+                names.append(dim)
+            else:
+                raise GraphError(f"Unknown dimension '{dim}' in {node['code_name']}")
+        return tuple(names)
+
+    def data_dims(node: dict, values: np.ndarray) -> Dims:
+        dims = declared_dims(node)
+        if dims is not None:
+            return dims
+        # 列が複数ある場合は2番目の次元に列の座標を作る
+        extra = []
+        for i, length in enumerate(values.shape[1:], start=1):
+            name = f"{node['code_name']}_dim_{i}"
+            if name not in model.coords:
+                model.add_coord(name, values=range(length))
+            extra.append(name)
+        return (OBSERVATION_DIM, *extra)
+
+    variables: Dict[str, Any] = {}
+    var_dims: Dict[str, Optional[Dims]] = {}
+
+    def align(source_id: str, target_dims: Optional[Dims]):
+        """グループ次元の値を行単位の次元に展開（target_dimsが行単位の場合のみ）"""
+        value = variables[source_id]
+        source_dims = var_dims.get(source_id)
+        if not source_dims or not target_dims:
+            return value
+        lead = source_dims[0]
+        if lead in plate_index and lead != target_dims[0] and target_dims[0] == OBSERVATION_DIM:
+            return value[variables[plate_index[lead]]]
+        return value
+
+    def inferred_dims(operand_ids: Sequence[str], ndim: int) -> Optional[Dims]:
+        """演算結果の先頭の次元を、行単位 → プレート の優先順で被演算子から推定"""
+        if ndim == 0:
+            return ()
+        leads = [var_dims[i][0] for i in operand_ids if var_dims.get(i)]
+        for lead in leads:
+            if lead == OBSERVATION_DIM:
+                return (OBSERVATION_DIM,) + (None,) * (ndim - 1)
+        for lead in leads:
+            if lead in plate_index:
+                return (lead,) + (None,) * (ndim - 1)
+        return None
+
+    def named(dims: Optional[Dims]) -> Optional[Dims]:
+        """すべての次元に名前がある場合だけPyMCのdimsとして渡す"""
+        if dims is not None and all(d is not None for d in dims):
+            return dims
+        return None
+
+    with model:
+        for node_id in order:
+            node = nodes[node_id]
+            node_type = node["node_type"]
+            name = node["code_name"]
+
+            if node_type == "constant":
+                if node.get("constant_value") is None:
+                    raise GraphError(f"Constant {name} has no value")
+                variables[node_id] = np.asarray(node["constant_value"], dtype=float)
+                var_dims[node_id] = None
+
+            elif node_type == "data":
+                dims = data_dims(node, data[node_id])
+                variables[node_id] = pm.MutableData(name, data[node_id], dims=named(dims))
+                var_dims[node_id] = dims
+
+            elif node_type == "operation":
+                definition = operation_registry.get(node.get("operation"))
+                if definition is None:
+                    raise GraphError(f"Unknown operation '{node.get('operation')}' in {name}")
+                operand_ids = []
+                for handle in definition.handles:
+                    if handle.id not in parents[node_id]:
+                        raise GraphError(f"Operand '{handle.label}' of {name} is not connected")
+                    operand_ids.append(parents[node_id][handle.id])
+
+                dims = declared_dims(node)
+                if dims is None:
+                    # 行単位の被演算子があれば、他の被演算子もそれに合わせて展開する
+                    dims = inferred_dims(operand_ids, 1)
+                operands = [align(i, dims) for i in operand_ids]
+                function = resolve_pymc_attr(definition.pymc_function)
+                result = function(*operands)
+                if declared_dims(node) is None:
+                    dims = inferred_dims(operand_ids, result.ndim)
+                variables[node_id] = pm.Deterministic(name, result, dims=named(dims))
+                var_dims[node_id] = dims
+
+            elif node_type in ("latent", "hyperparameter", "observed"):
+                definition = distribution_registry.get(node.get("distribution"))
+                if definition is None:
+                    raise GraphError(f"Unknown distribution '{node.get('distribution')}' in {name}")
+
+                if node_type == "observed":
+                    dims = data_dims(node, data[node_id])
+                else:
+                    dims = declared_dims(node) or ()
+
+                kwargs = {}
+                constants = node.get("parameters") or {}
+                for param in definition.parameters:
+                    if param.handle_id in parents[node_id]:
+                        kwargs[param.name] = align(parents[node_id][param.handle_id], dims)
+                    elif constants.get(param.name) is not None:
+                        kwargs[param.name] = constants[param.name]
+                    elif param.default is not None:
+                        kwargs[param.name] = param.default
+                    elif param.required:
+                        raise GraphError(f"Parameter '{param.name}' of {name} is not set")
+
+                dist = resolve_pymc_attr(definition.pymc_class)
+                if node_type == "observed":
+                    observed = pm.MutableData(data_variable_name(node), data[node_id], dims=dims)
+                    if total_size is not None:
+                        kwargs["total_size"] = total_size
+                    variables[node_id] = dist(name, observed=observed, dims=dims, **kwargs)
+                else:
+                    variables[node_id] = dist(name, dims=dims or None, **kwargs)
+                var_dims[node_id] = dims
+
+            else:
+                raise GraphError(f"Unknown node type '{node_type}' in {name}")
+
+    return model
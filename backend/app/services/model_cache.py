@@ -0,0 +1,207 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Tuple
+import numpy as np
+from app.config import settings
+from app.utils.metrics import metrics
+from app.utils.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = "workers:model_cache:stats"
+
+# 初期値の対数確率が有限にならなかった場合にゆらぎを引き直す回数（pm.sampleの既定値と同じ）
+_JITTER_RETRIES = 10
+
+def _rss_bytes() -> int:
+    """現在のプロセスの常駐メモリ量（Linuxのみ、取得できなければ0）"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+class CompiledModel:
+    """キャッシュされたPyMCモデルと、そのコンパイル済みNUTSステップ"""
+
+    def __init__(self, graph_hash: str, model):
+        self.graph_hash = graph_hash
+        self.structure_hash = None  # パラメータの値を除いた構造のハッシュ（_prepare_modelで設定）
+        self.model = model
+        self.size_bytes = 0
+        self._step = None
+        self._step_dim = None
+        self._initial_step_size = None
+
+    def set_data(self, data: Dict[str, np.ndarray], coords: Dict[str, Any]):
+        """pm.Dataの値と可変長の次元だけを差し替える（再コンパイル不要）
+
+        coordsは {次元名: 長さ または 座標値の一覧}（model_builder.model_coords）。
+        """
+        import pymc as pm
+
+        with self.model:
+            for dim, values in coords.items():
+                if isinstance(values, int):
+                    self.model.set_dim(dim, values)
+                else:
+                    self.model.set_dim(dim, len(values), coord_values=values)
+            pm.set_data(data)
+
+    def jittered_initial_points(self, seeds: List[int]) -> List[Dict[str, np.ndarray]]:
+        """チェーンごとの初期値（モデルの初期点に[-1, 1]の一様なゆらぎを加えたもの）
+
+        pm.sampleにステップを渡すとinit="jitter+adapt_diag"の初期化が行われないので、
+        同じ方法で作った初期値をinitvalsとして渡す。seedsはチェーンごとのシード。
+        """
+        from pymc.exceptions import SamplingError
+        from pymc.initial_point import make_initial_point_fns_per_chain
+
+        fns = make_initial_point_fns_per_chain(
+            model=self.model, overrides=None, jitter_rvs=set(self.model.free_RVs), chains=len(seeds)
+        )
+        points = []
+        for fn, seed in zip(fns, seeds):
+            rng = np.random.RandomState(seed)
+            for _ in range(_JITTER_RETRIES):
+                point = fn(seed)
+                try:
+                    self.model.check_start_vals(point)
+                    break
+                except SamplingError:
+                    seed = rng.randint(2**30, dtype=np.int64)
+            points.append(point)
+        return points
+
+    def get_nuts_step(self, target_accept: float = 0.8, warm=None, initial_points=None):
+        """コンパイル済みのNUTSステップを、適応状態を初期化して返す
+
+        logp/dlogpのコンパイルは初回のみ。自由変数の次元が変わった場合だけ作り直す。
+        warm（warm_start.WarmStart）を渡すと、保存したステップサイズと質量行列から調整を始める。
+        initial_points（チェーンごとの初期値）を渡すと、質量行列の適応をその平均から始める。
+        """
+        import pymc as pm
+        from pymc.step_methods.hmc import integration
+        from pymc.step_methods.hmc.quadpotential import QuadPotentialDiagAdapt
+        from pymc.step_methods.step_sizes import DualAverageAdaptation
+
+        value_vars = self.model.continuous_value_vars
+
+        def flatten(point) -> np.ndarray:
+            return np.concatenate([np.ravel(point[v.name]) for v in value_vars]) if value_vars else np.zeros(0)
+
+        mean = flatten(self.model.initial_point())
+
+        if self._step is None or self._step_dim != mean.size:
+            before = _rss_bytes()
+            with self.model, metrics.timer("inference_phase_duration_seconds", phase="compile"):
+                self._step = pm.NUTS(target_accept=target_accept)
+            self.size_bytes += max(_rss_bytes() - before, 0)
+            self._step_dim = mean.size
+            self._initial_step_size = self._step.step_size
+            model_cache.enforce_limit()
+
+        step = self._step
+        step_size, var, weight = self._initial_step_size, np.ones(mean.size), 10
+        if warm is not None and warm.mean.size == mean.size:
+            step_size, mean, var, weight = warm.step_size, warm.mean, warm.var, warm.weight
+        elif initial_points:
+            mean = np.mean([flatten(point) for point in initial_points], axis=0)
+        step.target_accept = target_accept
+        step.step_size = step_size
+        step.step_adapt = DualAverageAdaptation(step_size, target_accept, 0.05, 0.75, 10)
+        step.potential = QuadPotentialDiagAdapt(mean.size, mean, var, weight)
+        step.integrator = integration.CpuLeapfrogIntegrator(step.potential, step._logp_dlogp_func)
+        step.reset()
+        return step
+
+class CompiledModelCache:
+    """グラフ構造ハッシュをキーにしたコンパイル済みモデルのLRUキャッシュ
+
+    ワーカープロセスごとに保持し、推定メモリ使用量の合計が上限を超えたら
+    最も長く使われていないものから破棄する。
+    """
+
+    def __init__(self, max_bytes: int, max_entries: int):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CompiledModel]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_build(
+        self, graph_hash: str, builder: Callable[[], object]
+    ) -> Tuple[CompiledModel, bool]:
+        """キャッシュから取得し、なければbuilderでモデルを構築して登録"""
+        with self._lock:
+            entry = self._entries.get(graph_hash)
+            if entry is not None:
+                self._entries.move_to_end(graph_hash)
+                self.hits += 1
+        if entry is not None:
+            self._publish("hits")
+            return entry, True
+
+        # 初回のimportによる増加分を計測に含めない
+        import pymc  # noqa: F401
+
+        before = _rss_bytes()
+        entry = CompiledModel(graph_hash, builder())
+        entry.size_bytes = max(_rss_bytes() - before, 0)
+
+        with self._lock:
+            self.misses += 1
+            self._entries[graph_hash] = entry
+        self._publish("misses")
+        self.enforce_limit()
+        return entry, False
+
+    def discard(self, graph_hash: str):
+        """エントリを破棄する（データを差し替えられなかったモデルを作り直すため）"""
+        with self._lock:
+            discarded = self._entries.pop(graph_hash, None) is not None
+            self.evictions += discarded
+        if discarded:
+            self._publish("evictions")
+
+    def enforce_limit(self):
+        """上限を超えていれば古いものから破棄（直近のエントリは常に残す）"""
+        evicted = 0
+        with self._lock:
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or self.total_bytes() > self.max_bytes
+            ):
+                self._entries.popitem(last=False)
+                evicted += 1
+            self.evictions += evicted
+        if evicted:
+            self._publish("evictions", evicted)
+
+    def total_bytes(self) -> int:
+        return sum(e.size_bytes for e in self._entries.values())
+
+    def stats(self) -> dict:
+        """このワーカープロセスのキャッシュ統計"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "size_bytes": self.total_bytes(),
+        }
+
+    def _publish(self, field: str, amount: int = 1):
+        # 全ワーカーの合計をRedisに集計（失敗しても推論は止めない）
+        try:
+            redis_client.client.hincrby(STATS_KEY, field, amount)
+        except Exception as e:
+            logger.warning("Model cache stats error", extra={"fields": {"error": repr(e)}})
+
+model_cache = CompiledModelCache(
+    max_bytes=settings.MODEL_CACHE_MAX_BYTES,
+    max_entries=settings.MODEL_CACHE_MAX_ENTRIES,
+)
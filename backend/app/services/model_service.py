@@ -1,8 +1,17 @@
+import json
 import uuid
 from datetime import datetime
 from fastapi import HTTPException
-from app.models.schemas import ModelCreate, ModelResponse
-from app.utils.redis_client import redis_client
+from typing import Optional
+from app.models.schemas import (
+    ModelCreate,
+    ModelResponse,
+    ModelSnapshot,
+    NodeResponse,
+    EdgeResponse,
+)
+from app.config import settings
+from app.utils.redis_client import async_redis_client
 
 class ModelService:
     def __init__(self, session_id: str):
@@ -23,32 +32,137 @@ class ModelService:
             "session_id": self.session_id,
         }
 
-        # Redisに保存（24時間の有効期限）
+        # Redisに保存（セッションの最終アクセスからSESSION_TIMEOUTでスイーパーが消す）
         model_key = self._get_model_key(model_id)
-        redis_client.set_json(model_key, model, ex=86400)
+        await async_redis_client.set_json(model_key, model)
 
         return ModelResponse(**model)
 
     async def get_model(self, model_id: str) -> ModelResponse:
         """モデル情報を取得"""
         model_key = self._get_model_key(model_id)
-        model_data = redis_client.get_json(model_key)
+        model_data = await async_redis_client.get_json(model_key)
 
         if not model_data:
             raise HTTPException(status_code=404, detail="Model not found")
 
         return ModelResponse(**model_data)
 
+    async def get_snapshot(
+        self, model_id: str, since: Optional[int] = None
+    ) -> ModelSnapshot:
+        """メタデータ・ノード・エッジをまとめて取得
+
+        sinceを指定した場合は、そのバージョン以降に変更・削除されたノードと
+        エッジだけを返す。変更ログが既に切り詰められている場合は全体を返す。
+        """
+        prefix = f"sessions:{self.session_id}:models:{model_id}"
+        nodes_key = f"{prefix}:nodes"
+        edges_key = f"{prefix}:edges"
+        changes_key = f"{prefix}:changes"
+
+        if since is None:
+            return await self._get_full_snapshot(model_id)
+
+        async with async_redis_client.pipeline(transaction=True) as pipe:
+            pipe.get(self._get_model_key(model_id))
+            pipe.get(f"{prefix}:version")
+            pipe.zrangebyscore(changes_key, f"({since}", "+inf")
+            pipe.zcard(changes_key)
+            pipe.zrange(changes_key, 0, 0, withscores=True)
+            raw_meta, version, changed, log_size, oldest = await pipe.execute()
+
+        if raw_meta is None:
+            raise HTTPException(status_code=404, detail="Model not found")
+        version = int(version or 0)
+
+        # 変更ログに残っていない範囲を要求された場合は全体を返す
+        log_truncated = (
+            log_size >= settings.MODEL_CHANGE_LOG_SIZE
+            and oldest
+            and since < oldest[0][1]
+        )
+        if since > version or log_truncated:
+            return await self._get_full_snapshot(model_id)
+
+        node_ids = [m.split(":", 1)[1] for m in changed if m.startswith("node:")]
+        edge_ids = [m.split(":", 1)[1] for m in changed if m.startswith("edge:")]
+
+        raw_nodes, raw_edges = [], []
+        if changed:
+            async with async_redis_client.pipeline(transaction=False) as pipe:
+                if node_ids:
+                    pipe.hmget(nodes_key, node_ids)
+                if edge_ids:
+                    pipe.hmget(edges_key, edge_ids)
+                raw = list(await pipe.execute())
+            raw_nodes = raw.pop(0) if node_ids else []
+            raw_edges = raw.pop(0) if edge_ids else []
+
+        snapshot = ModelSnapshot(
+            meta=ModelResponse(**json.loads(raw_meta)), version=version, full=False
+        )
+        for node_id, value in zip(node_ids, raw_nodes):
+            if value is None:
+                snapshot.deleted_nodes.append(node_id)
+            else:
+                snapshot.nodes.append(NodeResponse(**json.loads(value)))
+        for edge_id, value in zip(edge_ids, raw_edges):
+            if value is None:
+                snapshot.deleted_edges.append(edge_id)
+            else:
+                snapshot.edges.append(EdgeResponse(**json.loads(value)))
+        return snapshot
+
+    async def _get_full_snapshot(self, model_id: str) -> ModelSnapshot:
+        prefix = f"sessions:{self.session_id}:models:{model_id}"
+
+        # 1回のMULTI/EXECで読み、同じバージョンの一貫した状態を返す
+        async with async_redis_client.pipeline(transaction=True) as pipe:
+            pipe.get(self._get_model_key(model_id))
+            pipe.hvals(f"{prefix}:nodes")
+            pipe.hvals(f"{prefix}:edges")
+            pipe.get(f"{prefix}:version")
+            raw_meta, raw_nodes, raw_edges, version = await pipe.execute()
+
+        if raw_meta is None:
+            raise HTTPException(status_code=404, detail="Model not found")
+
+        return ModelSnapshot(
+            meta=ModelResponse(**json.loads(raw_meta)),
+            version=int(version or 0),
+            nodes=[NodeResponse(**json.loads(v)) for v in raw_nodes],
+            edges=[EdgeResponse(**json.loads(v)) for v in raw_edges],
+        )
+
     async def delete_model(self, model_id: str):
         """モデルを削除"""
-        # メタデータ削除
-        model_key = self._get_model_key(model_id)
-        redis_client.delete(model_key)
+        prefix = f"sessions:{self.session_id}:models:{model_id}"
+        nodes_key = f"{prefix}:nodes"
+        edges_key = f"{prefix}:edges"
+
+        # 隣接インデックスのキーを求めるため、ノードIDとエッジの接続先を取得
+        async with async_redis_client.pipeline(transaction=False) as pipe:
+            pipe.hkeys(nodes_key)
+            pipe.hvals(edges_key)
+            node_ids, raw_edges = await pipe.execute()
 
-        # ノード削除
-        nodes_key = f"sessions:{self.session_id}:models:{model_id}:nodes"
-        redis_client.delete(nodes_key)
+        node_ids = set(node_ids)
+        for value in raw_edges:
+            edge = json.loads(value)
+            node_ids.update((edge["source"], edge["target"]))
 
-        # エッジ削除
-        edges_key = f"sessions:{self.session_id}:models:{model_id}:edges"
-        redis_client.delete(edges_key)
+        # メタデータ・ノード・エッジ・隣接インデックスをまとめて削除
+        keys = [
+            self._get_model_key(model_id),
+            nodes_key,
+            edges_key,
+            f"{prefix}:version",
+            f"{prefix}:changes",
+            f"{prefix}:validation",
+            f"{prefix}:adj",
+        ]
+        for node_id in node_ids:
+            keys.append(f"{prefix}:adj:{node_id}:in")
+            keys.append(f"{prefix}:adj:{node_id}:out")
+        await async_redis_client.delete(*keys)
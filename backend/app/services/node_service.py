@@ -1,14 +1,37 @@
+import json
 import uuid
-from typing import List
+from typing import List, Dict, Any, Optional, Set, Tuple
 from fastapi import HTTPException
+from pydantic import ValidationError
+from redis.exceptions import WatchError
 from app.models.schemas import (
     NodeCreate,
     NodeUpdate,
     NodeResponse,
     EdgeCreate,
+    EdgeUpdate,
     EdgeResponse,
+    GraphBatchRequest,
+    GraphBatchResponse,
+    GraphOperationResult,
 )
-from app.utils.redis_client import redis_client
+from app.config import settings
+from app.utils.redis_client import async_redis_client
+
+# モデルのバージョンを進め、変更されたノード・エッジを変更ログに記録する。
+# 書き込みと同じMULTI/EXEC内で実行するため、バージョンと変更内容は常に一致する。
+# KEYS: version, changes / ARGV: 変更ログの上限, "node:<id>" | "edge:<id>" ...
+_BUMP_VERSION_SCRIPT = """
+local version = redis.call('INCR', KEYS[1])
+for i = 2, #ARGV do
+    redis.call('ZADD', KEYS[2], version, ARGV[i])
+end
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -tonumber(ARGV[1]) - 1)
+return version
+"""
+
+# apply_batchの実行中に他の書き込みでグラフが変わった場合に読み込みからやり直す回数
+_BATCH_RETRIES = 5
 
 class NodeService:
     def __init__(self, session_id: str):
@@ -20,11 +43,35 @@ class NodeService:
     def _get_edges_key(self, model_id: str) -> str:
         return f"sessions:{self.session_id}:models:{model_id}:edges"
 
-    async def create_node(self, model_id: str, node_data: NodeCreate) -> NodeResponse:
-        """ノードを作成"""
-        node_id = f"node_{uuid.uuid4().hex[:8]}"
+    def _get_adjacency_key(self, model_id: str, node_id: str, direction: str) -> str:
+        # direction: "in" (edge_id → 親node_id) / "out" (edge_id → 子node_id)
+        return f"sessions:{self.session_id}:models:{model_id}:adj:{node_id}:{direction}"
 
-        node = {
+    def _get_adjacency_marker_key(self, model_id: str) -> str:
+        # 隣接インデックスが全エッジを含むことの印（インデックスの導入前に作られたエッジは含まない）
+        return f"sessions:{self.session_id}:models:{model_id}:adj"
+
+    def _get_version_key(self, model_id: str) -> str:
+        return f"sessions:{self.session_id}:models:{model_id}:version"
+
+    def _get_changes_key(self, model_id: str) -> str:
+        # Sorted Set: "node:<id>" / "edge:<id>" → 最後に変更されたバージョン
+        return f"sessions:{self.session_id}:models:{model_id}:changes"
+
+    def _bump_version(self, pipe, model_id: str, node_ids=(), edge_ids=()):
+        """パイプラインにバージョン更新と変更ログの記録を追加"""
+        members = [f"node:{i}" for i in node_ids] + [f"edge:{i}" for i in edge_ids]
+        pipe.eval(
+            _BUMP_VERSION_SCRIPT,
+            2,
+            self._get_version_key(model_id),
+            self._get_changes_key(model_id),
+            settings.MODEL_CHANGE_LOG_SIZE,
+            *members,
+        )
+
+    def _build_node(self, node_id: str, node_data: NodeCreate) -> dict:
+        return {
             "node_id": node_id,
             "node_type": node_data.node_type,
             "gui_name": node_data.gui_name,
@@ -34,19 +81,37 @@ class NodeService:
             "parameters": node_data.parameters or {},
             "operation": node_data.operation,
             "position": node_data.position,
+            "constant_value": node_data.constant_value,
+            "csv_mapping": node_data.csv_mapping,
         }
 
+    def _build_edge(self, edge_id: str, edge_data: EdgeCreate) -> dict:
+        return {
+            "edge_id": edge_id,
+            "source": edge_data.source,
+            "target": edge_data.target,
+            "source_handle": edge_data.source_handle,
+            "target_handle": edge_data.target_handle,
+        }
+
+    async def create_node(self, model_id: str, node_data: NodeCreate) -> NodeResponse:
+        """ノードを作成"""
+        node_id = f"node_{uuid.uuid4().hex[:8]}"
+        node = self._build_node(node_id, node_data)
+
         # Redisに保存
         nodes_key = self._get_nodes_key(model_id)
-        redis_client.hset_json(nodes_key, node_id, node)
-        redis_client.expire(nodes_key, 86400)  # 24時間
+        async with async_redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(nodes_key, node_id, json.dumps(node, ensure_ascii=False))
+            self._bump_version(pipe, model_id, node_ids=[node_id])
+            await pipe.execute()
 
         return NodeResponse(**node)
 
     async def get_all_nodes(self, model_id: str) -> List[NodeResponse]:
         """モデルの全ノードを取得"""
         nodes_key = self._get_nodes_key(model_id)
-        nodes_data = redis_client.hgetall_json(nodes_key)
+        nodes_data = await async_redis_client.hgetall_json(nodes_key)
 
         return [NodeResponse(**node) for node in nodes_data.values()]
 
@@ -55,7 +120,7 @@ class NodeService:
     ) -> NodeResponse:
         """ノードを更新"""
         nodes_key = self._get_nodes_key(model_id)
-        existing_node = redis_client.hget_json(nodes_key, node_id)
+        existing_node = await async_redis_client.hget_json(nodes_key, node_id)
 
         if not existing_node:
             raise HTTPException(status_code=404, detail="Node not found")
@@ -65,51 +130,356 @@ class NodeService:
         existing_node.update(update_dict)
 
         # Redisに保存
-        redis_client.hset_json(nodes_key, node_id, existing_node)
-        redis_client.expire(nodes_key, 86400)
+        async with async_redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(nodes_key, node_id, json.dumps(existing_node, ensure_ascii=False))
+            self._bump_version(pipe, model_id, node_ids=[node_id])
+            await pipe.execute()
 
         return NodeResponse(**existing_node)
 
     async def delete_node(self, model_id: str, node_id: str):
         """ノードを削除"""
         nodes_key = self._get_nodes_key(model_id)
-        redis_client.hdel(nodes_key, node_id)
-
-        # このノードに接続されているエッジも削除
         edges_key = self._get_edges_key(model_id)
-        all_edges = redis_client.hgetall_json(edges_key)
+        in_key = self._get_adjacency_key(model_id, node_id, "in")
+        out_key = self._get_adjacency_key(model_id, node_id, "out")
 
-        for edge_id, edge in all_edges.items():
-            if edge["source"] == node_id or edge["target"] == node_id:
-                redis_client.hdel(edges_key, edge_id)
+        # 隣接インデックスからこのノードに接続されているエッジだけを取得
+        adjacency = (await self.get_adjacency(model_id, [node_id]))[node_id]
+        incoming, outgoing = adjacency["in"], adjacency["out"]
+
+        async with async_redis_client.pipeline(transaction=True) as pipe:
+            pipe.hdel(nodes_key, node_id)
+            edge_ids = set(incoming) | set(outgoing)
+            if edge_ids:
+                pipe.hdel(edges_key, *edge_ids)
+            # 接続先ノード側のインデックスからも削除
+            for edge_id, source in incoming.items():
+                pipe.hdel(self._get_adjacency_key(model_id, source, "out"), edge_id)
+            for edge_id, target in outgoing.items():
+                pipe.hdel(self._get_adjacency_key(model_id, target, "in"), edge_id)
+            pipe.delete(in_key, out_key)
+            self._bump_version(pipe, model_id, node_ids=[node_id], edge_ids=edge_ids)
+            await pipe.execute()
 
     async def create_edge(self, model_id: str, edge_data: EdgeCreate) -> EdgeResponse:
         """エッジを作成"""
         edge_id = f"edge_{uuid.uuid4().hex[:8]}"
+        edge = self._build_edge(edge_id, edge_data)
 
-        edge = {
-            "edge_id": edge_id,
-            "source": edge_data.source,
-            "target": edge_data.target,
-            "source_handle": edge_data.source_handle,
-            "target_handle": edge_data.target_handle,
-        }
-
-        # Redisに保存
+        # Redisに保存（隣接インデックスも同時に更新）
         edges_key = self._get_edges_key(model_id)
-        redis_client.hset_json(edges_key, edge_id, edge)
-        redis_client.expire(edges_key, 86400)
+        out_key = self._get_adjacency_key(model_id, edge["source"], "out")
+        in_key = self._get_adjacency_key(model_id, edge["target"], "in")
+        async with async_redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(edges_key, edge_id, json.dumps(edge, ensure_ascii=False))
+            pipe.hset(out_key, edge_id, edge["target"])
+            pipe.hset(in_key, edge_id, edge["source"])
+            self._bump_version(pipe, model_id, edge_ids=[edge_id])
+            await pipe.execute()
 
         return EdgeResponse(**edge)
 
     async def get_all_edges(self, model_id: str) -> List[EdgeResponse]:
         """モデルの全エッジを取得"""
         edges_key = self._get_edges_key(model_id)
-        edges_data = redis_client.hgetall_json(edges_key)
+        edges_data = await async_redis_client.hgetall_json(edges_key)
 
         return [EdgeResponse(**edge) for edge in edges_data.values()]
 
     async def delete_edge(self, model_id: str, edge_id: str):
         """エッジを削除"""
         edges_key = self._get_edges_key(model_id)
-        redis_client.hdel(edges_key, edge_id)
+        edge = await async_redis_client.hget_json(edges_key, edge_id)
+        if not edge:
+            return
+
+        async with async_redis_client.pipeline(transaction=True) as pipe:
+            pipe.hdel(edges_key, edge_id)
+            pipe.hdel(self._get_adjacency_key(model_id, edge["source"], "out"), edge_id)
+            pipe.hdel(self._get_adjacency_key(model_id, edge["target"], "in"), edge_id)
+            self._bump_version(pipe, model_id, edge_ids=[edge_id])
+            await pipe.execute()
+
+    async def get_adjacency(
+        self, model_id: str, node_ids: List[str]
+    ) -> Dict[str, Dict[str, Dict[str, str]]]:
+        """指定ノードの親・子を隣接インデックスから取得
+
+        戻り値は {node_id: {"in": {edge_id: 親node_id}, "out": {edge_id: 子node_id}}}。
+        グラフ全体を読む検査・コンパイルは、読み込んだエッジから1回の走査で親子を求める。
+        """
+        await self._ensure_adjacency(model_id)
+        async with async_redis_client.pipeline(transaction=False) as pipe:
+            for node_id in node_ids:
+                pipe.hgetall(self._get_adjacency_key(model_id, node_id, "in"))
+                pipe.hgetall(self._get_adjacency_key(model_id, node_id, "out"))
+            raw = await pipe.execute()
+
+        return {
+            node_id: {"in": raw[2 * i], "out": raw[2 * i + 1]}
+            for i, node_id in enumerate(node_ids)
+        }
+
+    async def _ensure_adjacency(self, model_id: str):
+        """隣接インデックスが未構築（導入前に作られたモデル）ならエッジから作る"""
+        marker_key = self._get_adjacency_marker_key(model_id)
+        if await async_redis_client.client.exists(marker_key):
+            return
+
+        edges_key = self._get_edges_key(model_id)
+        for _ in range(_BATCH_RETRIES):
+            async with async_redis_client.pipeline(transaction=True) as pipe:
+                # 構築中にエッジが変更されたらやり直す
+                await pipe.watch(edges_key, marker_key)
+                if await pipe.exists(marker_key):
+                    return
+                raw_edges = await pipe.hgetall(edges_key)
+                pipe.multi()
+                for edge_id, value in raw_edges.items():
+                    edge = json.loads(value)
+                    pipe.hset(self._get_adjacency_key(model_id, edge["source"], "out"), edge_id, edge["target"])
+                    pipe.hset(self._get_adjacency_key(model_id, edge["target"], "in"), edge_id, edge["source"])
+                pipe.set(marker_key, 1)
+                try:
+                    await pipe.execute()
+                    return
+                except WatchError:
+                    continue
+        raise HTTPException(status_code=409, detail="Conflicting graph update, please retry")
+
+    async def apply_batch(
+        self, model_id: str, batch: GraphBatchRequest
+    ) -> GraphBatchResponse:
+        """ノード・エッジの作成/更新/削除をまとめて適用
+
+        既存データの読み込みを1回のパイプラインで行い、全ての書き込みを
+        1回のMULTI/EXECで実行する。途中の操作でエラーになった場合は
+        何も書き込まない。読み込みから書き込みまでの間に他のリクエストが
+        ノード・エッジを変更した場合は、読み込みからやり直す。
+        """
+        for _ in range(_BATCH_RETRIES):
+            try:
+                return await self._apply_batch_once(model_id, batch)
+            except WatchError:
+                continue
+        raise HTTPException(status_code=409, detail="Conflicting graph update, please retry")
+
+    async def _apply_batch_once(
+        self, model_id: str, batch: GraphBatchRequest
+    ) -> GraphBatchResponse:
+        nodes_key = self._get_nodes_key(model_id)
+        edges_key = self._get_edges_key(model_id)
+        operations = batch.operations
+
+        # 更新・削除対象の既存データと、削除ノードの隣接インデックス
+        node_ids = sorted({o.id for o in operations if o.kind == "node" and o.op != "create" and o.id})
+        edge_ids = sorted({o.id for o in operations if o.kind == "edge" and o.op != "create" and o.id})
+        deleting_ids = sorted({o.id for o in operations if o.kind == "node" and o.op == "delete" and o.id})
+        if deleting_ids:
+            await self._ensure_adjacency(model_id)
+
+        async with async_redis_client.pipeline(transaction=True) as pipe:
+            # WATCHの後に読んだ内容が書き込みまでに変わっていればEXECがWatchErrorになる。
+            # 読み込みは別の接続の1回のパイプラインで行う（WATCHの後なので変更は検出される）
+            await pipe.watch(nodes_key, edges_key)
+            state = _BatchState()
+            if node_ids or edge_ids:
+                async with async_redis_client.pipeline(transaction=False) as reader:
+                    if node_ids:
+                        reader.hmget(nodes_key, node_ids)
+                    if edge_ids:
+                        reader.hmget(edges_key, edge_ids)
+                    for node_id in deleting_ids:
+                        reader.hgetall(self._get_adjacency_key(model_id, node_id, "in"))
+                        reader.hgetall(self._get_adjacency_key(model_id, node_id, "out"))
+                    raw = list(await reader.execute())
+
+                if node_ids:
+                    state.load_nodes(node_ids, raw.pop(0))
+                if edge_ids:
+                    state.load_edges(edge_ids, raw.pop(0))
+                for node_id in deleting_ids:
+                    state.load_adjacency(node_id, raw.pop(0), raw.pop(0))
+
+            # メモリ上で順番に適用する（同じバッチ内で作成したノードの更新・接続も可能）
+            results = []
+            for index, operation in enumerate(operations):
+                try:
+                    if operation.kind == "node":
+                        result = self._apply_node_operation(operation, state)
+                    else:
+                        result = self._apply_edge_operation(operation, state)
+                except ValidationError as e:
+                    raise HTTPException(
+                        status_code=422,
+                        detail={"operation": index, "errors": e.errors(include_url=False, include_context=False)},
+                    )
+                except HTTPException as e:
+                    raise HTTPException(
+                        status_code=e.status_code,
+                        detail=f"operations[{index}]: {e.detail}",
+                    )
+                results.append(result)
+
+            # 1回のMULTI/EXECで書き込む（期限はリクエストごとにセッション単位で延長する）
+            pipe.multi()
+            if state.dirty_nodes:
+                pipe.hset(nodes_key, mapping={
+                    i: json.dumps(n, ensure_ascii=False) for i, n in state.dirty_nodes.items()
+                })
+            if state.deleted_nodes:
+                pipe.hdel(nodes_key, *state.deleted_nodes)
+            if state.dirty_edges:
+                pipe.hset(edges_key, mapping={
+                    i: json.dumps(e, ensure_ascii=False) for i, e in state.dirty_edges.items()
+                })
+            if state.deleted_edges:
+                pipe.hdel(edges_key, *state.deleted_edges)
+
+            # 隣接インデックスの更新（エッジの接続元・接続先は更新では変わらない）
+            for edge_id in state.deleted_edges:
+                if edge_id in state.old_endpoints:
+                    source, target = state.old_endpoints[edge_id]
+                    pipe.hdel(self._get_adjacency_key(model_id, source, "out"), edge_id)
+                    pipe.hdel(self._get_adjacency_key(model_id, target, "in"), edge_id)
+            for edge_id, edge in state.dirty_edges.items():
+                out_key = self._get_adjacency_key(model_id, edge["source"], "out")
+                in_key = self._get_adjacency_key(model_id, edge["target"], "in")
+                pipe.hset(out_key, edge_id, edge["target"])
+                pipe.hset(in_key, edge_id, edge["source"])
+            for node_id in state.deleted_nodes:
+                in_key = self._get_adjacency_key(model_id, node_id, "in")
+                out_key = self._get_adjacency_key(model_id, node_id, "out")
+                pipe.delete(in_key, out_key)
+
+            self._bump_version(
+                pipe,
+                model_id,
+                node_ids=set(state.dirty_nodes) | state.deleted_nodes,
+                edge_ids=set(state.dirty_edges) | state.deleted_edges,
+            )
+            version = (await pipe.execute())[-1]
+
+        return GraphBatchResponse(results=results, version=version)
+
+    def _apply_node_operation(self, operation, state: "_BatchState") -> GraphOperationResult:
+        if operation.op == "create":
+            node_id = f"node_{uuid.uuid4().hex[:8]}"
+            node = self._build_node(node_id, NodeCreate(**(operation.data or {})))
+            if operation.ref:
+                state.refs[operation.ref] = node_id
+        else:
+            node_id = state.refs.get(operation.id, operation.id)
+            if node_id not in state.nodes:
+                raise HTTPException(status_code=404, detail="Node not found")
+
+            if operation.op == "delete":
+                state.delete_node(node_id)
+                return GraphOperationResult(op="delete", kind="node", id=node_id, ref=operation.ref)
+
+            update_dict = NodeUpdate(**(operation.data or {})).model_dump(exclude_unset=True)
+            node = {**state.nodes[node_id], **update_dict}
+
+        state.put_node(node_id, node)
+        return GraphOperationResult(
+            op=operation.op, kind="node", id=node_id, ref=operation.ref,
+            node=NodeResponse(**node),
+        )
+
+    def _apply_edge_operation(self, operation, state: "_BatchState") -> GraphOperationResult:
+        data = dict(operation.data or {})
+        # 同じバッチ内で作成したノードの一時IDを実IDに置き換える
+        for field in ("source", "target"):
+            if data.get(field) in state.refs:
+                data[field] = state.refs[data[field]]
+
+        if operation.op == "create":
+            edge_id = f"edge_{uuid.uuid4().hex[:8]}"
+            edge = self._build_edge(edge_id, EdgeCreate(**data))
+            if operation.ref:
+                state.refs[operation.ref] = edge_id
+        else:
+            edge_id = state.refs.get(operation.id, operation.id)
+            if edge_id not in state.edges:
+                raise HTTPException(status_code=404, detail="Edge not found")
+
+            if operation.op == "delete":
+                state.delete_edge(edge_id)
+                return GraphOperationResult(op="delete", kind="edge", id=edge_id, ref=operation.ref)
+
+            # ハンドルだけを更新できる（ID・接続元・接続先を書き換えると隣接インデックスと食い違う）
+            update_dict = EdgeUpdate(**(operation.data or {})).model_dump(exclude_unset=True)
+            edge = {**state.edges[edge_id], **update_dict}
+
+        state.put_edge(edge_id, edge)
+        return GraphOperationResult(
+            op=operation.op, kind="edge", id=edge_id, ref=operation.ref,
+            edge=EdgeResponse(**edge),
+        )
+
+class _BatchState:
+    """apply_batch中のグラフのメモリ上のビューと書き込み予定の差分"""
+
+    def __init__(self):
+        self.nodes: Dict[str, Any] = {}
+        self.edges: Dict[str, Any] = {}
+        self.refs: Dict[str, str] = {}
+        # Redis上に既に存在するエッジの接続元・接続先
+        self.old_endpoints: Dict[str, Tuple[str, str]] = {}
+        # 削除対象ノードに接続されている既存エッジ（隣接インデックスより）
+        self.node_edges: Dict[str, Set[str]] = {}
+        self.dirty_nodes: Dict[str, Any] = {}
+        self.dirty_edges: Dict[str, Any] = {}
+        self.deleted_nodes: Set[str] = set()
+        self.deleted_edges: Set[str] = set()
+
+    def load_nodes(self, node_ids: List[str], values: List[Optional[str]]):
+        self.nodes.update({i: json.loads(v) for i, v in zip(node_ids, values) if v is not None})
+
+    def load_edges(self, edge_ids: List[str], values: List[Optional[str]]):
+        for edge_id, value in zip(edge_ids, values):
+            if value is not None:
+                edge = json.loads(value)
+                self.edges[edge_id] = edge
+                self.old_endpoints[edge_id] = (edge["source"], edge["target"])
+
+    def load_adjacency(self, node_id: str, incoming: Dict[str, str], outgoing: Dict[str, str]):
+        for edge_id, source in incoming.items():
+            self.old_endpoints.setdefault(edge_id, (source, node_id))
+        for edge_id, target in outgoing.items():
+            self.old_endpoints.setdefault(edge_id, (node_id, target))
+        self.node_edges[node_id] = set(incoming) | set(outgoing)
+
+    def put_node(self, node_id: str, node: dict):
+        self.nodes[node_id] = node
+        self.dirty_nodes[node_id] = node
+        self.deleted_nodes.discard(node_id)
+
+    def put_edge(self, edge_id: str, edge: dict):
+        self.edges[edge_id] = edge
+        self.dirty_edges[edge_id] = edge
+        self.deleted_edges.discard(edge_id)
+
+    def delete_node(self, node_id: str):
+        del self.nodes[node_id]
+        self.dirty_nodes.pop(node_id, None)
+        self.deleted_nodes.add(node_id)
+
+        # このノードに接続されているエッジも削除
+        connected = {
+            edge_id for edge_id, edge in self.edges.items()
+            if node_id in (edge["source"], edge["target"])
+        }
+        # 未読込の既存エッジは隣接インデックスの情報で判定する
+        connected.update(
+            edge_id for edge_id in self.node_edges.get(node_id, ())
+            if edge_id not in self.edges and edge_id not in self.deleted_edges
+        )
+        for edge_id in connected:
+            self.delete_edge(edge_id)
+
+    def delete_edge(self, edge_id: str):
+        self.edges.pop(edge_id, None)
+        self.dirty_edges.pop(edge_id, None)
+        self.deleted_edges.add(edge_id)
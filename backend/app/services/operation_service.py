@@ -1,28 +1,28 @@
-import json
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
 from app.models.schemas import OperationDefinition
+from app.services.definition_registry import DefinitionRegistry
+
+CONFIG_PATH = Path("/app/config/operations")
+
+# 標準演算 → カスタム演算の順に読み込む（プロセス内で共有）
+operation_registry = DefinitionRegistry(
+    [CONFIG_PATH / "operations.json", CONFIG_PATH / "custom_operations.json"],
+    OperationDefinition,
+)
 
 class OperationService:
     def __init__(self):
-        self.config_path = Path("/app/config/operations")
+        self.registry = operation_registry
 
     def get_all_operations(self) -> List[OperationDefinition]:
         """全ての演算定義を取得"""
-        operations = []
-
-        # 標準演算を読み込み
-        standard_file = self.config_path / "operations.json"
-        if standard_file.exists():
-            with open(standard_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                operations.extend([OperationDefinition(**o) for o in data])
+        return self.registry.get_all()
 
-        # カスタム演算を読み込み
-        custom_file = self.config_path / "custom_operations.json"
-        if custom_file.exists():
-            with open(custom_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                operations.extend([OperationDefinition(**o) for o in data])
+    def get_operation(self, name: str) -> Optional[OperationDefinition]:
+        """演算名から定義を取得"""
+        return self.registry.get(name)
 
-        return operations
+    def get_serialized(self) -> Tuple[bytes, str]:
+        """シリアライズ済みの演算一覧とETagを取得"""
+        return self.registry.get_serialized()
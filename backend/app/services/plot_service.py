@@ -0,0 +1,114 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+from fastapi import HTTPException
+from app.config import settings
+
+def render_plot(
+    kind: str,
+    trace_dir: str,
+    var_names: List[str],
+    thin: int,
+    width: float,
+    height: float,
+    dpi: int,
+    out_file: str,
+):
+    """プロットを描画してPNGに保存（プロセスプール内で実行）"""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import arviz as az
+    import matplotlib.pyplot as plt
+    from app.utils.trace_store import to_inference_data
+
+    idata = to_inference_data(Path(trace_dir), groups=["posterior"], var_names=var_names)
+    if thin > 1:
+        idata = idata.sel(draw=slice(None, None, thin))
+
+    if kind == "trace":
+        axes = az.plot_trace(idata, var_names=var_names, compact=True, figsize=(width, height))
+    else:
+        axes = az.plot_forest(idata, var_names=var_names, combined=True, figsize=(width, height))
+
+    figure = axes.ravel()[0].figure
+    figure.tight_layout()
+    # 同じ画像を同時に描画した場合に備え、一時ファイルに書いてから置き換える
+    tmp_file = f"{out_file}.{uuid.uuid4().hex[:8]}.tmp"
+    figure.savefig(tmp_file, format="png", dpi=dpi, bbox_inches="tight")
+    plt.close(figure)
+    os.replace(tmp_file, out_file)
+
+def plot_cache_key(result_id: str, kind: str, params: dict) -> str:
+    """結果IDと描画パラメータから画像のキャッシュキーを求める"""
+    payload = json.dumps({"result_id": result_id, "kind": kind, **params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+class PlotRenderer:
+    """推論ワーカーとは別の、上限付きプロセスプールでプロットを描画する
+
+    描画済みの画像はresults/{result_id}/plots/{キー}.pngにキャッシュし、
+    同じ画像の描画が同時に要求された場合は1回だけ描画する。
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # matplotlibのメモリを溜め込まないよう、一定回数ごとにプロセスを作り直す
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=50,
+            )
+        return self._executor
+
+    async def render(self, out_file: Path, kind: str, trace_dir: Path, params: dict) -> Path:
+        """キャッシュがなければ描画して画像のパスを返す"""
+        if out_file.exists():
+            return out_file
+
+        key = str(out_file)
+        future = self._pending.get(key)
+        if future is None:
+            if len(self._pending) >= self.max_pending:
+                raise HTTPException(status_code=503, detail="Too many plots are being rendered")
+            out_file.parent.mkdir(parents=True, exist_ok=True)
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self._get_executor(),
+                render_plot,
+                kind,
+                str(trace_dir),
+                params["var_names"],
+                params["thin"],
+                params["width"],
+                params["height"],
+                params["dpi"],
+                key,
+            )
+            self._pending[key] = future
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+
+        await asyncio.shield(future)
+        return out_file
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+plot_renderer = PlotRenderer(
+    max_workers=settings.PLOT_MAX_WORKERS,
+    max_pending=settings.PLOT_MAX_PENDING,
+)
@@ -0,0 +1,135 @@
+import json
+import logging
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Optional
+from app.utils.metrics import metrics
+from app.utils.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# 配信を止めるフェーズ
+TERMINAL_PHASES = ("completed", "failed")
+
+# 所要時間をinference_phase_duration_secondsに記録するフェーズ（切り替わりはcallbackでしか分からない）。
+# 並列のチェーンでは最後に届いたドローのフェーズに経過時間を足すので、tune/drawの境目は近似。
+TIMED_PHASES = ("tune", "draw", "sampling")
+
+def get_events_channel(session_id: str, task_id: str) -> str:
+    return f"sessions:{session_id}:tasks:{task_id}:events"
+
+class ProgressReporter:
+    """サンプリングの進捗をRedisのpub/subに配信する
+
+    pm.sampleのcallbackとして使う。ドローごとの配信は間引き（既定で0.25秒ごと）、
+    フェーズの切り替わりとチェーンの完了は必ず配信する。
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        task_id: str,
+        draws: int,
+        tune: int,
+        chains: int,
+        first_chain: int = 0,
+        interval: float = 0.25,
+        on_progress: Optional[Callable[[int, int, int], None]] = None,
+    ):
+        self.channel = get_events_channel(session_id, task_id)
+        self.task_id = task_id
+        self.draws = draws
+        self.tune = tune
+        self.first_chain = first_chain
+        self.interval = interval
+        # on_progress(chain, チェーンの進捗%, 全体の進捗%) はチェーンの進捗%が変わったときに呼ばれる
+        self.on_progress = on_progress
+
+        self.counts: Dict[int, int] = {first_chain + i: 0 for i in range(chains)}
+        self.chain_percents: Dict[int, int] = {chain: 0 for chain in self.counts}
+        self.divergences = 0
+        self.current_phase = None
+        self._started_at = None
+        self._last_published = 0.0
+        self._phase_started = None
+        self._phase_seconds: Dict[str, float] = defaultdict(float)
+
+    @property
+    def total_draws(self) -> int:
+        return (self.draws + self.tune) * len(self.counts)
+
+    @property
+    def percent(self) -> int:
+        return int(sum(self.counts.values()) / self.total_draws * 100) if self.total_draws else 0
+
+    def eta_seconds(self) -> Optional[float]:
+        """これまでの速度から残り時間を推定"""
+        done = sum(self.counts.values())
+        if not self._started_at or not done:
+            return None
+        elapsed = time.monotonic() - self._started_at
+        return round(elapsed / done * (self.total_draws - done), 1)
+
+    def phase(self, phase: str, **extra):
+        """フェーズの切り替わりを配信（compile / tune / draw / sampling / segment / saving / completed / failed）
+
+        samplingは外部のサンプラー（nutpie / numpyro）で実行中で、ドローごとの進捗はない。
+        segmentは一括実行の1セグメントの開始・終了（segment, status）。
+        """
+        self._switch_phase(phase)
+        self.publish(**extra)
+
+    def stop(self):
+        """配信せずにフェーズの計測を終える（続きのフェーズを別のタスクが配信するサブタスク用）"""
+        self._switch_phase(None)
+
+    def _switch_phase(self, phase: Optional[str]):
+        """経過時間を直前のフェーズに足し、サンプリングが終わったら記録する"""
+        now = time.perf_counter()
+        if self.current_phase in TIMED_PHASES and self._phase_started is not None:
+            self._phase_seconds[self.current_phase] += now - self._phase_started
+        self._phase_started = now
+        self.current_phase = phase
+        if phase not in TIMED_PHASES and self._phase_seconds:
+            for name, seconds in self._phase_seconds.items():
+                metrics.observe("inference_phase_duration_seconds", seconds, phase=name)
+            self._phase_seconds.clear()
+
+    def callback(self, trace, draw):
+        chain = self.first_chain + draw.chain
+        self.counts[chain] += 1
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+        if not draw.tuning and draw.stats and draw.stats[0].get("diverging"):
+            self.divergences += 1
+
+        chain_percent = int(self.counts[chain] / (self.draws + self.tune) * 100)
+        if chain_percent != self.chain_percents[chain]:
+            self.chain_percents[chain] = chain_percent
+            if self.on_progress:
+                self.on_progress(chain, chain_percent, self.percent)
+
+        phase = "tune" if draw.tuning else "draw"
+        now = time.monotonic()
+        if phase != self.current_phase or draw.is_last or now - self._last_published >= self.interval:
+            if phase != self.current_phase:
+                self._switch_phase(phase)
+            self.publish()
+
+    def publish(self, **extra):
+        self._last_published = time.monotonic()
+        event = {
+            "task_id": self.task_id,
+            "phase": self.current_phase,
+            "progress": self.percent,
+            "draws_per_chain": self.draws + self.tune,
+            "chains": {str(chain): count for chain, count in self.counts.items()},
+            "divergences": self.divergences,
+            "eta_seconds": self.eta_seconds(),
+            **extra,
+        }
+        # 配信に失敗しても推論は止めない
+        try:
+            redis_client.client.publish(self.channel, json.dumps(event, ensure_ascii=False))
+        except Exception as e:
+            logger.warning("Progress publish error", extra={"fields": {"error": repr(e)}})
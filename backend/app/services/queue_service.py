@@ -0,0 +1,96 @@
+import time
+from typing import Optional
+import numpy as np
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from app.celery_app import celery_app
+from app.config import settings
+from app.models.schemas import QueueInfo, QueueStatus
+from app.services.queues import BATCH_QUEUE, INTERACTIVE_QUEUE, QUEUES, get_waits_key
+from app.utils.redis_client import async_redis_client
+
+# 終了したタスクのCeleryの状態
+_FINISHED_STATES = ("SUCCESS", "FAILURE", "REVOKED")
+
+_SESSION_LIMITS = {
+    INTERACTIVE_QUEUE: lambda: settings.SESSION_MAX_INTERACTIVE_TASKS,
+    BATCH_QUEUE: lambda: settings.SESSION_MAX_BATCH_TASKS,
+}
+
+class QueueService:
+    """セッションごとの同時実行数の制限（受付制御）とキューの状態
+
+    セッションがキューに投入して終わっていないタスクを、投入時刻をスコアにした
+    ソート済み集合で数える。終わったタスクは次の受付時にCeleryの状態を見て除く
+    （ワーカー側で後始末しないので、chordやワーカーの異常終了でも数がずれない）。
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+
+    def _get_active_key(self, queue: str) -> str:
+        return f"sessions:{self.session_id}:active:{queue}"
+
+    async def _prune(self, queue: str) -> int:
+        """終わったタスクを除き、実行中・待機中のタスク数を返す"""
+        key = self._get_active_key(queue)
+        # 1日以上前の投入は結果の保持期限を過ぎているので状態を確かめずに除く
+        await async_redis_client.client.zremrangebyscore(key, 0, time.time() - 86400)
+        task_ids = await async_redis_client.client.zrange(key, 0, -1)
+        if not task_ids:
+            return 0
+        states = await run_in_threadpool(
+            lambda: [celery_app.AsyncResult(task_id).state for task_id in task_ids]
+        )
+        finished = [t for t, state in zip(task_ids, states) if state in _FINISHED_STATES]
+        if finished:
+            await async_redis_client.client.zrem(key, *finished)
+        return len(task_ids) - len(finished)
+
+    async def admit(self, queue: str, task_id: str):
+        """上限に達していれば429で拒否し、そうでなければタスクを数に加える"""
+        limit = _SESSION_LIMITS[queue]()
+        await self._prune(queue)
+        key = self._get_active_key(queue)
+        # 先に加えてから数え、同時の投入でも上限を超えないようにする
+        await async_redis_client.client.zadd(key, {task_id: time.time()})
+        await async_redis_client.client.expire(key, 86400)
+        if await async_redis_client.client.zcard(key) > limit:
+            await async_redis_client.client.zrem(key, task_id)
+            raise HTTPException(
+                status_code=429,
+                detail=f"Too many active {queue} tasks for this session (max {limit})",
+            )
+
+    async def release(self, queue: str, task_id: str):
+        """投入に失敗したタスクを数から除く"""
+        await async_redis_client.client.zrem(self._get_active_key(queue), task_id)
+
+    def _queue_depth(self, queue: str) -> Optional[int]:
+        try:
+            with celery_app.connection_for_read() as conn:
+                return conn.default_channel.queue_declare(queue=queue, passive=True).message_count
+        except Exception:
+            return None
+
+    async def get_status(self) -> QueueStatus:
+        """キューごとの待機中のタスク数、直近の待ち時間、このセッションの実行数と上限"""
+        queues = []
+        for queue in QUEUES:
+            depth = await run_in_threadpool(self._queue_depth, queue)
+            waits = np.asarray(
+                await async_redis_client.client.lrange(get_waits_key(queue), 0, -1), dtype=float
+            )
+            queues.append(
+                QueueInfo(
+                    name=queue,
+                    depth=depth,
+                    recent_tasks=len(waits),
+                    wait_p50=float(np.percentile(waits, 50)) if len(waits) else None,
+                    wait_p95=float(np.percentile(waits, 95)) if len(waits) else None,
+                    wait_max=float(waits.max()) if len(waits) else None,
+                    session_active=await self._prune(queue),
+                    session_limit=_SESSION_LIMITS[queue](),
+                )
+            )
+        return QueueStatus(queues=queues)
@@ -0,0 +1,107 @@
+import json
+import logging
+import time
+from typing import Callable, Dict
+from celery.signals import before_task_publish, task_prerun
+from app.config import settings
+from app.services.model_builder import OBSERVATION_DIM, parse_shape
+from app.utils.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# タスクの振り分け先のキュー。interactiveは数秒〜数分で終わる処理（モデル構築・事前予測・
+# 推定コストの小さなサンプリング）、batchはそれ以外の推論。キューごとに別のワーカーを
+# 起動し、長いサンプリングが短い処理の順番待ちを起こさないようにする。
+INTERACTIVE_QUEUE = "interactive"
+BATCH_QUEUE = "batch"
+QUEUES = (INTERACTIVE_QUEUE, BATCH_QUEUE)
+
+# 待ち時間の統計に使う直近のタスク数（キューごと）
+_WAITS_SIZE = 200
+
+def _get_enqueued_key(task_id: str) -> str:
+    return f"queues:enqueued:{task_id}"
+
+def get_waits_key(queue: str) -> str:
+    return f"queues:{queue}:waits"
+
+def queue_options(queue: str) -> dict:
+    """apply_asyncに渡すキューと時間の上限（batchはCeleryの既定の上限）"""
+    if queue == INTERACTIVE_QUEUE:
+        return {
+            "queue": queue,
+            "time_limit": settings.INTERACTIVE_TIME_LIMIT,
+            "soft_time_limit": settings.INTERACTIVE_TIME_LIMIT - 30,
+        }
+    return {"queue": queue}
+
+def estimate_cost(nodes: Dict[str, dict], config: dict, describe_mapping: Callable[[Dict[str, str]], dict]) -> dict:
+    """グラフと設定から推論のコストを見積もる（値は読まずにメタデータだけを使う）
+
+    コストは 1回の勾配計算の大きさ（観測行数 + 自由パラメータ数）× 勾配計算の回数
+    （NUTSは (draws + tune) × chains、VIは反復回数）。木の深さは事前に分からないので含めない。
+    describe_mappingはDataService.describe_mapping。
+    """
+    n_rows, plate_sizes = 0, {}
+    for node in nodes.values():
+        if node["node_type"] in ("data", "observed") and node.get("csv_mapping"):
+            try:
+                info = describe_mapping(node["csv_mapping"])
+            except ValueError:
+                continue
+            n_rows = max(n_rows, info["n_rows"])
+            if node["node_type"] == "data" and info.get("n_categories") is not None:
+                plate_sizes[node["code_name"]] = info["n_categories"]
+
+    n_params = 0
+    for node in nodes.values():
+        if node["node_type"] in ("latent", "hyperparameter"):
+            size = 1
+            for dim in parse_shape(node.get("shape")):
+                if isinstance(dim, int):
+                    size *= dim
+                elif dim == OBSERVATION_DIM:
+                    size *= max(n_rows, 1)
+                else:
+                    size *= plate_sizes.get(dim, 1)
+            n_params += size
+
+    if config.get("sampler") == "VI":
+        evaluations = config.get("n_iterations", 10000)
+        rows = config.get("batch_size") or n_rows
+    else:
+        evaluations = (config.get("draws", 2000) + config.get("tune", 1000)) * config.get("chains", 4)
+        rows = n_rows
+    return {"n_params": n_params, "n_rows": n_rows, "cost": float(evaluations * (rows + n_params))}
+
+def route_sample(cost: float) -> str:
+    return INTERACTIVE_QUEUE if cost <= settings.INTERACTIVE_MAX_COST else BATCH_QUEUE
+
+@before_task_publish.connect
+def _record_enqueued(sender=None, headers=None, routing_key=None, **kwargs):
+    """投入（サブタスク・chordの結合タスクを含む）の時刻を記録し、開始時に待ち時間を求める"""
+    if not headers or routing_key not in QUEUES:
+        return
+    try:
+        redis_client.set_json(
+            _get_enqueued_key(headers["id"]), {"queue": routing_key, "at": time.time()}, ex=86400
+        )
+    except Exception as e:
+        logger.warning("Queue stats error", extra={"fields": {"error": repr(e)}})
+
+@task_prerun.connect
+def _record_wait(task_id=None, **kwargs):
+    """ワーカーで開始したタスクの待ち時間を、キューごとの直近の値の一覧に加える"""
+    try:
+        raw = redis_client.client.getdel(_get_enqueued_key(task_id))
+        if raw is None:
+            return
+        enqueued = json.loads(raw)
+        key = get_waits_key(enqueued["queue"])
+        with redis_client.client.pipeline() as pipe:
+            pipe.lpush(key, round(time.time() - enqueued["at"], 3))
+            pipe.ltrim(key, 0, _WAITS_SIZE - 1)
+            pipe.execute()
+    except Exception as e:
+        # 統計の記録に失敗しても推論は止めない
+        logger.warning("Queue stats error", extra={"fields": {"error": repr(e)}})
@@ -0,0 +1,343 @@
+import json
+import os
+import re
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.models.schemas import (
+    ParameterSummary,
+    ResultInfo,
+    ResultSummary,
+    ResultVariable,
+    VariableValues,
+)
+from app.services.plot_service import plot_cache_key, plot_renderer
+from app.services.storage_manager import StorageManager, touch_result
+from app.utils.diagnostics import STAT_NAMES, VERSION as DIAGNOSTICS_VERSION, summarize_chunked
+from app.utils.metrics import metrics
+from app.utils.trace_store import load_coord, load_index, open_variable, read_variable
+
+_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+def parse_isel(specs: List[str]) -> Dict[str, object]:
+    """"dim:start:stop[:step]" / "dim:1,4,7" / "dim:3" 形式の次元指定を解釈"""
+    isel = {}
+    for spec in specs:
+        dim, sep, body = spec.partition(":")
+        try:
+            if not sep or not body:
+                raise ValueError
+            if ":" in body:
+                parts = [int(p) if p else None for p in body.split(":")]
+                isel[dim] = slice(*parts)
+            else:
+                isel[dim] = [int(p) for p in body.split(",")]
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail=f"Invalid isel: {spec}")
+    return isel
+
+def _selected_length(length: int, selection) -> int:
+    if selection is None:
+        return length
+    if isinstance(selection, slice):
+        return len(range(*selection.indices(length)))
+    return len(selection)
+
+def _to_json_values(values: np.ndarray):
+    """NaN/infはJSONで表現できないのでnullにする"""
+    if values.dtype.kind == "f" and not np.isfinite(values).all():
+        values = np.where(np.isfinite(values), values.astype(object), None)
+    return values.tolist()
+
+def _load_or_compute_diagnostics(trace_dir: Path, group: str, name: str) -> Dict[str, np.ndarray]:
+    """変数の診断統計量を結果ディレクトリにキャッシュし、2回目以降はそれを読む"""
+    cache_file = trace_dir.parent / "diagnostics" / f"v{DIAGNOSTICS_VERSION}" / group / f"{name}.npz"
+    if cache_file.exists():
+        metrics.inc("cache_requests_total", cache="diagnostics", outcome="hit")
+        with np.load(cache_file) as cached:
+            return {stat: cached[stat] for stat in STAT_NAMES}
+
+    metrics.inc("cache_requests_total", cache="diagnostics", outcome="miss")
+    stats = summarize_chunked(open_variable(trace_dir, group, name))
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    # 同時に計算された場合に備え、一時ファイルに書いてから置き換える
+    tmp_file = cache_file.with_name(f".{name}.{uuid.uuid4().hex[:8]}.npz")
+    with open(tmp_file, "wb") as f:
+        np.savez(f, **stats)
+    os.replace(tmp_file, cache_file)
+    return stats
+
+def _parameter_label(
+    trace_dir: Path, group: str, name: str, info: dict, flat_index: int, coords_cache: dict
+) -> str:
+    """フラットなインデックスを "theta[school_A,0]" のような表示名に変換"""
+    extra_dims = info["dims"][2:]
+    if not extra_dims:
+        return name
+    position = np.unravel_index(flat_index, info["shape"][2:])
+    labels = []
+    for dim, i in zip(extra_dims, position):
+        key = (group, dim)
+        if key not in coords_cache:
+            coords_cache[key] = load_coord(trace_dir, group, dim)
+        labels.append(str(coords_cache[key][i]))
+    return f"{name}[{','.join(labels)}]"
+
+class ResultService:
+    def __init__(self, session_id: str):
+        if not _ID_PATTERN.match(session_id):
+            raise HTTPException(status_code=400, detail="Invalid session ID")
+        self.session_id = session_id
+        self.results_path = Path(settings.STORAGE_PATH) / session_id / "results"
+
+    def _get_result_dir(self, result_id: str) -> Path:
+        result_dir = self.results_path / result_id
+        if not _ID_PATTERN.match(result_id) or not (result_dir / "meta.json").exists():
+            raise HTTPException(status_code=404, detail="Result not found")
+        return result_dir
+
+    def _load_meta(self, result_id: str) -> dict:
+        with open(self._get_result_dir(result_id) / "meta.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _get_variable_info(self, result_id: str, group: str, name: str) -> dict:
+        index = load_index(self._get_result_dir(result_id) / "trace")
+        info = index["groups"].get(group, {}).get("variables", {}).get(name)
+        if info is None:
+            raise HTTPException(status_code=404, detail=f"Variable {group}/{name} not found")
+        return info
+
+    async def get_info(self, result_id: str) -> ResultInfo:
+        """結果のメタデータと変数一覧（値は読まない）"""
+        meta = self._load_meta(result_id)
+        await touch_result(self.session_id, result_id)
+        index = load_index(self._get_result_dir(result_id) / "trace")
+        variables = [
+            ResultVariable(group=group, name=name, **info)
+            for group, group_index in index["groups"].items()
+            for name, info in group_index["variables"].items()
+        ]
+        return ResultInfo(
+            result_id=result_id,
+            model_id=meta["model_id"],
+            kind=meta.get("kind", "sample"),
+            created_at=meta["created_at"],
+            config=meta.get("config"),
+            backend=meta.get("backend"),
+            backend_fallback=meta.get("backend_fallback"),
+            warm_start=meta.get("warm_start"),
+            vi=meta.get("vi"),
+            segment=meta.get("segment"),
+            segments=meta.get("segments"),
+            variables=variables,
+        )
+
+    async def get_variable(
+        self,
+        result_id: str,
+        name: str,
+        group: str = "posterior",
+        chains: Optional[List[int]] = None,
+        draw_start: Optional[int] = None,
+        draw_stop: Optional[int] = None,
+        thin: int = 1,
+        isel: Optional[Dict[str, object]] = None,
+    ) -> VariableValues:
+        """変数の一部（チェーン・ドロー範囲・間引き・次元の選択）だけを読み込む"""
+        info = self._get_variable_info(result_id, group, name)
+        await touch_result(self.session_id, result_id)
+        dims, shape = info["dims"], info["shape"]
+        isel = dict(isel or {})
+
+        unknown = [d for d in isel if d not in dims or d in ("chain", "draw")]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown dimensions: {unknown}")
+        draws = slice(draw_start, draw_stop, thin)
+
+        selection = dict(isel)
+        if "chain" in dims and chains is not None:
+            if any(c < 0 or c >= shape[dims.index("chain")] for c in chains):
+                raise HTTPException(status_code=400, detail="Invalid chain index")
+            selection["chain"] = chains
+        if "draw" in dims:
+            selection["draw"] = draws
+
+        # 読み込む前に要素数を見積もり、大きすぎる要求は拒否する
+        selected_shape = [_selected_length(n, selection.get(d)) for d, n in zip(dims, shape)]
+        if int(np.prod(selected_shape)) > settings.RESULT_MAX_ELEMENTS:
+            raise HTTPException(
+                status_code=413,
+                detail="Selection is too large; narrow it with chains, thin or isel",
+            )
+
+        trace_dir = self._get_result_dir(result_id) / "trace"
+        try:
+            values = await run_in_threadpool(
+                read_variable, trace_dir, group, name, dims, chains, draws, isel
+            )
+        except IndexError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        coords = {}
+        for dim, length in zip(dims, shape):
+            if dim in ("chain", "draw"):
+                labels = np.arange(length)
+            else:
+                labels = load_coord(trace_dir, group, dim)
+            sel = selection.get(dim)
+            if sel is not None:
+                labels = labels[sel]
+            coords[dim] = labels.tolist()
+
+        return VariableValues(
+            result_id=result_id,
+            group=group,
+            name=name,
+            dims=dims,
+            shape=list(values.shape),
+            coords=coords,
+            values=_to_json_values(values),
+        )
+
+    async def get_summary(
+        self,
+        result_id: str,
+        group: str = "posterior",
+        var_names: Optional[List[str]] = None,
+        sort: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 100,
+    ) -> ResultSummary:
+        """パラメータごとの要約統計量と収束診断（ページング・絞り込み・並べ替え対応）
+
+        統計量は変数ごとに初回だけ計算してキャッシュする。
+        sortは統計量名で、先頭に"-"を付けると降順（例: -r_hat で収束の悪い順）。
+        """
+        meta = self._load_meta(result_id)
+        await touch_result(self.session_id, result_id)
+        trace_dir = self._get_result_dir(result_id) / "trace"
+        variables = load_index(trace_dir)["groups"].get(group, {}).get("variables", {})
+        candidates = {
+            name: info for name, info in variables.items() if info["dims"][:2] == ["chain", "draw"]
+        }
+        if var_names:
+            unknown = [v for v in var_names if v not in candidates]
+            if unknown:
+                raise HTTPException(status_code=404, detail=f"Variables not found: {unknown}")
+            candidates = {name: candidates[name] for name in var_names}
+
+        sort_key, descending = None, False
+        if sort:
+            sort_key, descending = sort.lstrip("-"), sort.startswith("-")
+            if sort_key not in STAT_NAMES:
+                raise HTTPException(status_code=400, detail=f"Unknown sort key: {sort_key}")
+
+        names = list(candidates)
+        per_variable = [
+            await run_in_threadpool(_load_or_compute_diagnostics, trace_dir, group, name)
+            for name in names
+        ]
+        sizes = [len(stats["mean"]) for stats in per_variable]
+        total = sum(sizes)
+        variable_index = np.repeat(np.arange(len(names)), sizes)
+        flat_index = np.concatenate([np.arange(n) for n in sizes]) if sizes else np.zeros(0, dtype=int)
+        table = {
+            stat: np.concatenate([s[stat] for s in per_variable]) if per_variable else np.zeros(0)
+            for stat in STAT_NAMES
+        }
+
+        order = np.arange(total)
+        if sort_key:
+            # NaNは昇順・降順どちらでも末尾に置く
+            column = table[sort_key]
+            key = np.where(np.isnan(column), np.inf, -column if descending else column)
+            order = np.argsort(key, kind="stable")
+
+        page = order[offset:offset + limit]
+        coords_cache = {}
+        parameters = []
+        for i in page:
+            name = names[variable_index[i]]
+            row = {stat: table[stat][i] for stat in STAT_NAMES}
+            parameters.append(
+                ParameterSummary(
+                    name=_parameter_label(
+                        trace_dir, group, name, candidates[name], int(flat_index[i]), coords_cache
+                    ),
+                    variable=name,
+                    **{stat: (None if not np.isfinite(v) else float(v)) for stat, v in row.items()},
+                )
+            )
+
+        return ResultSummary(
+            result_id=result_id,
+            model_id=meta["model_id"],
+            total=total,
+            offset=offset,
+            limit=limit,
+            parameters=parameters,
+        )
+
+    async def get_plot(
+        self,
+        result_id: str,
+        kind: str,
+        var_names: Optional[List[str]] = None,
+        thin: int = 1,
+        width: float = 12,
+        height: Optional[float] = None,
+        dpi: int = 100,
+    ) -> Path:
+        """プロット画像を取得（初回のみ描画し、以降はキャッシュを返す）
+
+        var_namesを省略した場合は、事後分布の変数を先頭から上限の要素数まで選ぶ。
+        """
+        trace_dir = self._get_result_dir(result_id) / "trace"
+        await touch_result(self.session_id, result_id)
+        variables = load_index(trace_dir)["groups"].get("posterior", {}).get("variables", {})
+        sizes = {
+            name: int(np.prod(info["shape"][2:], dtype=int))
+            for name, info in variables.items()
+            if info["dims"][:2] == ["chain", "draw"]
+        }
+
+        if var_names:
+            unknown = [v for v in var_names if v not in sizes]
+            if unknown:
+                raise HTTPException(status_code=404, detail=f"Variables not found: {unknown}")
+        else:
+            var_names, total = [], 0
+            for name, size in sizes.items():
+                if total + size <= settings.PLOT_MAX_ELEMENTS:
+                    var_names.append(name)
+                    total += size
+            if not var_names:
+                raise HTTPException(status_code=400, detail="Specify var_names to plot")
+
+        if sum(sizes[v] for v in var_names) > settings.PLOT_MAX_ELEMENTS:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Too many parameters to plot (max {settings.PLOT_MAX_ELEMENTS})",
+            )
+
+        if height is None:
+            # 変数の数に合わせて高さを決める
+            if kind == "trace":
+                height = 2.0 * len(var_names)
+            else:
+                height = 1.0 + 0.3 * sum(sizes[v] for v in var_names)
+        params = {"var_names": var_names, "thin": thin, "width": width, "height": height, "dpi": dpi}
+        out_file = trace_dir.parent / "plots" / f"{kind}_{plot_cache_key(result_id, kind, params)}.png"
+        if out_file.exists():
+            metrics.inc("cache_requests_total", cache="plot", outcome="hit")
+            return out_file
+        metrics.inc("cache_requests_total", cache="plot", outcome="miss")
+        with metrics.timer("inference_phase_duration_seconds", phase="plot"):
+            await plot_renderer.render(out_file, kind, trace_dir, params)
+        # 描画した画像の分だけ結果の使用量を記録し直す
+        await run_in_threadpool(StorageManager(self.session_id).refresh, "result", result_id)
+        return out_file
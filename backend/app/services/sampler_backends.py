@@ -0,0 +1,47 @@
+import importlib.util
+import os
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+# NUTSの実行系。pymc以外はPyMCがモデルを渡して実行するコンパイル済みサンプラーで、
+# ワーカーにパッケージが入っていない場合やモデルが扱えない場合はpymcで実行する。
+BACKENDS = ("pymc", "nutpie", "numpyro")
+
+# バックエンド → 必要なパッケージ
+_REQUIREMENTS: Dict[str, Tuple[str, ...]] = {
+    "pymc": (),
+    "nutpie": ("nutpie",),
+    "numpyro": ("numpyro", "jax"),
+}
+
+# JAXはGPUがあっても使わない（ワーカーはCPUのみを前提にする）
+os.environ.setdefault("JAX_PLATFORMS", "cpu")
+
+@lru_cache(maxsize=None)
+def is_installed(backend: str) -> bool:
+    """バックエンドに必要なパッケージがこのプロセスでimportできるか"""
+    return all(importlib.util.find_spec(name) is not None for name in _REQUIREMENTS[backend])
+
+def available_backends() -> Dict[str, bool]:
+    """バックエンドごとの利用可否"""
+    return {backend: is_installed(backend) for backend in BACKENDS}
+
+def resolve_backend(requested: str, model) -> Tuple[str, Optional[str]]:
+    """実際に使うバックエンドと、pymcに切り替えた場合はその理由を返す"""
+    if requested == "pymc":
+        return "pymc", None
+    if requested not in _REQUIREMENTS:
+        return "pymc", f"Unknown backend '{requested}'"
+    if not is_installed(requested):
+        return "pymc", f"Backend '{requested}' is not installed"
+    # 外部のサンプラーはNUTSだけで全変数を更新できるモデル（離散の潜在変数なし）に限る
+    if model.discrete_value_vars:
+        return "pymc", f"Backend '{requested}' does not support discrete latent variables"
+    return requested, None
+
+def sampler_kwargs(backend: str) -> dict:
+    """pm.sample(nuts_sampler=backend) に渡す追加の引数"""
+    if backend == "numpyro":
+        # CPUのデバイスは1つなので、チェーンはpmapではなくvmapでまとめて進める
+        return {"chain_method": "vectorized"}
+    return {}
@@ -0,0 +1,143 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from fastapi import HTTPException
+from app.services.data_service import DataService
+from app.services.minibatch import open_node_columns
+from app.services.model_builder import OBSERVATION_DIM, GraphError, load_node_data, load_plates
+from app.utils.diagnostics import summarize
+
+# 同じグラフをセグメント（市場・顧客層など）ごとのデータで当てはめる一括実行。
+# セグメントは分割列（partition_column）のカテゴリ値ごとの行、または
+# data_idsのデータそれぞれ。モデルは1度だけ構築し、セグメントごとに
+# pm.Dataの値と次元の長さを差し替える。
+
+# 要約表に書く統計量（ParameterSummaryのフィールド名。diagnostics.STAT_NAMESと同じ順）
+SUMMARY_STATS = (
+    ("mean", "mean"),
+    ("sd", "sd"),
+    ("hdi_low", "hdi_3%"),
+    ("hdi_high", "hdi_97%"),
+    ("mcse_mean", "mcse_mean"),
+    ("mcse_sd", "mcse_sd"),
+    ("ess_bulk", "ess_bulk"),
+    ("ess_tail", "ess_tail"),
+    ("r_hat", "r_hat"),
+)
+
+def _shared_data_id(nodes: Dict[str, dict]) -> str:
+    data_ids = {
+        node["csv_mapping"].get("data_id")
+        for node in nodes.values()
+        if node["node_type"] in ("data", "observed") and node.get("csv_mapping")
+    }
+    if len(data_ids) != 1:
+        raise GraphError("Partitioning requires all mapped nodes to use the same data")
+    return data_ids.pop()
+
+def segment_names(session_id: str, nodes: Dict[str, dict], config: dict) -> List[str]:
+    """セグメント名の一覧（data_idsならそのまま、分割列ならそのカテゴリ値）
+
+    値は読まずにメタデータだけから求める（APIから呼べる）。分割列が
+    カテゴリ列でなければGraphError。
+    """
+    if config.get("data_ids"):
+        return list(config["data_ids"])
+    column = config["partition_column"]
+    data_id = _shared_data_id(nodes)
+    try:
+        categories = DataService(session_id).load_mapped_categories({"data_id": data_id, "column": column})
+    except HTTPException:
+        raise GraphError(f"Data {data_id} not found")
+    if categories is None:
+        raise GraphError(f"Partition column {column} is not a categorical column of {data_id}")
+    return categories
+
+class SegmentSource:
+    """セグメントの一覧と、各セグメントのデータ（load_node_dataと同じ形式）"""
+
+    def __init__(self, session_id: str, nodes: Dict[str, dict], config: dict):
+        self.session_id = session_id
+        self.nodes = nodes
+        self.data_ids: Optional[List[str]] = config.get("data_ids")
+        self.names = segment_names(session_id, nodes, config)
+        if self.data_ids:
+            return
+
+        # 分割列のコード（欠損は-1でどのセグメントにも入らない）と、各ノードの列のメモリマップ
+        column = config["partition_column"]
+        service = DataService(session_id)
+        self._codes = np.asarray(service.open_columns(_shared_data_id(nodes), [column])[column])
+        self._columns = open_node_columns(session_id, nodes)
+        self._plates = load_plates(session_id, nodes)
+
+    def load(self, index: int) -> Tuple[Dict[str, np.ndarray], Dict[str, List[str]]]:
+        """セグメントのデータとプレート（カテゴリ値一覧）を返す"""
+        if self.data_ids:
+            # データノード・観測変数ノードの列を同じ名前のままこのデータに付け替える
+            nodes = {
+                node_id: {**node, "csv_mapping": {**node["csv_mapping"], "data_id": self.data_ids[index]}}
+                if node.get("csv_mapping") else node
+                for node_id, node in self.nodes.items()
+            }
+            return load_node_data(self.session_id, nodes), load_plates(self.session_id, nodes)
+
+        rows = np.flatnonzero(self._codes == index)
+        data = {}
+        for node_id, node_columns in self._columns.items():
+            values = [np.asarray(c[rows]) for c in node_columns]
+            data[node_id] = values[0] if len(values) == 1 else np.column_stack(values)
+        return data, self._plates
+
+def _labels(posterior, name: str) -> List[str]:
+    """変数の要素ごとの表示名（"theta[school_A,0]" の形式）"""
+    var = posterior[name]
+    extra_dims = var.dims[2:]
+    if not extra_dims:
+        return [name]
+    coords = [posterior[dim].values for dim in extra_dims]
+    return [
+        f"{name}[{','.join(str(c[i]) for c, i in zip(coords, position))}]"
+        for position in np.ndindex(*var.shape[2:])
+    ]
+
+def summarize_posterior(idata) -> Tuple[List[str], Dict[str, np.ndarray]]:
+    """事後分布のパラメータの要約統計量 (表示名, {統計量: 値}) を求める
+
+    行単位の変数（n_observationsの次元を持つ決定論的変数）はセグメント間で
+    対応しないので含めない。
+    """
+    posterior = idata.posterior
+    labels, arrays = [], []
+    for name, var in posterior.data_vars.items():
+        if OBSERVATION_DIM in var.dims:
+            continue
+        values = posterior[name].values
+        labels.extend(_labels(posterior, name))
+        arrays.append(values.reshape(values.shape[:2] + (-1,)))
+    if not arrays:
+        return [], {field: np.zeros(0) for field, _ in SUMMARY_STATS}
+    stats = summarize(np.concatenate(arrays, axis=2))
+    return labels, {field: stats[stat] for field, stat in SUMMARY_STATS}
+
+def summary_table(
+    summaries: Sequence[Optional[Tuple[List[str], Dict[str, np.ndarray]]]]
+) -> Tuple[List[str], Dict[str, np.ndarray]]:
+    """セグメントごとの要約を (セグメント, パラメータ) の表にまとめる
+
+    パラメータは初めて現れた順に並べ、そのセグメントにないもの（失敗したセグメントや
+    プレートのカテゴリが異なる場合）はNaNにする。
+    """
+    parameters: Dict[str, int] = {}
+    for summary in summaries:
+        if summary is not None:
+            for label in summary[0]:
+                parameters.setdefault(label, len(parameters))
+
+    table = {field: np.full((len(summaries), len(parameters)), np.nan) for field, _ in SUMMARY_STATS}
+    for row, summary in enumerate(summaries):
+        if summary is None:
+            continue
+        columns = [parameters[label] for label in summary[0]]
+        for field, _ in SUMMARY_STATS:
+            table[field][row, columns] = summary[1][field]
+    return list(parameters), table
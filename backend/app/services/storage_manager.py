@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import os
+import re
+import shutil
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.models.schemas import StorageStatus
+from app.utils.redis_client import async_redis_client, redis_client
+
+logger = logging.getLogger(__name__)
+
+# セッションごとのストレージ（STORAGE_PATH/{session_id}/ 以下のデータ・結果）の管理。
+# 全セッションの最終アクセス時刻と使用バイト数を1つの索引（ソート済み集合とハッシュ）で持ち、
+# 期限（SESSION_TIMEOUT）を過ぎたセッションのファイルとRedisのキーをスイーパーがまとめて消す。
+# セッションのキー（sessions:{session_id}:*）にキーごとのTTLを付け直す代わりに、
+# リクエストごとに最終アクセス時刻を1回だけ更新する。
+
+_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+# セッションID → 最終アクセス時刻（ソート済み集合）/ セッションID → 使用バイト数（ハッシュ）
+ACTIVITY_KEY = "storage:sessions"
+USAGE_KEY = "storage:usage"
+_SWEEP_LOCK_KEY = "storage:sweep:lock"
+
+# 項目（"data:<data_id>" / "result:<result_id>"）のバイト数を記録し、セッションの使用量に差分を足す。
+# KEYS: items, usage, activity / ARGV: session_id, 項目, バイト数（0なら削除）, 時刻（空なら更新しない）
+_RECORD_SCRIPT = """
+local old = tonumber(redis.call('HGET', KEYS[1], ARGV[2]) or '0')
+local new = tonumber(ARGV[3])
+if new > 0 then
+    redis.call('HSET', KEYS[1], ARGV[2], new)
+else
+    redis.call('HDEL', KEYS[1], ARGV[2])
+end
+local total = redis.call('HINCRBY', KEYS[2], ARGV[1], new - old)
+if ARGV[4] ~= '' then
+    redis.call('ZADD', KEYS[3], ARGV[4], ARGV[1])
+end
+return total
+"""
+
+# 最終アクセスが期限より前のままなら索引から外す（スイーパーが削除を始める前の確認）
+# KEYS: activity, usage / ARGV: session_id, 期限の時刻
+_CLAIM_SCRIPT = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if score and tonumber(score) <= tonumber(ARGV[2]) then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('HDEL', KEYS[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+class StorageQuotaExceeded(Exception):
+    """古い結果を消してもセッションの容量の上限に収まらない"""
+
+def get_items_key(session_id: str) -> str:
+    # Hash: "data:<data_id>" / "result:<result_id>" → バイト数
+    return f"sessions:{session_id}:storage:items"
+
+def get_lru_key(session_id: str) -> str:
+    # Sorted Set: result_id → 最終アクセス時刻（容量を超えたら古いものから消す）
+    return f"sessions:{session_id}:storage:lru"
+
+def get_session_dir(session_id: str) -> Path:
+    return Path(settings.STORAGE_PATH) / session_id
+
+def dir_size(path: Path) -> int:
+    """ディレクトリ以下のファイルの合計バイト数"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.stat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                continue
+    return total
+
+async def touch_session(session_id: str):
+    """セッションの最終アクセス時刻を更新する（リクエストごとに1回、期限の延長）"""
+    if _ID_PATTERN.match(session_id):
+        await async_redis_client.client.zadd(ACTIVITY_KEY, {session_id: time.time()})
+
+async def touch_result(session_id: str, result_id: str):
+    """結果の最終アクセス時刻を更新する（記録済みの結果だけ）"""
+    await async_redis_client.client.zadd(get_lru_key(session_id), {result_id: time.time()}, xx=True)
+
+class StorageManager:
+    """セッションのデータ・結果のバイト数の記録と、容量の上限の適用（ワーカー・APIの両方から同期で使う）"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.session_dir = get_session_dir(session_id)
+
+    def _path(self, kind: str, item_id: str) -> Path:
+        return self.session_dir / ("data" if kind == "data" else "results") / item_id
+
+    def _record(self, kind: str, item_id: str, size: int, touch: bool = True) -> int:
+        return int(redis_client.client.eval(
+            _RECORD_SCRIPT,
+            3,
+            get_items_key(self.session_id),
+            USAGE_KEY,
+            ACTIVITY_KEY,
+            self.session_id,
+            f"{kind}:{item_id}",
+            size,
+            time.time() if touch else "",
+        ))
+
+    def usage(self) -> int:
+        return int(redis_client.client.hget(USAGE_KEY, self.session_id) or 0)
+
+    def items(self) -> Dict[str, int]:
+        return {k: int(v) for k, v in redis_client.client.hgetall(get_items_key(self.session_id)).items()}
+
+    def available_bytes(self) -> int:
+        """結果を全て消した場合に新しいデータに使えるバイト数（アップロードの上限に使う）"""
+        data_bytes = sum(size for item, size in self.items().items() if item.startswith("data:"))
+        return max(settings.SESSION_STORAGE_QUOTA - data_bytes, 0)
+
+    def add(self, kind: str, item_id: str) -> int:
+        """書き終えたデータ（kind="data"）・結果（"result"）のバイト数を記録し、容量の上限を適用する
+
+        上限を超えたら、この項目以外の結果を最終アクセスの古い順に消す。他の結果を
+        全て消しても収まらない場合は、何も消さずにこの項目を消してStorageQuotaExceeded。
+        """
+        size = dir_size(self._path(kind, item_id))
+        total = self._record(kind, item_id, size)
+        if kind == "result":
+            redis_client.client.zadd(get_lru_key(self.session_id), {item_id: time.time()})
+
+        if total > settings.SESSION_STORAGE_QUOTA:
+            data_bytes = sum(v for item, v in self.items().items() if item.startswith("data:"))
+            if data_bytes + (size if kind == "result" else 0) <= settings.SESSION_STORAGE_QUOTA:
+                total = self._evict(total, keep=item_id if kind == "result" else None)
+        if total > settings.SESSION_STORAGE_QUOTA:
+            self.remove(kind, item_id)
+            raise StorageQuotaExceeded(
+                f"Session storage quota exceeded ({settings.SESSION_STORAGE_QUOTA} bytes)"
+            )
+        return total
+
+    def refresh(self, kind: str, item_id: str) -> int:
+        """書き足した項目（描画済みのプロットなど）のバイト数を記録し直す（上限は適用しない）"""
+        return self._record(kind, item_id, dir_size(self._path(kind, item_id)))
+
+    def remove(self, kind: str, item_id: str):
+        """項目のファイルと記録を消す"""
+        shutil.rmtree(self._path(kind, item_id), ignore_errors=True)
+        self._record(kind, item_id, 0, touch=False)
+        if kind == "result":
+            redis_client.client.zrem(get_lru_key(self.session_id), item_id)
+
+    def _evict(self, total: int, keep: Optional[str] = None) -> int:
+        """上限に収まるまで結果を最終アクセスの古い順に消し、残りの使用量を返す"""
+        for result_id in redis_client.client.zrange(get_lru_key(self.session_id), 0, -1):
+            if total <= settings.SESSION_STORAGE_QUOTA:
+                break
+            if result_id == keep:
+                continue
+            self.remove("result", result_id)
+            total = self.usage()
+            logger.info(
+                "Evicted result (storage quota)",
+                extra={"fields": {"session_id": self.session_id, "result_id": result_id}},
+            )
+        return total
+
+    async def get_status(self) -> StorageStatus:
+        """セッションの使用量・上限と、期限（最終アクセス + SESSION_TIMEOUT）"""
+        async with async_redis_client.pipeline(transaction=False) as pipe:
+            pipe.hgetall(get_items_key(self.session_id))
+            pipe.zscore(ACTIVITY_KEY, self.session_id)
+            items, last_activity = await pipe.execute()
+        data = [int(v) for k, v in items.items() if k.startswith("data:")]
+        results = [int(v) for k, v in items.items() if k.startswith("result:")]
+        return StorageStatus(
+            used_bytes=sum(data) + sum(results),
+            quota_bytes=settings.SESSION_STORAGE_QUOTA,
+            data_bytes=sum(data),
+            result_bytes=sum(results),
+            n_data=len(data),
+            n_results=len(results),
+            last_activity=datetime.fromtimestamp(last_activity) if last_activity else None,
+            expires_at=(
+                datetime.fromtimestamp(last_activity + settings.SESSION_TIMEOUT) if last_activity else None
+            ),
+        )
+
+def _delete_session_keys(session_ids: List[str]) -> int:
+    """セッションのRedisのキーを、キー空間を1回走査してまとめて消す"""
+    targets = set(session_ids)
+    deleted, batch = 0, []
+    for key in redis_client.client.scan_iter(match="sessions:*", count=1000):
+        if key.split(":", 2)[1] in targets:
+            batch.append(key)
+        if len(batch) >= 500:
+            deleted += redis_client.client.unlink(*batch)
+            batch = []
+    if batch:
+        deleted += redis_client.client.unlink(*batch)
+    return deleted
+
+def _sweep_directories(cutoff: float, limit: int) -> Dict[str, int]:
+    """索引にないセッションのディレクトリ（索引の導入前の分など）と、中断したタスクの一時ディレクトリを消す"""
+    stats = {"orphans": 0, "tmp": 0}
+    root = Path(settings.STORAGE_PATH)
+    if not root.exists():
+        return stats
+    for session_dir in root.iterdir():
+        # .pytensor（共有のコンパイル結果）などセッション以外のディレクトリは対象外
+        if not session_dir.is_dir() or not _ID_PATTERN.match(session_dir.name):
+            continue
+        if redis_client.client.zscore(ACTIVITY_KEY, session_dir.name) is None:
+            if stats["orphans"] < limit and session_dir.stat().st_mtime < cutoff:
+                shutil.rmtree(session_dir, ignore_errors=True)
+                stats["orphans"] += 1
+            continue
+        tmp_dir = session_dir / "tmp"
+        if tmp_dir.exists():
+            for task_dir in tmp_dir.iterdir():
+                if task_dir.stat().st_mtime < cutoff:
+                    shutil.rmtree(task_dir, ignore_errors=True)
+                    stats["tmp"] += 1
+    return stats
+
+def sweep(batch_size: Optional[int] = None) -> Dict[str, int]:
+    """期限を過ぎたセッションのファイルとRedisのキーを、batch_sizeセッションずつ消す"""
+    batch_size = batch_size or settings.STORAGE_SWEEP_BATCH
+    cutoff = time.time() - settings.SESSION_TIMEOUT
+    stats = {"sessions": 0, "keys": 0}
+    while True:
+        candidates = redis_client.client.zrangebyscore(ACTIVITY_KEY, 0, cutoff, start=0, num=batch_size)
+        claimed = [
+            session_id for session_id in candidates
+            if redis_client.client.eval(_CLAIM_SCRIPT, 2, ACTIVITY_KEY, USAGE_KEY, session_id, cutoff)
+        ]
+        if claimed:
+            stats["keys"] += _delete_session_keys(claimed)
+            for session_id in claimed:
+                shutil.rmtree(get_session_dir(session_id), ignore_errors=True)
+            stats["sessions"] += len(claimed)
+        if len(candidates) < batch_size:
+            break
+    stats.update(_sweep_directories(cutoff, batch_size))
+    return stats
+
+async def run_sweeper():
+    """APIプロセスで定期的にスイーパーを実行する（複数のプロセスのうち1つだけが実行する）"""
+    while True:
+        await asyncio.sleep(settings.STORAGE_SWEEP_INTERVAL)
+        try:
+            acquired = await async_redis_client.client.set(
+                _SWEEP_LOCK_KEY, os.getpid(), nx=True, ex=settings.STORAGE_SWEEP_INTERVAL
+            )
+            if acquired:
+                stats = await run_in_threadpool(sweep)
+                if any(stats.values()):
+                    logger.info("Storage sweep", extra={"fields": stats})
+        except Exception as e:
+            # 次の周期で再試行する
+            logger.warning("Storage sweep error", extra={"fields": {"error": repr(e)}})
@@ -1,13 +1,951 @@
+import json
+import logging
+import shutil
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+from celery import chord
+from celery.exceptions import SoftTimeLimitExceeded
 from app.celery_app import celery_app
+from app.config import settings
+from app.services.ancestral_sampler import UnsupportedGraph, check_supported, sample_prior_predictive
+from app.services.graph_hash import compute_data_layout, compute_graph_hash, compute_structure_hash
+from app.services.data_service import DataService
+from app.services.minibatch import (
+    MinibatchStream,
+    iter_row_chunks,
+    open_node_columns,
+    open_prediction_columns,
+    row_count,
+)
+from app.services.model_builder import (
+    OBSERVATION_DIM,
+    GraphError,
+    build_pymc_model,
+    data_variable_name,
+    load_graph,
+    load_node_data,
+    load_plates,
+    model_coords,
+    observation_count,
+)
+from app.services.model_cache import model_cache
+from app.services.progress import ProgressReporter
+from app.services.sampler_backends import resolve_backend, sampler_kwargs
+from app.services.segments import SUMMARY_STATS, SegmentSource, summarize_posterior, summary_table
+from app.services.storage_manager import StorageManager
+from app.services.warm_start import (
+    ADAPTATION_FILE,
+    AdaptationRecorder,
+    combine_states,
+    find_warm_start,
+    read_state,
+    save_warm_start,
+    write_state,
+)
+from app.utils.metrics import metrics
+from app.utils.redis_client import redis_client
+from app.utils.trace_store import StoreWriter, concat_stores, to_inference_data, write_groups, write_idata
+
+logger = logging.getLogger(__name__)
+
+class MemoizedTask(celery_app.Task):
+    """完了時に同一条件の推論結果を記録するタスク
+
+    API側でリクエストキー（グラフ・データ・設定・シードのハッシュ）を
+    kwargsのmemo_keyとして渡す。成功したらresult_idを記録し、失敗したら
+    実行中の印を消して再投入できるようにする。
+    """
+
+    def on_success(self, retval, task_id, args, kwargs):
+        memo_key = kwargs.get("memo_key")
+        if memo_key and isinstance(retval, dict) and retval.get("result_id"):
+            redis_client.set_json(
+                memo_key,
+                {"status": "completed", "task_id": task_id, "result_id": retval["result_id"]},
+                ex=86400,
+            )
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        memo_key = kwargs.get("memo_key")
+        if memo_key:
+            memo = redis_client.get_json(memo_key)
+            if memo and memo.get("task_id") == task_id:
+                redis_client.delete(memo_key)
+
+def _get_result_dir(session_id: str, result_id: str) -> Path:
+    return Path(settings.STORAGE_PATH) / session_id / "results" / result_id
+
+def _get_chain_progress_key(session_id: str, task_id: str) -> str:
+    return f"sessions:{session_id}:tasks:{task_id}:chains"
+
+def _get_segment_progress_key(session_id: str, task_id: str) -> str:
+    return f"sessions:{session_id}:tasks:{task_id}:segments"
+
+def _chain_seeds(random_seed, chains: int) -> List[int]:
+    """チェーンごとのシード（サブタスクに分けた場合も、同じrandom_seedなら同じ値になる）"""
+    if isinstance(random_seed, (list, tuple)):
+        return [int(s) for s in random_seed]
+    return [int(s) for s in np.random.SeedSequence(random_seed).generate_state(chains)]
+
+def _sample_nuts(
+    entry,
+    config: dict,
+    chains: int,
+    random_seed,
+    callback=None,
+    backend: str = "pymc",
+    warm=None,
+    first_chain: int = 0,
+):
+    """キャッシュ済みのNUTSステップでサンプリング
+
+    backendがpymc以外ならPyMC経由で外部のサンプラー（nutpie / numpyro）に渡す。
+    その場合はドローごとのcallbackは呼ばれない。warm（前回の調整結果）を渡すと、
+    そのステップサイズ・質量行列から調整を始め、各チェーンを前回の最後のドローから始める。
+    渡さなければPyMCの既定（jitter+adapt_diag）と同じく、チェーンごとにゆらぎを加えた初期値から始める。
+    """
+    import pymc as pm
+
+    target_accept = config.get("target_accept", 0.8)
+    if backend != "pymc":
+        step = entry.get_nuts_step(target_accept, warm)
+        with entry.model:
+            # stepを渡すとPyMC側でのNUTSの再コンパイルを省ける（チェーンは外部のサンプラーが管理）
+            return pm.sample(
+                draws=config.get("draws", 2000),
+                tune=config.get("tune", 1000),
+                chains=chains,
+                step=step,
+                target_accept=target_accept,
+                random_seed=random_seed,
+                progressbar=False,
+                nuts_sampler=backend,
+                nuts_sampler_kwargs=sampler_kwargs(backend),
+            )
+
+    seeds = _chain_seeds(random_seed, chains)
+    if warm is not None:
+        initvals = warm.initvals(range(first_chain, first_chain + chains))
+        step = entry.get_nuts_step(target_accept, warm)
+    else:
+        # stepを渡したpm.sampleは初期値にゆらぎを加えないので、同じ方法で作って渡す
+        initvals = entry.jittered_initial_points(seeds)
+        step = entry.get_nuts_step(target_accept, initial_points=initvals)
+    with entry.model:
+        # Celeryのpreforkワーカー内では子プロセスを作れないため、チェーンは逐次実行
+        return pm.sample(
+            draws=config.get("draws", 2000),
+            tune=config.get("tune", 1000),
+            chains=chains,
+            cores=1,
+            step=step,
+            initvals=initvals,
+            random_seed=seeds,
+            progressbar=False,
+            callback=callback,
+        )
+
+def _find_warm_start(session_id: str, entry, config: dict):
+    """warm_startの指定があれば前回の調整結果を探し、(WarmStart, 調整ドロー数, 報告用の情報)を返す"""
+    tune = config.get("tune", 1000)
+    if not config.get("warm_start"):
+        return None, tune, None
+    warm = find_warm_start(session_id, entry.structure_hash, entry.model)
+    if warm is not None:
+        tune = min(tune, config.get("warm_start_tune", 200))
+    info = {
+        "source_result_id": warm.source_result_id if warm else None,
+        "tune": tune,
+        "tune_saved": config.get("tune", 1000) - tune,  # チェーンあたりの省けた調整ドロー数
+    }
+    return warm, tune, info
+
+def _recording_callback(entry, callback):
+    """callbackに加えて調整結果を集計するcallbackと、その集計器を返す"""
+    recorder = AdaptationRecorder(entry.model)
+
+    def record(trace, draw):
+        callback(trace, draw)
+        recorder.callback(trace, draw)
+
+    return record, recorder
+
+def _model_hashes(nodes: Dict[str, dict], edges: Dict[str, dict], plates: Dict[str, List[str]]):
+    """モデルのキャッシュキー（グラフのハッシュ）と、パラメータの値を除いた構造のハッシュ"""
+    graph_hash = compute_graph_hash(nodes, edges)
+    structure_hash = compute_structure_hash(nodes, edges)
+    if plates:
+        # どのデータノードがプレートになるかでモデルの構造が変わる
+        graph_hash = f"{graph_hash}:{','.join(sorted(plates))}"
+        structure_hash = f"{structure_hash}:{','.join(sorted(plates))}"
+    return graph_hash, structure_hash
+
+def _get_or_build_model(graph_hash: str, structure_hash: str, nodes, edges, data, plates, **options):
+    """キャッシュ済みのモデルを取得（なければ構築）してデータを設定
+
+    キャッシュキーにはデータの列数と型を加える（対応付けを変えると同じグラフでも別のモデルになる）。
+    """
+    layout = compute_data_layout(nodes, data)
+    graph_hash, structure_hash = f"{graph_hash}:{layout}", f"{structure_hash}:{layout}"
+
+    def build():
+        with metrics.timer("inference_phase_duration_seconds", phase="build"):
+            return build_pymc_model(nodes, edges, data, plates, **options)
+
+    entry, cache_hit = model_cache.get_or_build(graph_hash, build)
+    if cache_hit:
+        # 構造が同じなのでpm.Dataの値と次元の長さ（行数・グループ数）だけ差し替える
+        named_data = {data_variable_name(nodes[node_id]): v for node_id, v in data.items()}
+        try:
+            with metrics.timer("inference_phase_duration_seconds", phase="set_data"):
+                entry.set_data(named_data, model_coords(data, plates))
+        except (ValueError, TypeError) as e:
+            # キーで区別できない違いで差し替えられなかった場合は、破棄して作り直す
+            logger.warning(
+                "Cached model rejected data, rebuilding",
+                extra={"fields": {"graph_hash": graph_hash, "error": repr(e)}},
+            )
+            model_cache.discard(graph_hash)
+            entry, cache_hit = model_cache.get_or_build(graph_hash, build)
+    entry.structure_hash = structure_hash
+    return entry, cache_hit
+
+def _prepare_model(session_id: str, model_id: str):
+    """グラフを読み込み、キャッシュ済みのモデルを取得（なければ構築）してデータを設定"""
+    nodes, edges = load_graph(session_id, model_id)
+    if not nodes:
+        raise GraphError("Model has no nodes")
+
+    data = load_node_data(session_id, nodes)
+    plates = load_plates(session_id, nodes)
+    graph_hash, structure_hash = _model_hashes(nodes, edges, plates)
+    return _get_or_build_model(graph_hash, structure_hash, nodes, edges, data, plates)
+
+def _prepare_minibatch_model(session_id: str, model_id: str, batch_size: int, random_seed):
+    """ミニバッチADVI用のモデル（観測変数の対数尤度を全行数に合わせて拡大）と、ミニバッチの供給元
+
+    モデルは最初のミニバッチで構築し、以降はpm.set_dataで差し替える。
+    拡大率の分子（全行数）はモデルに埋め込まれるため、キャッシュキーに含める。
+    """
+    nodes, edges = load_graph(session_id, model_id)
+    if not nodes:
+        raise GraphError("Model has no nodes")
+
+    stream = MinibatchStream(open_node_columns(session_id, nodes), batch_size, random_seed)
+    batch = stream.next()
+    plates = load_plates(session_id, nodes)
+    graph_hash, structure_hash = _model_hashes(nodes, edges, plates)
+    entry, cache_hit = _get_or_build_model(
+        f"{graph_hash}:minibatch:{stream.n_rows}",
+        structure_hash,
+        nodes,
+        edges,
+        batch,
+        plates,
+        total_size=stream.n_rows,
+    )
+
+    def next_batch() -> Dict[str, np.ndarray]:
+        return {data_variable_name(nodes[node_id]): v for node_id, v in stream.next().items()}
+
+    return entry, cache_hit, stream, next_batch
+
+def _fit_advi(entry, config: dict, random_seed, next_batch=None, on_iteration=None):
+    """ADVIで近似事後分布を求める
+
+    next_batchを渡すと、反復ごとにその返すミニバッチをpm.set_dataで差し替える。
+    convergence_toleranceを指定すると、convergence_every回ごとにパラメータの
+    相対変化を調べ、下回ったら打ち切る。返り値は (近似分布, 実行情報)。
+    """
+    import pymc as pm
+
+    callbacks = []
+    if next_batch is not None:
+        callbacks.append(lambda approx, losses, i: pm.set_data(next_batch(), model=entry.model))
+    if on_iteration is not None:
+        callbacks.append(lambda approx, losses, i: on_iteration(i))
+    tolerance = config.get("convergence_tolerance")
+    if tolerance is not None:
+        callbacks.append(
+            pm.callbacks.CheckParametersConvergence(
+                every=config.get("convergence_every", 100), tolerance=tolerance, diff="relative"
+            )
+        )
+
+    n_iterations = config.get("n_iterations", 10000)
+    with entry.model, metrics.timer("inference_phase_duration_seconds", phase="fit"):
+        approx = pm.fit(
+            n=n_iterations,
+            method="advi",
+            random_seed=random_seed,
+            progressbar=False,
+            callbacks=callbacks,
+        )
+    losses = np.asarray(approx.hist)
+    tail = losses[-min(len(losses), 100):]
+    return approx, {
+        "iterations": int(len(losses)),
+        "converged": tolerance is not None and len(losses) < n_iterations,
+        "final_loss": float(np.mean(tail)) if len(tail) else None,
+    }
+
+def _drop_row_variables(idata):
+    """ミニバッチの行に対応する変数（行単位の決定論的変数・観測値）を近似事後分布の結果から除く"""
+    posterior = idata.posterior
+    row_vars = [name for name, var in posterior.data_vars.items() if OBSERVATION_DIM in var.dims]
+    idata.posterior = posterior.drop_vars(row_vars)
+    for group in ("observed_data", "constant_data"):
+        if group in idata.groups():
+            delattr(idata, group)
+    return idata
+
+def _save_result(session_id: str, model_id: str, idata, meta: dict, write_trace=None) -> str:
+    """推論結果を変数ごとのバイナリ形式（trace/）で保存してresult_idを返す
+
+    write_trace(trace_dir)を渡した場合はidataの代わりにそれでトレースを書き込む。
+    """
+    with metrics.timer("inference_phase_duration_seconds", phase="save"):
+        result_id = f"res_{uuid.uuid4().hex[:8]}"
+        result_dir = _get_result_dir(session_id, result_id)
+        result_dir.mkdir(parents=True, exist_ok=True)
+
+        if write_trace is not None:
+            write_trace(result_dir / "trace")
+        else:
+            write_idata(idata, result_dir / "trace")
+        # meta.jsonは最後に書く（存在すれば結果が揃っている）
+        with open(result_dir / "meta.json", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "result_id": result_id,
+                    "model_id": model_id,
+                    "created_at": datetime.now().isoformat(),
+                    **meta,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        # 使用量を記録し、セッションの容量の上限を超えたら古い結果から消す
+        # （この結果だけで超える場合は消してStorageQuotaExceeded）
+        StorageManager(session_id).add("result", result_id)
+    return result_id
 
 @celery_app.task(bind=True)
 def build_model_task(self, model_id: str, session_id: str):
     """PyMCモデルを構築するタスク"""
-    # TODO: 実装
-    pass
+    entry, cache_hit = _prepare_model(session_id, model_id)
+    return {
+        "status": "completed",
+        "graph_hash": entry.graph_hash,
+        "cache_hit": cache_hit,
+        "free_variables": [rv.name for rv in entry.model.free_RVs],
+        "cache_stats": model_cache.stats(),
+    }
 
-@celery_app.task(bind=True)
-def sample_task(self, model_id: str, session_id: str, config: dict):
+@celery_app.task(bind=True, base=MemoizedTask)
+def sample_task(self, model_id: str, session_id: str, config: dict, memo_key: str = None):
     """サンプリングを実行するタスク"""
-    # TODO: 実装
-    pass
+    sampler = config.get("sampler", "NUTS")
+    draws = config.get("draws", 2000)
+    tune = config.get("tune", 1000)
+    chains = config.get("chains", 4)
+    seed = config.get("random_seed")
+
+    last_percent = {"value": -1}
+
+    def update_state(chain, chain_percent, percent):
+        # ポーリング（GET /api/tasks/{task_id}）向けの進捗
+        if percent != last_percent["value"]:
+            last_percent["value"] = percent
+            self.update_state(
+                state="PROGRESS",
+                meta={"progress": percent, "message": f"サンプリング中... ({percent}%)"},
+            )
+
+    reporter = ProgressReporter(
+        session_id, self.request.id, draws, tune, chains, on_progress=update_state
+    )
+    reporter.phase("compile")
+    minibatch = sampler == "VI" and config.get("batch_size") is not None
+    if minibatch:
+        entry, cache_hit, stream, next_batch = _prepare_minibatch_model(
+            session_id, model_id, config["batch_size"], seed
+        )
+    else:
+        entry, cache_hit = _prepare_model(session_id, model_id)
+        next_batch = None
+
+    vi_info = None
+    if sampler == "VI":
+        n_iterations = config.get("n_iterations", 10000)
+        approx, vi_info = _fit_advi(
+            entry,
+            config,
+            seed,
+            next_batch,
+            on_iteration=lambda i: update_state(None, None, int(i / n_iterations * 100)),
+        )
+        idata = approx.sample(draws, random_seed=seed)
+        if minibatch:
+            # 行単位の値は最後のミニバッチのものなので結果に含めない
+            idata = _drop_row_variables(idata)
+            vi_info.update({"batch_size": stream.batch_size, "n_rows": stream.n_rows})
+        backend, fallback, adaptation, warm_info = None, None, None, None
+    else:
+        backend, fallback = resolve_backend(config.get("backend", "pymc"), entry.model)
+        if backend != "pymc":
+            reporter.phase("sampling", backend=backend)
+            idata = _sample_nuts(entry, config, chains, seed, backend=backend)
+            adaptation, warm_info = None, None
+        else:
+            warm, reporter.tune, warm_info = _find_warm_start(session_id, entry, config)
+            callback, recorder = _recording_callback(entry, reporter.callback)
+            idata = _sample_nuts(
+                entry, {**config, "tune": reporter.tune}, chains, seed, callback, backend, warm
+            )
+            adaptation = recorder.state(idata, entry.model)
+
+    reporter.phase("saving")
+    result_id = _save_result(
+        session_id,
+        model_id,
+        idata,
+        {
+            "kind": "sample",
+            "graph_hash": entry.graph_hash,
+            "backend": backend,
+            "backend_fallback": fallback,
+            "warm_start": warm_info,
+            "vi": vi_info,
+            "config": config,
+        },
+    )
+    if adaptation is not None:
+        save_warm_start(session_id, entry.structure_hash, result_id, adaptation)
+    reporter.phase("completed", progress=100, result_id=result_id)
+    return {
+        "result_id": result_id,
+        "status": "completed",
+        "graph_hash": entry.graph_hash,
+        "cache_hit": cache_hit,
+        "backend": backend,
+        "backend_fallback": fallback,
+        "warm_start": warm_info,
+        "vi": vi_info,
+    }
+
+@celery_app.task(bind=True)
+def sample_chains_task(
+    self,
+    model_id: str,
+    session_id: str,
+    config: dict,
+    parent_task_id: str,
+    first_chain: int,
+    seeds: List[int],
+) -> dict:
+    """チェーンの一部をサンプリングし、部分トレースを一時保存する（並列実行用のサブタスク）"""
+    progress_key = _get_chain_progress_key(session_id, parent_task_id)
+
+    def record_chain_progress(chain, chain_percent, percent):
+        redis_client.client.hset(progress_key, str(chain), chain_percent)
+
+    # 進捗イベントは結合タスク（parent_task_id）のチャンネルに配信する
+    reporter = ProgressReporter(
+        session_id,
+        parent_task_id,
+        config.get("draws", 2000),
+        config.get("tune", 1000),
+        len(seeds),
+        first_chain=first_chain,
+        on_progress=record_chain_progress,
+    )
+    redis_client.client.hset(progress_key, mapping={str(chain): 0 for chain in reporter.counts})
+    redis_client.expire(progress_key, 86400)
+
+    reporter.phase("compile")
+    entry, _ = _prepare_model(session_id, model_id)
+    warm, reporter.tune, warm_info = _find_warm_start(session_id, entry, config)
+    callback, recorder = _recording_callback(entry, reporter.callback)
+    idata = _sample_nuts(
+        entry,
+        {**config, "tune": reporter.tune},
+        len(seeds),
+        seeds,
+        callback,
+        warm=warm,
+        first_chain=first_chain,
+    )
+    reporter.stop()
+
+    partial_dir = Path(settings.STORAGE_PATH) / session_id / "tmp" / parent_task_id / f"chains_{first_chain}"
+    write_idata(idata, partial_dir)
+    adaptation = recorder.state(idata, entry.model, first_chain)
+    if adaptation is not None:
+        write_state(adaptation, partial_dir / ADAPTATION_FILE)
+    return {
+        "dir": str(partial_dir),
+        "first_chain": first_chain,
+        "graph_hash": entry.graph_hash,
+        "structure_hash": entry.structure_hash,
+        "warm_start": warm_info,
+    }
+
+@celery_app.task(bind=True, base=MemoizedTask)
+def merge_chains_task(
+    self,
+    partials: List[dict],
+    model_id: str,
+    session_id: str,
+    config: dict,
+    memo_key: str = None,
+):
+    """サブタスクの部分トレースをchain次元で結合して保存"""
+    # チェーン番号順に並べ、変数ごとにファイル同士で連結する（トレース全体をメモリに載せない）
+    partials = sorted(partials, key=lambda p: p["first_chain"])
+    part_dirs = [Path(p["dir"]) for p in partials]
+
+    result_id = _save_result(
+        session_id,
+        model_id,
+        None,
+        {
+            "kind": "sample",
+            "graph_hash": partials[0]["graph_hash"],
+            "backend": "pymc",
+            "backend_fallback": None,
+            "warm_start": partials[0]["warm_start"],
+            "config": config,
+        },
+        write_trace=lambda trace_dir: concat_stores(part_dirs, trace_dir),
+    )
+    states = [read_state(d / ADAPTATION_FILE) for d in part_dirs if (d / ADAPTATION_FILE).exists()]
+    if len(states) == len(part_dirs):
+        save_warm_start(session_id, partials[0]["structure_hash"], result_id, combine_states(states))
+    shutil.rmtree(part_dirs[0].parent, ignore_errors=True)
+    ProgressReporter(session_id, self.request.id, 0, 0, 0).phase(
+        "completed", progress=100, result_id=result_id
+    )
+    return {
+        "result_id": result_id,
+        "status": "completed",
+        "graph_hash": partials[0]["graph_hash"],
+        "chain_groups": len(partials),
+        "warm_start": partials[0]["warm_start"],
+    }
+
+def sample_chord(
+    model_id: str,
+    session_id: str,
+    config: dict,
+    task_id: str,
+    memo_key: Optional[str] = None,
+):
+    """チェーンをchains_per_taskずつのサブタスクに分け、結合タスクで束ねるchord
+
+    チェーンごとのシードはrandom_seedから導出するため、同じシードなら
+    分割数によらず各チェーンは同じ乱数列になる。task_idは結合タスクのIDになる。
+    """
+    chains = config["chains"]
+    per_task = config["chains_per_task"]
+    seeds = _chain_seeds(config.get("random_seed"), chains)
+    header = [
+        sample_chains_task.s(
+            model_id, session_id, config, task_id, first, seeds[first:first + per_task]
+        )
+        for first in range(0, chains, per_task)
+    ]
+    return chord(
+        header, merge_chains_task.s(model_id, session_id, config, memo_key=memo_key).set(task_id=task_id)
+    )
+
+def _fit_segment(session_id: str, entry, config: dict, random_seed):
+    """セグメントを1つ当てはめ、(InferenceData, 結果のメタデータに書く実行情報) を返す
+
+    sample_taskと同じ推論を行うが、進捗はセグメント単位でしか報告しない。
+    """
+    if config.get("sampler", "NUTS") == "VI":
+        approx, vi_info = _fit_advi(entry, config, random_seed)
+        return approx.sample(config.get("draws", 2000), random_seed=random_seed), {"vi": vi_info}
+
+    backend, fallback = resolve_backend(config.get("backend", "pymc"), entry.model)
+    warm, tune, warm_info = None, config.get("tune", 1000), None
+    if backend == "pymc":
+        warm, tune, warm_info = _find_warm_start(session_id, entry, config)
+    idata = _sample_nuts(
+        entry, {**config, "tune": tune}, config.get("chains", 4), random_seed, backend=backend, warm=warm
+    )
+    return idata, {"backend": backend, "backend_fallback": fallback, "warm_start": warm_info}
+
+@celery_app.task(bind=True)
+def sample_segments_task(
+    self,
+    model_id: str,
+    session_id: str,
+    config: dict,
+    parent_task_id: str,
+    segments: List[int],
+    seeds: List[int],
+) -> List[dict]:
+    """セグメントの一部を順に当てはめる（一括実行のサブタスク）
+
+    モデルは最初のセグメントで取得（なければ構築）し、以降はデータだけ差し替える。
+    失敗したセグメントは記録して次に進む。要約統計量は一時ファイルに書き、
+    結合タスクで1つの表にまとめる。
+    """
+    nodes, edges = load_graph(session_id, model_id)
+    if not nodes:
+        raise GraphError("Model has no nodes")
+    source = SegmentSource(session_id, nodes, config)
+    graph_hash, structure_hash = _model_hashes(nodes, edges, load_plates(session_id, nodes))
+
+    progress_key = _get_segment_progress_key(session_id, parent_task_id)
+    with redis_client.client.pipeline() as pipe:
+        # 他のサブタスクが先に進めた状態は上書きしない
+        for name in source.names:
+            pipe.hsetnx(progress_key, name, "pending")
+        pipe.expire(progress_key, 86400)
+        pipe.execute()
+    reporter = ProgressReporter(session_id, parent_task_id, 0, 0, 0)
+    partial_dir = Path(settings.STORAGE_PATH) / session_id / "tmp" / parent_task_id / "segments"
+    partial_dir.mkdir(parents=True, exist_ok=True)
+
+    outcomes = []
+    for index, seed in zip(segments, seeds):
+        name = source.names[index]
+        redis_client.client.hset(progress_key, name, "running")
+        reporter.phase("segment", segment=name, status="running")
+        outcome = {"index": index, "segment": name, "result_id": None, "n_rows": None, "error": None}
+        try:
+            data, plates = source.load(index)
+            outcome["n_rows"] = observation_count(data)
+            entry, cache_hit = _get_or_build_model(graph_hash, structure_hash, nodes, edges, data, plates)
+            segment_config = {**config, "random_seed": seed}
+            idata, info = _fit_segment(session_id, entry, segment_config, seed)
+            if config.get("save_traces", True):
+                outcome["result_id"] = _save_result(
+                    session_id,
+                    model_id,
+                    idata,
+                    {
+                        "kind": "sample",
+                        "graph_hash": entry.graph_hash,
+                        "segment": name,
+                        "batch_task_id": parent_task_id,
+                        **info,
+                        "config": segment_config,
+                    },
+                )
+            labels, stats = summarize_posterior(idata)
+            np.savez(partial_dir / f"{index}.npz", labels=np.asarray(labels, dtype=str), **stats)
+            status = "completed"
+        except SoftTimeLimitExceeded:
+            raise
+        except Exception as e:
+            # 1つのセグメントの失敗（データの不備・発散など）で一括実行全体を止めない
+            outcome["error"] = str(e)
+            status = "failed"
+        redis_client.client.hset(progress_key, name, status)
+        reporter.phase("segment", segment=name, status=status, result_id=outcome["result_id"])
+        outcomes.append(outcome)
+    return outcomes
+
+@celery_app.task(bind=True, base=MemoizedTask)
+def merge_segments_task(
+    self,
+    lanes: List[List[dict]],
+    model_id: str,
+    session_id: str,
+    config: dict,
+    parent_task_id: str,
+    memo_key: str = None,
+):
+    """サブタスクの要約統計量を (セグメント, パラメータ) の表にまとめて保存"""
+    outcomes = sorted((o for lane in lanes for o in lane), key=lambda o: o["index"])
+    partial_dir = Path(settings.STORAGE_PATH) / session_id / "tmp" / parent_task_id / "segments"
+
+    summaries = []
+    for outcome in outcomes:
+        path = partial_dir / f"{outcome['index']}.npz"
+        if outcome["error"] is None and path.exists():
+            with np.load(path) as f:
+                summaries.append((f["labels"].tolist(), {field: f[field] for field, _ in SUMMARY_STATS}))
+        else:
+            summaries.append(None)
+    parameters, table = summary_table(summaries)
+
+    def write_trace(out_dir: Path):
+        writer = StoreWriter(out_dir)
+        for field, values in table.items():
+            writer.create("segment_summary", field, ["segment", "parameter"], values.shape, values.dtype)[:] = values
+        n_rows = np.asarray([o["n_rows"] if o["n_rows"] is not None else -1 for o in outcomes], dtype=np.int64)
+        writer.create("segment_summary", "n_rows", ["segment"], n_rows.shape, n_rows.dtype)[:] = n_rows
+        writer.set_coord("segment_summary", "segment", [o["segment"] for o in outcomes])
+        writer.set_coord("segment_summary", "parameter", parameters)
+        writer.close()
+
+    segments = [{k: o[k] for k in ("segment", "result_id", "n_rows", "error")} for o in outcomes]
+    failed = sum(o["error"] is not None for o in outcomes)
+    result_id = _save_result(
+        session_id,
+        model_id,
+        None,
+        {"kind": "segment_batch", "segments": segments, "config": config},
+        write_trace=write_trace,
+    )
+    shutil.rmtree(partial_dir.parent, ignore_errors=True)
+    ProgressReporter(session_id, self.request.id, 0, 0, 0).phase(
+        "completed", progress=100, result_id=result_id
+    )
+    return {
+        "result_id": result_id,
+        "status": "completed",
+        "segments": len(outcomes),
+        "failed": failed,
+    }
+
+def segment_chord(
+    model_id: str,
+    session_id: str,
+    config: dict,
+    n_segments: int,
+    task_id: str,
+    memo_key: Optional[str] = None,
+):
+    """セグメントをmax_concurrency個のサブタスクに振り分け、結合タスクで束ねるchord
+
+    同時に実行されるのはサブタスクの数まで。各サブタスクは割り当てられたセグメントを
+    順に当てはめる（セグメントiはサブタスク i % サブタスク数）。セグメントごとのシードは
+    random_seedから導出するため、同時実行数によらず同じ結果になる。
+    """
+    lanes = min(config["max_concurrency"], n_segments)
+    seeds = [
+        int(s)
+        for s in np.random.SeedSequence(config.get("random_seed")).generate_state(n_segments)
+    ]
+    header = []
+    for lane in range(lanes):
+        segments = list(range(lane, n_segments, lanes))
+        # 時間の上限はサブタスクが受け持つセグメント数に比例させる
+        header.append(
+            sample_segments_task.s(
+                model_id, session_id, config, task_id, segments, [seeds[i] for i in segments]
+            ).set(
+                time_limit=celery_app.conf.task_time_limit * len(segments),
+                soft_time_limit=celery_app.conf.task_soft_time_limit * len(segments),
+            )
+        )
+    return chord(
+        header,
+        merge_segments_task.s(model_id, session_id, config, task_id, memo_key=memo_key).set(task_id=task_id),
+    )
+
+def run_prior_predictive_fast(
+    session_id: str, model_id: str, nodes: Dict[str, dict], edges: Dict[str, dict], config: dict
+) -> Optional[dict]:
+    """コンパイルなしの祖先サンプリング（NumPy）で事前予測を実行（APIプロセスから呼ぶ）
+
+    扱えない分布・演算を含む場合はNoneを返す（呼び出し側でprior_predictive_taskを投入する）。
+    """
+    try:
+        check_supported(nodes)
+        data = load_node_data(session_id, nodes)
+        groups, coords = sample_prior_predictive(
+            nodes,
+            edges,
+            data,
+            load_plates(session_id, nodes),
+            config.get("draws", 500),
+            config.get("random_seed"),
+        )
+    except UnsupportedGraph:
+        return None
+
+    result_id = _save_result(
+        session_id,
+        model_id,
+        None,
+        {
+            "kind": "prior_predictive",
+            "graph_hash": compute_graph_hash(nodes, edges),
+            "sampler": "ancestral",
+            "config": config,
+        },
+        write_trace=lambda trace_dir: write_groups(groups, coords, trace_dir),
+    )
+    return {"result_id": result_id, "status": "completed", "sampler": "ancestral"}
+
+@celery_app.task(bind=True, base=MemoizedTask)
+def prior_predictive_task(self, model_id: str, session_id: str, config: dict, memo_key: str = None):
+    """事前分布の予測を実行するタスク"""
+    import pymc as pm
+
+    entry, cache_hit = _prepare_model(session_id, model_id)
+    with entry.model:
+        idata = pm.sample_prior_predictive(
+            samples=config.get("draws", 500), random_seed=config.get("random_seed")
+        )
+
+    result_id = _save_result(
+        session_id,
+        model_id,
+        idata,
+        {"kind": "prior_predictive", "graph_hash": entry.graph_hash, "config": config},
+    )
+    return {"result_id": result_id, "status": "completed", "cache_hit": cache_hit}
+
+def _predictive_chunks(session_id: str, nodes: Dict[str, dict], plates: Dict[str, List[str]], config: dict):
+    """事後予測する行を返す (行数, チャンクの反復子, 観測値を書き出すか)
+
+    data_idがなければ学習に使ったデータ（観測値を含む）、あれば新しいデータの
+    データノードの列を読み、観測変数には形だけ合わせた0を入れる。
+    """
+    if config.get("data_id") is None:
+        columns = open_node_columns(session_id, nodes)
+        return row_count(columns), iter_row_chunks(columns, config["chunk_rows"]), True
+
+    columns, remaps = open_prediction_columns(session_id, nodes, plates, config["data_id"])
+    service = DataService(session_id)
+    observed = {
+        node_id: service.open_mapped_columns(node["csv_mapping"])
+        for node_id, node in nodes.items()
+        if node["node_type"] == "observed"
+    }
+
+    def with_observed():
+        for start, end, chunk in iter_row_chunks(columns, config["chunk_rows"], remaps):
+            for node_id, node_columns in observed.items():
+                shape = (end - start,) if len(node_columns) == 1 else (end - start, len(node_columns))
+                chunk[node_id] = np.zeros(shape, dtype=node_columns[0].dtype)
+            yield start, end, chunk
+
+    return row_count(columns), with_observed(), False
+
+def _reduce_draws(values: np.ndarray, config: dict) -> Dict[str, tuple]:
+    """(chain, draw, 行, ...) の予測値から行ごとの要約統計量 {名前: (先頭の次元, 値)} を求める"""
+    import arviz as az
+
+    samples = values.reshape((-1,) + values.shape[2:])
+    reductions = {}
+    for reduction in config["reductions"]:
+        if reduction == "mean":
+            reductions["mean"] = ([], samples.mean(axis=0))
+        elif reduction == "sd":
+            reductions["sd"] = ([], samples.std(axis=0, ddof=1) if len(samples) > 1 else np.zeros(samples.shape[1:]))
+        elif reduction == "quantiles":
+            reductions["quantiles"] = (["quantile"], np.quantile(samples, config["quantiles"], axis=0))
+        elif reduction == "hdi":
+            # arvizのhdiは最後の次元に (lower, higher) を持つので先頭に移す
+            hdi = az.hdi(values.astype(float), hdi_prob=config["hdi_prob"])
+            reductions["hdi"] = (["hdi"], np.moveaxis(hdi, -1, 0))
+    return reductions
+
+@celery_app.task(bind=True, base=MemoizedTask)
+def posterior_predictive_task(self, model_id: str, session_id: str, config: dict, memo_key: str = None):
+    """事後予測を実行するタスク
+
+    データを行のチャンクに分けて予測し、チャンクごとにディスク上の配列へ書き込む
+    （メモリ使用量は ドロー数 × チャンクの行数 で決まる）。reductionsを指定すると
+    全ドローの代わりに行ごとの要約統計量（posterior_predictive_summaryグループ）だけを保存する。
+    """
+    import pymc as pm
+
+    trace_dir = _get_result_dir(session_id, config["result_id"]) / "trace"
+    if not trace_dir.exists():
+        raise FileNotFoundError(f"Result {config['result_id']} not found")
+
+    nodes, edges = load_graph(session_id, model_id)
+    if not nodes:
+        raise GraphError("Model has no nodes")
+    plates = load_plates(session_id, nodes)
+    posterior = to_inference_data(trace_dir, groups=["posterior"]).posterior
+    posterior = posterior.isel(draw=slice(None, None, config.get("thin", 1)))
+    n_samples = posterior.sizes["chain"] * posterior.sizes["draw"]
+    config = {
+        **config,
+        "chunk_rows": config.get("chunk_rows")
+        or max(1, settings.POSTERIOR_PREDICTIVE_CHUNK_ELEMENTS // n_samples),
+    }
+    n_rows, chunks, write_observed = _predictive_chunks(session_id, nodes, plates, config)
+    if not n_rows:
+        raise GraphError("No rows to predict")
+
+    rng = np.random.default_rng(config.get("random_seed"))
+    graph_hash, structure_hash = _model_hashes(nodes, edges, plates)
+    entry = cache_hit = None
+    reductions = config.get("reductions")
+    observed_ids = [node_id for node_id, node in nodes.items() if node["node_type"] == "observed"]
+    meta = {"kind": "posterior_predictive", "config": config}
+
+    def write_trace(out_dir: Path):
+        nonlocal entry, cache_hit
+        writer = StoreWriter(out_dir)
+        arrays = {}
+        for start, end, chunk in chunks:
+            if entry is None:
+                # 最初のチャンクでモデルを用意し、以降はデータだけ差し替える
+                entry, cache_hit = _get_or_build_model(
+                    graph_hash, structure_hash, nodes, edges, chunk, plates
+                )
+                free_names = [rv.name for rv in entry.model.free_RVs]
+                trace = posterior[free_names].load()
+                observed_names = [rv.name for rv in entry.model.observed_RVs]
+            else:
+                named = {data_variable_name(nodes[node_id]): v for node_id, v in chunk.items()}
+                entry.set_data(named, model_coords(chunk, plates))
+
+            with entry.model:
+                predicted = pm.sample_posterior_predictive(
+                    trace,
+                    var_names=observed_names,
+                    random_seed=int(rng.integers(2**31)),
+                    return_inferencedata=False,
+                    progressbar=False,
+                )
+
+            for name, values in predicted.items():
+                dims = list(entry.model.named_vars_to_dims.get(name) or [OBSERVATION_DIM])
+                dims += [f"{name}_dim_{i}" for i in range(len(dims), values.ndim - 2)]
+                if reductions:
+                    for reduction, (lead, reduced) in _reduce_draws(values, config).items():
+                        key = ("posterior_predictive_summary", f"{name}_{reduction}")
+                        if key not in arrays:
+                            shape = reduced.shape[:len(lead)] + (n_rows,) + reduced.shape[len(lead) + 1:]
+                            arrays[key] = writer.create(*key, lead + dims, shape, reduced.dtype)
+                        arrays[key][(slice(None),) * len(lead) + (slice(start, end),)] = reduced
+                else:
+                    key = ("posterior_predictive", name)
+                    if key not in arrays:
+                        shape = values.shape[:2] + (n_rows,) + values.shape[3:]
+                        arrays[key] = writer.create(*key, ["chain", "draw", *dims], shape, values.dtype)
+                    arrays[key][:, :, start:end] = values
+
+            if write_observed:
+                for node_id in observed_ids:
+                    name, values = nodes[node_id]["code_name"], chunk[node_id]
+                    key = ("observed_data", name)
+                    if key not in arrays:
+                        dims = list(entry.model.named_vars_to_dims.get(name) or [OBSERVATION_DIM])
+                        dims += [f"{name}_dim_{i}" for i in range(len(dims), values.ndim)]
+                        arrays[key] = writer.create(*key, dims, (n_rows,) + values.shape[1:], values.dtype)
+                    arrays[key][start:end] = values
+
+            progress = int(end / n_rows * 100)
+            self.update_state(
+                state="PROGRESS", meta={"progress": progress, "message": f"事後予測中... ({progress}%)"}
+            )
+
+        if reductions and "quantiles" in reductions:
+            writer.set_coord("posterior_predictive_summary", "quantile", config["quantiles"])
+        if reductions and "hdi" in reductions:
+            writer.set_coord("posterior_predictive_summary", "hdi", ["lower", "higher"])
+        for array in arrays.values():
+            array.flush()
+        writer.close()
+        meta.update({"graph_hash": entry.graph_hash, "n_rows": n_rows, "n_samples": n_samples})
+
+    result_id = _save_result(session_id, model_id, None, meta, write_trace=write_trace)
+    return {"result_id": result_id, "status": "completed", "cache_hit": cache_hit}
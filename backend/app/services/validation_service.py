@@ -0,0 +1,117 @@
+import json
+from typing import Dict, Tuple
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.models.schemas import ValidationIssue, ValidationResult
+from app.services.data_service import DataService
+from app.services.graph_validator import GraphValidator, format_shape
+from app.utils.redis_client import async_redis_client
+
+class ValidationService:
+    """モデルグラフの事前検査（ワーカーに投入する前にAPIで行う）
+
+    ノードごとの検査結果をグラフのバージョンと一緒にキャッシュし、次回は
+    変更ログ（changes）にある変更されたノード・エッジとその子孫だけを検査し直す。
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+
+    def _get_prefix(self, model_id: str) -> str:
+        return f"sessions:{self.session_id}:models:{model_id}"
+
+    def _get_cache_key(self, model_id: str) -> str:
+        return f"{self._get_prefix(model_id)}:validation"
+
+    async def _run(self, model_id: str) -> Tuple[ValidationResult, Dict[str, dict], Dict[str, dict]]:
+        prefix = self._get_prefix(model_id)
+        # グラフ・バージョン・前回の結果・変更ログを同じ時点の状態として読む
+        async with async_redis_client.pipeline(transaction=True) as pipe:
+            pipe.exists(f"{prefix}:meta")
+            pipe.hgetall(f"{prefix}:nodes")
+            pipe.hgetall(f"{prefix}:edges")
+            pipe.get(f"{prefix}:version")
+            pipe.get(self._get_cache_key(model_id))
+            pipe.zrange(f"{prefix}:changes", 0, -1, withscores=True)
+            exists, raw_nodes, raw_edges, version, raw_cache, changes = await pipe.execute()
+
+        if not exists and not raw_nodes:
+            raise HTTPException(status_code=404, detail="Model not found")
+        nodes = {k: json.loads(v) for k, v in raw_nodes.items()}
+        edges = {k: json.loads(v) for k, v in raw_edges.items()}
+        version = int(version or 0)
+        cache = json.loads(raw_cache) if raw_cache else None
+
+        if cache is not None and cache["version"] == version:
+            result = self._to_result(model_id, version, cache, checked=0)
+            return result, nodes, edges
+
+        dirty = None
+        if cache is not None and cache["version"] < version:
+            # 変更ログが切り詰められて差分が分からない場合は全体を検査する
+            truncated = (
+                len(changes) >= settings.MODEL_CHANGE_LOG_SIZE
+                and changes
+                and changes[0][1] > cache["version"]
+            )
+            if not truncated:
+                dirty = set()
+                for member, score in changes:
+                    if score <= cache["version"]:
+                        continue
+                    kind, item_id = member.split(":", 1)
+                    if kind == "node":
+                        dirty.add(item_id)
+                    else:
+                        # エッジの変更は接続先（変更前・変更後）の入力が変わる
+                        if item_id in edges:
+                            dirty.add(edges[item_id]["target"])
+                        if item_id in cache["edges"]:
+                            dirty.add(cache["edges"][item_id])
+
+        validator = GraphValidator(nodes, edges, DataService(self.session_id).describe_mapping)
+        new_cache, issues, checked = await run_in_threadpool(
+            validator.run, cache if dirty is not None else None, dirty
+        )
+        new_cache.update({
+            "version": version,
+            "edges": {edge_id: edge["target"] for edge_id, edge in edges.items()},
+            "issues": issues,
+        })
+        await async_redis_client.set_json(self._get_cache_key(model_id), new_cache, ex=86400)
+        return self._to_result(model_id, version, new_cache, checked), nodes, edges
+
+    def _to_result(self, model_id: str, version: int, cache: dict, checked: int) -> ValidationResult:
+        issues = [ValidationIssue(**i) for i in cache["issues"]]
+        return ValidationResult(
+            model_id=model_id,
+            version=version,
+            valid=not any(i.severity == "error" for i in issues),
+            issues=issues,
+            shapes={
+                node_id: format_shape(tuple(state["shape"]) if state["shape"] is not None else None)
+                for node_id, state in cache["nodes"].items()
+            },
+            checked_nodes=checked,
+        )
+
+    async def validate(self, model_id: str) -> ValidationResult:
+        """グラフを検査して問題点と推定した形状を返す"""
+        result, _, _ = await self._run(model_id)
+        return result
+
+    async def ensure_valid(self, model_id: str) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+        """エラーがあれば422で拒否し、問題なければ読み込んだノード・エッジを返す"""
+        result, nodes, edges = await self._run(model_id)
+        if not nodes:
+            raise HTTPException(status_code=404, detail="Model has no nodes")
+        if not result.valid:
+            raise HTTPException(
+                status_code=422,
+                detail={
+                    "message": "Model graph is invalid",
+                    "issues": [i.model_dump() for i in result.issues if i.severity == "error"],
+                },
+            )
+        return nodes, edges
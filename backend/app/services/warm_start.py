@@ -0,0 +1,165 @@
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from app.config import settings
+from app.utils.redis_client import redis_client
+
+# サンプリング結果に保存するNUTSの調整結果（ステップサイズ・対角の質量行列・
+# 各チェーンの最後のドロー）。構造が同じグラフ（compute_structure_hash）の次の
+# サンプリングはこれを初期値にして、短い調整（warm_start_tune）から始められる。
+
+ADAPTATION_FILE = "adaptation.npz"
+
+# 保存した質量行列を何ドロー分の推定値とみなして調整中の推定に混ぜるか
+WARM_START_WEIGHT = 50
+
+def _get_warm_start_key(session_id: str, structure_hash: str) -> str:
+    return f"sessions:{session_id}:warm_start:{structure_hash}"
+
+def model_layout(model) -> Dict[str, int]:
+    """自由変数（変換後の値の変数）ごとの要素数"""
+    point = model.initial_point()
+    return {v.name: int(np.size(point[v.name])) for v in model.value_vars}
+
+class AdaptationRecorder:
+    """pm.sampleのcallbackで調整後のドローを集計し、質量行列とステップサイズを求める
+
+    質量行列は全チェーンをまとめた変換後の空間での分散（NUTSの調整と同じ推定量）。
+    要素の並びはCompiledModel.get_nuts_stepのポテンシャルと同じ（continuous_value_vars順）。
+    """
+
+    def __init__(self, model):
+        self.names = [v.name for v in model.continuous_value_vars]
+        self.layout = model_layout(model)
+        self.n_samples = 0
+        self.mean: Optional[np.ndarray] = None
+        self.m2: Optional[np.ndarray] = None
+        self.step_sizes: Dict[int, float] = {}
+
+    def callback(self, trace, draw):
+        if draw.tuning or not self.names:
+            return
+        x = np.concatenate([np.ravel(draw.point[name]) for name in self.names]).astype(float)
+        if self.mean is None:
+            self.mean = np.zeros_like(x)
+            self.m2 = np.zeros_like(x)
+        self.n_samples += 1
+        delta = x - self.mean
+        self.mean += delta / self.n_samples
+        self.m2 += delta * (x - self.mean)
+        # 調整後のステップサイズはチェーン内で一定
+        if draw.chain not in self.step_sizes:
+            for stats in draw.stats:
+                if "step_size" in stats:
+                    self.step_sizes[draw.chain] = float(stats["step_size"])
+                    break
+
+    def state(self, idata, model, first_chain: int = 0) -> Optional[dict]:
+        """保存する調整結果（調整後のドローがなければNone）"""
+        if not self.n_samples or not self.step_sizes:
+            return None
+        posterior = idata.posterior
+        return {
+            "layout": self.layout,
+            "n_samples": self.n_samples,
+            "mean": self.mean,
+            "m2": self.m2,
+            "chains": [first_chain + c for c in sorted(self.step_sizes)],
+            "step_sizes": [self.step_sizes[c] for c in sorted(self.step_sizes)],
+            "last": {
+                rv.name: posterior[rv.name].values[:, -1]
+                for rv in model.free_RVs
+                if rv.name in posterior
+            },
+        }
+
+def combine_states(states: Sequence[dict]) -> dict:
+    """チェーンを分けて実行した調整結果をまとめる（チェーン番号順）"""
+    states = sorted(states, key=lambda s: s["chains"][0])
+    combined = dict(states[0])
+    for state in states[1:]:
+        n = combined["n_samples"] + state["n_samples"]
+        delta = state["mean"] - combined["mean"]
+        combined["mean"] = combined["mean"] + delta * state["n_samples"] / n
+        combined["m2"] = (
+            combined["m2"] + state["m2"] + delta**2 * combined["n_samples"] * state["n_samples"] / n
+        )
+        combined["n_samples"] = n
+        combined["chains"] = combined["chains"] + state["chains"]
+        combined["step_sizes"] = combined["step_sizes"] + state["step_sizes"]
+        combined["last"] = {
+            name: np.concatenate([values, state["last"][name]])
+            for name, values in combined["last"].items()
+        }
+    return combined
+
+def write_state(state: dict, path: Path):
+    arrays = {
+        "mean": state["mean"],
+        "m2": state["m2"],
+        "step_sizes": np.asarray(state["step_sizes"], dtype=float),
+        "chains": np.asarray(state["chains"], dtype=np.int64),
+        **{f"last/{name}": values for name, values in state["last"].items()},
+    }
+    meta = {"layout": state["layout"], "n_samples": state["n_samples"]}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez(path, __meta__=np.asarray(json.dumps(meta)), **arrays)
+
+def read_state(path: Path) -> dict:
+    with np.load(path) as f:
+        meta = json.loads(str(f["__meta__"]))
+        return {
+            **meta,
+            "mean": f["mean"],
+            "m2": f["m2"],
+            "step_sizes": f["step_sizes"].tolist(),
+            "chains": f["chains"].tolist(),
+            "last": {key[len("last/"):]: f[key] for key in f.files if key.startswith("last/")},
+        }
+
+class WarmStart:
+    """前回の調整結果から作るNUTSの初期状態"""
+
+    def __init__(self, source_result_id: str, state: dict):
+        self.source_result_id = source_result_id
+        # ステップサイズはチェーンごとの値の幾何平均
+        self.step_size = float(np.exp(np.mean(np.log(state["step_sizes"]))))
+        self.mean = state["mean"]
+        self.var = np.clip(state["m2"] / max(state["n_samples"] - 1, 1), 1e-12, 1e12)
+        self.weight = WARM_START_WEIGHT
+        self._last = state["last"]
+        self._n_saved = len(state["step_sizes"])
+
+    def initvals(self, chains: Sequence[int]) -> List[dict]:
+        """各チェーンの開始点（保存したチェーンの最後のドローを順に割り当てる）"""
+        return [
+            {name: values[chain % self._n_saved] for name, values in self._last.items()}
+            for chain in chains
+        ]
+
+def find_warm_start(session_id: str, structure_hash: str, model) -> Optional[WarmStart]:
+    """構造が同じグラフの直近の調整結果を探す（変数の要素数が変わっていれば使わない）"""
+    record = redis_client.get_json(_get_warm_start_key(session_id, structure_hash))
+    if not record:
+        return None
+    path = (
+        Path(settings.STORAGE_PATH) / session_id / "results" / record["result_id"] / ADAPTATION_FILE
+    )
+    try:
+        state = read_state(path)
+    except (OSError, KeyError, ValueError):
+        return None
+    if state["layout"] != model_layout(model):
+        return None
+    return WarmStart(record["result_id"], state)
+
+def save_warm_start(session_id: str, structure_hash: str, result_id: str, state: dict):
+    """結果の隣に調整結果を書き、構造が同じグラフの次回のサンプリングから参照できるようにする"""
+    write_state(state, Path(settings.STORAGE_PATH) / session_id / "results" / result_id / ADAPTATION_FILE)
+    redis_client.set_json(
+        _get_warm_start_key(session_id, structure_hash),
+        {"result_id": result_id, "created_at": datetime.now().isoformat()},
+        ex=86400,
+    )
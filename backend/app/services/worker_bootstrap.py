@@ -0,0 +1,114 @@
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict
+from celery.signals import worker_init
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# ワーカーの起動時の準備。推論ライブラリ（pymc・pytensor・arviz）の読み込みと
+# 標準分布のlogp/dlogpのコンパイルを、最初のタスクではなくワーカーの起動時に済ませる。
+# preforkではこのあと子プロセスをforkするので、読み込んだモジュールは子プロセスに引き継がれる。
+# コンパイル結果（Cのモジュール）はSTORAGE_PATH以下の共有ディレクトリに置き、
+# 再起動後や他のワーカー（interactive/batch）でも使い回す。
+#
+# APIプロセスはこのモジュールを読み込まない（推論ライブラリを読み込まず速く起動する）。
+
+def compile_dir() -> Path:
+    """PyTensorのコンパイル結果を置く共有ディレクトリ"""
+    return Path(settings.PYTENSOR_COMPILE_DIR or Path(settings.STORAGE_PATH) / ".pytensor")
+
+def configure_compile_dir() -> Path:
+    """PYTENSOR_FLAGSのbase_compiledirを共有ディレクトリにする（pytensorのimport前に呼ぶ）
+
+    PyTensorはbase_compiledirの下にプラットフォームとPythonのバージョンごとの
+    ディレクトリを作り、コンパイル中はその中のロックファイルで他のプロセスを待たせる。
+    環境変数で明示的に指定されていればそれに従う。
+    """
+    path = compile_dir()
+    flags = os.environ.get("PYTENSOR_FLAGS", "")
+    if "compiledir" in flags:
+        return path
+    path.mkdir(parents=True, exist_ok=True)
+    os.environ["PYTENSOR_FLAGS"] = ",".join(filter(None, [flags, f"base_compiledir={path}"]))
+    return path
+
+def _test_value(parameter):
+    if parameter.default is not None:
+        value = parameter.default
+    else:
+        # 既定値のないパラメータは定義域の内側の値にする
+        value = 0.5 if parameter.type == "probability" else 1
+    return int(value) if parameter.type == "positive_integer" else float(value)
+
+def prewarm_distributions() -> Dict[str, float]:
+    """標準分布ごとに小さなモデルのlogp/dlogpをコンパイルし、コンパイル結果を用意する
+
+    自由変数（スカラー）と観測変数（pm.MutableDataのベクトル）を1つずつ持つモデルで、
+    ワーカーのモデルと同じ要素ごとの演算のCモジュールを作っておく。分布ごとの所要時間
+    （秒）を返し、失敗した分布は飛ばす。
+    """
+    import numpy as np
+    import pymc as pm
+    from app.models.schemas import DistributionDefinition
+    from app.services.definition_registry import DefinitionRegistry
+    from app.services.distribution_service import CONFIG_PATH
+    from app.services.model_builder import resolve_pymc_attr
+
+    # カスタム分布は含めない（標準分布だけ）
+    registry = DefinitionRegistry([CONFIG_PATH / "distributions.json"], DistributionDefinition)
+    timings = {}
+    for definition in registry.get_all():
+        if definition.multivariate:
+            continue
+        start = time.perf_counter()
+        try:
+            dist = resolve_pymc_attr(definition.pymc_class)
+            params = {p.name: _test_value(p) for p in definition.parameters}
+            observed = np.repeat(pm.draw(dist.dist(**params), random_seed=0), 3)
+            with pm.Model() as model:
+                dist("x", **params)
+                dist("y", observed=pm.MutableData("y_data", observed), **params)
+            if model.continuous_value_vars:
+                model.logp_dlogp_function()
+            model.compile_logp()
+        except Exception as e:
+            logger.warning(
+                "Prewarm skipped", extra={"fields": {"distribution": definition.name, "error": repr(e)}}
+            )
+            continue
+        timings[definition.name] = round(time.perf_counter() - start, 3)
+    return timings
+
+def bootstrap():
+    """推論ライブラリを読み込み、標準分布のコンパイル結果を用意する"""
+    start = time.perf_counter()
+    path = configure_compile_dir()
+    import arviz  # noqa: F401
+    import pymc  # noqa: F401
+    import pytensor  # noqa: F401
+    imported = time.perf_counter()
+    timings = prewarm_distributions()
+    logger.info(
+        "Worker bootstrap",
+        extra={"fields": {
+            "imports_seconds": round(imported - start, 2),
+            "prewarm_seconds": round(time.perf_counter() - imported, 2),
+            "distributions": len(timings),
+            "compiledir": str(path),
+        }},
+    )
+
+@worker_init.connect
+def _bootstrap_worker(**kwargs):
+    """ワーカーの起動時（子プロセスのfork前）に準備する"""
+    configure_compile_dir()
+    if not settings.WORKER_PREWARM:
+        return
+    try:
+        bootstrap()
+    except Exception as e:
+        # 準備に失敗してもワーカーは起動する（最初のタスクで読み込み・コンパイルする）
+        logger.warning("Worker bootstrap error", extra={"fields": {"error": repr(e)}})
@@ -0,0 +1,172 @@
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+
+# CSVを列ごとの.npyファイルに変換する。
+# 各列は1度だけ変換し、以降はnp.load(mmap_mode="r")でメモリマップして読む。
+#
+# 列の種類（kind）:
+#   int         int64（欠損なし）
+#   float       float64（欠損はNaN）
+#   bool        bool（欠損なし）
+#   categorical int32のコード（欠損は-1）＋ <file>.categories.json
+
+CHUNK_ROWS = 100_000
+
+_KIND_ORDER = {"bool": 0, "int": 1, "float": 2}
+
+def _chunk_kind(series: pd.Series) -> str:
+    kind = series.dtype.kind
+    if kind == "b":
+        return "bool"
+    if kind in "iu":
+        return "int"
+    if kind == "f":
+        return "float"
+    return "categorical"
+
+def _merge_kind(current: Optional[str], new: str) -> str:
+    if current is None:
+        return new
+    if "categorical" in (current, new):
+        return "categorical"
+    return max(current, new, key=_KIND_ORDER.get)
+
+def _infer_schema(csv_path: Path, chunk_rows: int):
+    """1パス目: 列の種類・行数・カテゴリ値を求める"""
+    kinds: Dict[str, Optional[str]] = {}
+    has_null: Dict[str, bool] = {}
+    n_rows = 0
+
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows, low_memory=False):
+        if not kinds:
+            kinds = {c: None for c in chunk.columns}
+            has_null = {c: False for c in chunk.columns}
+        n_rows += len(chunk)
+        for column in chunk.columns:
+            series = chunk[column]
+            nulls = series.isna()
+            has_null[column] |= bool(nulls.any())
+            if nulls.all():
+                continue
+            kinds[column] = _merge_kind(kinds[column], _chunk_kind(series.dropna()))
+
+    for column, kind in kinds.items():
+        if kind is None:
+            kinds[column] = "float"
+        elif kind in ("int", "bool") and has_null[column]:
+            # 欠損を表現できないためfloatに昇格
+            kinds[column] = "float"
+
+    # カテゴリ列は値の集合を集める（2パス目でコードに変換する）
+    categorical = [c for c, k in kinds.items() if k == "categorical"]
+    categories: Dict[str, set] = {c: set() for c in categorical}
+    if categorical:
+        for chunk in pd.read_csv(
+            csv_path, chunksize=chunk_rows, usecols=categorical,
+            dtype={c: str for c in categorical},
+        ):
+            for column in categorical:
+                categories[column].update(chunk[column].dropna().unique())
+
+    return kinds, {c: sorted(v) for c, v in categories.items()}, n_rows
+
+def convert_csv(csv_path: Path, out_dir: Path, chunk_rows: int = CHUNK_ROWS) -> dict:
+    """CSVを列ごとのメモリマップ可能な.npyファイルに変換し、スキーマと統計量を返す
+
+    ファイル全体をメモリに載せず、chunk_rows行ずつ読み込んで書き込む。
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    kinds, categories, n_rows = _infer_schema(csv_path, chunk_rows)
+
+    columns = list(kinds)
+    files = {c: f"c{i}.npy" for i, c in enumerate(columns)}
+    dtypes = {"int": np.int64, "float": np.float64, "bool": np.bool_, "categorical": np.int32}
+    arrays = {
+        c: np.lib.format.open_memmap(
+            out_dir / files[c], mode="w+", dtype=dtypes[kinds[c]], shape=(n_rows,)
+        )
+        for c in columns
+    }
+    code_maps = {c: {v: i for i, v in enumerate(cats)} for c, cats in categories.items()}
+    stats = {
+        c: {"null_count": 0, "sum": 0.0, "min": None, "max": None}
+        for c in columns
+    }
+
+    offset = 0
+    read_dtypes = {c: str for c in categories}
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows, dtype=read_dtypes, low_memory=False):
+        end = offset + len(chunk)
+        for column in columns:
+            series = chunk[column]
+            kind = kinds[column]
+            stat = stats[column]
+            stat["null_count"] += int(series.isna().sum())
+
+            if kind == "categorical":
+                values = series.map(code_maps[column]).fillna(-1).to_numpy(np.int32)
+            else:
+                values = pd.to_numeric(series, errors="coerce").to_numpy(dtypes[kind])
+                valid = values[~np.isnan(values)] if kind == "float" else values
+                if valid.size:
+                    chunk_min, chunk_max = valid.min().item(), valid.max().item()
+                    stat["min"] = chunk_min if stat["min"] is None else min(stat["min"], chunk_min)
+                    stat["max"] = chunk_max if stat["max"] is None else max(stat["max"], chunk_max)
+                    stat["sum"] += float(valid.sum())
+            arrays[column][offset:end] = values
+        offset = end
+
+    for array in arrays.values():
+        array.flush()
+    for column, cats in categories.items():
+        with open(out_dir / f"{files[column]}.categories.json", "w", encoding="utf-8") as f:
+            json.dump(cats, f, ensure_ascii=False)
+
+    column_info = []
+    for column in columns:
+        stat = stats[column]
+        count = n_rows - stat["null_count"]
+        info = {
+            "name": column,
+            "kind": kinds[column],
+            "dtype": np.dtype(dtypes[kinds[column]]).name,
+            "file": files[column],
+            "null_count": stat["null_count"],
+        }
+        if kinds[column] == "categorical":
+            info["n_categories"] = len(categories[column])
+        else:
+            info["min"] = stat["min"]
+            info["max"] = stat["max"]
+            info["mean"] = stat["sum"] / count if count else None
+        column_info.append(info)
+
+    return {"n_rows": n_rows, "columns": column_info}
+
+def open_column(data_dir: Path, column_info: dict) -> np.ndarray:
+    """列をメモリマップで開く（読み取り専用）"""
+    return np.load(data_dir / column_info["file"], mmap_mode="r")
+
+def load_categories(data_dir: Path, column_info: dict) -> List[str]:
+    """カテゴリ列のカテゴリ値一覧を取得"""
+    with open(data_dir / f"{column_info['file']}.categories.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def read_head(data_dir: Path, columns: List[dict], n_rows: int) -> List[dict]:
+    """先頭n_rows行だけを読み込んでレコード形式で返す"""
+    values = {}
+    for info in columns:
+        head = open_column(data_dir, info)[:n_rows]
+        if info["kind"] == "categorical":
+            categories = load_categories(data_dir, info)
+            values[info["name"]] = [categories[c] if c >= 0 else None for c in head.tolist()]
+        elif info["kind"] == "float":
+            values[info["name"]] = [None if np.isnan(v) else v for v in head.tolist()]
+        else:
+            values[info["name"]] = head.tolist()
+
+    n = min((len(v) for v in values.values()), default=0)
+    return [{name: v[i] for name, v in values.items()} for i in range(n)]
@@ -0,0 +1,178 @@
+from typing import Dict
+import numpy as np
+from scipy import fft
+from scipy.special import ndtri
+from scipy.stats import rankdata
+
+# arviz.summary()と同じ診断統計量を、パラメータ次元についてベクトル化して計算する。
+# 入力は (chain, draw, K) の配列で、K個のスカラーパラメータをまとめて処理する。
+# アルゴリズムはVehtari et al. (2021) の rank-normalized split-R̂ / ESS に従う
+# （arviz.stats.diagnostics の実装をパラメータ軸で一括処理するように書き直したもの）。
+
+HDI_PROB = 0.94
+
+# 計算方法を変えたら上げる（結果ディレクトリに保存した診断統計量のキャッシュを無効にする）
+VERSION = 2
+
+STAT_NAMES = (
+    "mean",
+    "sd",
+    "hdi_3%",
+    "hdi_97%",
+    "mcse_mean",
+    "mcse_sd",
+    "ess_bulk",
+    "ess_tail",
+    "r_hat",
+)
+
+def _split_chains(ary: np.ndarray) -> np.ndarray:
+    """各チェーンを前半と後半に分割して (2*chain, draw//2, K) にする"""
+    half = ary.shape[1] // 2
+    return np.concatenate((ary[:, :half], ary[:, ary.shape[1] - half:]), axis=0)
+
+def _z_scale(ary: np.ndarray) -> np.ndarray:
+    """全ドローを通した順位を正規分布の分位点に変換（rank normalization）"""
+    chains, draws, k = ary.shape
+    flat = ary.reshape(chains * draws, k)
+    # 離散値や定数のパラメータでは同値が多いので平均順位を使う
+    # （ソートは連続した最終軸の方が速いので (K, chain*draw) で行う）
+    ranks = rankdata(np.ascontiguousarray(flat.T), method="average", axis=1)
+    z = ndtri((ranks - 0.375) / (flat.shape[0] + 0.25))
+    return z.T.reshape(chains, draws, k)
+
+def _autocov(ary: np.ndarray) -> np.ndarray:
+    """draw軸の自己共分散（FFT）を (chain, draw, K) で返す"""
+    n = ary.shape[1]
+    m = fft.next_fast_len(2 * n, real=True)
+    # FFTは最終軸が連続している方が速いので (chain, K, draw) に並べ替えて計算する
+    centered = np.ascontiguousarray(np.moveaxis(ary - ary.mean(axis=1, keepdims=True), 1, 2))
+    freq = fft.rfft(centered, n=m, axis=-1, workers=-1)
+    acov = fft.irfft(freq * np.conjugate(freq), n=m, axis=-1, workers=-1)[..., :n]
+    return np.moveaxis(acov / n, 2, 1)
+
+def _ess(ary: np.ndarray) -> np.ndarray:
+    """Geyerの初期単調列で打ち切った自己相関から有効サンプルサイズを推定"""
+    chains, n, k = ary.shape
+    acov = _autocov(ary)
+    chain_mean = ary.mean(axis=1)
+    mean_var = acov[:, 0].mean(axis=0) * n / (n - 1.0)
+    var_plus = mean_var * (n - 1.0) / n
+    if chains > 1:
+        var_plus = var_plus + np.var(chain_mean, axis=0, ddof=1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rho = 1.0 - (mean_var - acov.mean(axis=0)) / var_plus  # (n, K)
+    rho[0] = 1.0
+
+    # 隣り合う2つのラグの和（Geyerの初期正値列）。arvizと同じくラグ n-2 までの組を見る
+    n_pairs = max(0, (n - 3) // 2) + 1
+    even, odd = rho[0:2 * n_pairs:2], rho[1:2 * n_pairs:2]  # (n_pairs, K)
+    pairs = even + odd
+    # 最初に和が正でなくなった組（すべて正なら最後の組）で打ち切る。
+    # 打ち切った組は奇数ラグを捨て、偶数ラグだけを末尾に加える
+    nonpositive = pairs <= 0
+    last = np.where(nonpositive.any(axis=0), nonpositive.argmax(axis=0), n_pairs - 1)
+    used = np.arange(n_pairs)[:, None] < last
+
+    # 単調非増加に補正（初期単調列）
+    monotone = np.minimum.accumulate(np.where(used, pairs, np.inf), axis=0)
+    head = np.where(used, monotone, 0.0).sum(axis=0)
+    last_even = np.take_along_axis(even, last[None, :], axis=0)[0]
+    last_pair = np.take_along_axis(pairs, last[None, :], axis=0)[0]
+    tail = np.where((last_pair >= 0) | (last_even > 0), last_even, 0.0)
+
+    tau = -1.0 + 2.0 * head + tail
+    total = chains * n
+    tau = np.maximum(tau, 1.0 / np.log10(total))
+    ess = total / tau
+    # 定数のパラメータは自己相関が定義できないので全ドロー数とする
+    constant = np.ptp(ary, axis=(0, 1)) < np.finfo(float).resolution
+    ess = np.where(constant, total, ess)
+    return np.where(np.isnan(rho).any(axis=0) & ~constant, np.nan, ess)
+
+def _rhat(ary: np.ndarray) -> np.ndarray:
+    n = ary.shape[1]
+    chain_mean = ary.mean(axis=1)
+    chain_var = ary.var(axis=1, ddof=1)
+    between = n * np.var(chain_mean, axis=0, ddof=1)
+    within = chain_var.mean(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.sqrt((between / within + n - 1) / n)
+
+def _hdi(ary: np.ndarray, prob: float):
+    """全ドローを通した最短区間"""
+    chains, draws, k = ary.shape
+    flat = np.sort(np.ascontiguousarray(ary.reshape(chains * draws, k).T), axis=1)
+    n = flat.shape[1]
+    width = int(np.floor(prob * n))
+    intervals = flat[:, width:] - flat[:, : n - width]
+    low_idx = np.argmin(intervals, axis=1)
+    rows = np.arange(k)
+    return flat[rows, low_idx], flat[rows, low_idx + width]
+
+def summarize(ary: np.ndarray) -> Dict[str, np.ndarray]:
+    """(chain, draw, K) の配列からK個のパラメータの診断統計量を計算"""
+    ary = np.asarray(ary, dtype=float)
+    chains, draws, k = ary.shape
+    flat = ary.reshape(chains * draws, k)
+
+    mean = flat.mean(axis=0)
+    sd = flat.std(axis=0, ddof=1) if flat.shape[0] > 1 else np.full(k, np.nan)
+    hdi_low, hdi_high = _hdi(ary, HDI_PROB)
+
+    stats = {"mean": mean, "sd": sd, "hdi_3%": hdi_low, "hdi_97%": hdi_high}
+    if draws < 4:
+        # arvizと同じく、ドローが少なすぎるときは収束診断を計算しない
+        return {**stats, **{name: np.full(k, np.nan) for name in STAT_NAMES[4:]}}
+
+    split = _split_chains(ary)
+    ess_mean = _ess(split)
+
+    # 標準偏差のMCSEはESS_sd = min(ESS(x), ESS(x^2)) から求める
+    ess_sd = np.minimum(ess_mean, _ess(split ** 2))
+    with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+        mcse_mean = sd / np.sqrt(ess_mean)
+        mcse_sd = sd * np.sqrt(np.e * (1 - 1 / ess_sd) ** (ess_sd - 1) - 1)
+
+    z_split = _z_scale(split)
+    ess_bulk = _ess(z_split)
+    quantiles = np.quantile(flat, (0.05, 0.95), axis=0)
+    ess_tail = np.minimum(
+        _ess(_split_chains((ary <= quantiles[0]).astype(float))),
+        _ess(_split_chains((ary <= quantiles[1]).astype(float))),
+    )
+
+    # R̂は2チェーン以上のときだけ（1チェーンを分割しただけでは計算しない）
+    if chains > 1:
+        folded = np.abs(ary - np.median(flat, axis=0))
+        r_hat = np.maximum(_rhat(z_split), _rhat(_z_scale(_split_chains(folded))))
+    else:
+        r_hat = np.full(k, np.nan)
+
+    return {
+        **stats,
+        "mcse_mean": mcse_mean,
+        "mcse_sd": mcse_sd,
+        "ess_bulk": ess_bulk,
+        "ess_tail": ess_tail,
+        "r_hat": r_hat,
+    }
+
+def summarize_chunked(values: np.ndarray, chunk_elements: int = 1 << 22) -> Dict[str, np.ndarray]:
+    """(chain, draw, ...) の配列（メモリマップ可）をパラメータ方向に分割して計算
+
+    1回に読み込むのは chain*draw*チャンク幅 ≒ chunk_elements 要素まで。
+    """
+    chains, draws = values.shape[:2]
+    k = int(np.prod(values.shape[2:], dtype=int))
+    flat = values.reshape(chains, draws, k)
+    width = max(1, chunk_elements // max(chains * draws, 1))
+
+    results = {name: np.empty(k) for name in STAT_NAMES}
+    for start in range(0, k, width):
+        stop = min(start + width, k)
+        chunk = summarize(np.asarray(flat[:, :, start:stop]))
+        for name in STAT_NAMES:
+            results[name][start:stop] = chunk[name]
+    return results
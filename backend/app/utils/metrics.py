@@ -0,0 +1,122 @@
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+# Prometheus形式のメトリクス。APIの各プロセスとCeleryの各ワーカープロセスの値を
+# Redisのハッシュ（METRICS_KEY）に足し込んで集計し、/metricsはそれを読んで出力する。
+# 計測のたびにRedisへ書かず、プロセスごとにメモリ上で溜めてflushでまとめて書く。
+# （redis_clientのコマンドの計測もここに記録するので、このモジュールはRedisに依存しない）
+
+METRICS_KEY = "metrics"
+
+# レイテンシのヒストグラムの上限（秒）。HTTP・Redisの数ミリ秒から、推論の数十分まで
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+
+# 名前 → (種類, 説明)
+METRICS: Dict[str, Tuple[str, str]] = {
+    "http_request_duration_seconds": ("histogram", "HTTP request latency by route"),
+    "http_responses_total": ("counter", "HTTP responses by route and status code"),
+    "redis_command_duration_seconds": ("histogram", "Redis command latency (pipelines as PIPELINE)"),
+    "redis_command_errors_total": ("counter", "Redis commands that raised an error"),
+    "redis_client_errors_total": ("counter", "JSON helper errors swallowed by RedisClient"),
+    "celery_task_duration_seconds": ("histogram", "Celery task run time by task and final state"),
+    "inference_phase_duration_seconds": ("histogram", "Time spent in each inference phase"),
+    "cache_requests_total": ("counter", "Cache lookups by cache and outcome (hit, miss, joined)"),
+}
+
+def _series_key(name: str, labels: Dict[str, str]) -> str:
+    return json.dumps([name, labels], sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items())) + "}"
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class MetricsRegistry:
+    """プロセス内で溜めたメトリクスの増分（flushでRedisに足し込む）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[str, float] = defaultdict(float)
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        with self._lock:
+            self._pending[_series_key(name, labels)] += value
+
+    def observe(self, name: str, seconds: float, **labels):
+        """ヒストグラムに1件加える（バケットは該当する最小の1つだけ数え、出力時に累積する）"""
+        le = next((b for b in LATENCY_BUCKETS if seconds <= b), math.inf)
+        with self._lock:
+            self._pending[_series_key(f"{name}_bucket", {**labels, "le": str(le)})] += 1
+            self._pending[_series_key(f"{name}_sum", labels)] += seconds
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def drain(self) -> Dict[str, float]:
+        """溜めた増分を取り出して空にする"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(float)
+        return dict(pending)
+
+    def restore(self, pending: Dict[str, float]):
+        """書き込みに失敗した増分を戻す（次のflushで再送する）"""
+        with self._lock:
+            for key, value in pending.items():
+                self._pending[key] += value
+
+def render(values: Dict[str, float], extra: List[str] = ()) -> str:
+    """Redisのハッシュの値をPrometheusのテキスト形式にする"""
+    families: Dict[str, Dict[str, list]] = defaultdict(lambda: defaultdict(list))
+    for key, value in values.items():
+        name, labels = json.loads(key)
+        family = next(
+            (name[: -len(s)] for s in ("_bucket", "_sum") if name.endswith(s) and name[: -len(s)] in METRICS),
+            name,
+        )
+        le = labels.pop("le", None)
+        families[family][_series_key(name[len(family):], labels)].append((le, float(value)))
+
+    lines = []
+    for family in sorted(families):
+        kind, help_text = METRICS.get(family, ("untyped", ""))
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {kind}")
+        series = families[family]
+        if kind != "histogram":
+            for key in sorted(series):
+                _, labels = json.loads(key)
+                lines.append(f"{family}{_format_labels(labels)} {_format_value(series[key][0][1])}")
+            continue
+
+        label_sets = sorted({json.dumps(json.loads(k)[1], sort_keys=True) for k in series})
+        for label_json in label_sets:
+            labels = json.loads(label_json)
+            counts = dict(series.get(_series_key("_bucket", labels), []))
+            total = 0.0
+            for bucket in (*LATENCY_BUCKETS, math.inf):
+                total += counts.get(str(bucket), 0.0)
+                le = "+Inf" if bucket == math.inf else _format_value(bucket)
+                lines.append(f"{family}_bucket{_format_labels({**labels, 'le': le})} {_format_value(total)}")
+            sums = series.get(_series_key("_sum", labels), [(None, 0.0)])
+            lines.append(f"{family}_sum{_format_labels(labels)} {_format_value(sums[0][1])}")
+            lines.append(f"{family}_count{_format_labels(labels)} {_format_value(total)}")
+    lines.extend(extra)
+    return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
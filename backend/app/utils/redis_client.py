@@ -1,11 +1,88 @@
+import logging
+import time
 import redis
+import redis.asyncio as aioredis
 import json
 from typing import Optional, Any
 from app.config import settings
+from app.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+def _command_name(args) -> str:
+    return str(args[0]).upper() if args else "UNKNOWN"
+
+def _record_command(command: str, start: float, error: Optional[Exception]):
+    metrics.observe("redis_command_duration_seconds", time.perf_counter() - start, command=command)
+    if error is not None:
+        metrics.inc("redis_command_errors_total", command=command, error=type(error).__name__)
+
+class _InstrumentedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        start, error = time.perf_counter(), None
+        try:
+            return super().execute(raise_on_error)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _record_command("MULTI" if self.transaction else "PIPELINE", start, error)
+
+class _InstrumentedRedis(redis.Redis):
+    """コマンドごとのレイテンシとエラーを計測する同期クライアント（パイプラインは実行1回を1件）"""
+
+    def execute_command(self, *args, **options):
+        start, error = time.perf_counter(), None
+        try:
+            return super().execute_command(*args, **options)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _record_command(_command_name(args), start, error)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return _InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+class _InstrumentedAsyncPipeline(aioredis.client.Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        start, error = time.perf_counter(), None
+        try:
+            return await super().execute(raise_on_error)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _record_command("MULTI" if self.is_transaction else "PIPELINE", start, error)
+
+class _InstrumentedAsyncRedis(aioredis.Redis):
+    """コマンドごとのレイテンシとエラーを計測する非同期クライアント"""
+
+    async def execute_command(self, *args, **options):
+        start, error = time.perf_counter(), None
+        try:
+            return await super().execute_command(*args, **options)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _record_command(_command_name(args), start, error)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None):
+        return _InstrumentedAsyncPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+def _log_error(operation: str, key: str, error: Exception):
+    # JSONのヘルパーは失敗してもNone/Falseを返す（呼び出し元を止めない）ので、ログと件数に残す
+    metrics.inc("redis_client_errors_total", operation=operation)
+    logger.warning(
+        "Redis %s error", operation, extra={"fields": {"key": key, "error": repr(error)}}
+    )
 
 class RedisClient:
+    """同期Redisクライアント（Celeryワーカーなど同期コンテキスト用）"""
+
     def __init__(self):
-        self.client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        self.client = _InstrumentedRedis.from_url(settings.REDIS_URL, decode_responses=True)
 
     def set_json(self, key: str, value: Any, ex: Optional[int] = None) -> bool:
         """JSON形式でデータを保存"""
@@ -13,7 +90,7 @@ class RedisClient:
             json_str = json.dumps(value, ensure_ascii=False)
             return self.client.set(key, json_str, ex=ex)
         except Exception as e:
-            print(f"Redis set_json error: {e}")
+            _log_error("set_json", key, e)
             return False
 
     def get_json(self, key: str) -> Optional[Any]:
@@ -24,7 +101,7 @@ class RedisClient:
                 return None
             return json.loads(value)
         except Exception as e:
-            print(f"Redis get_json error: {e}")
+            _log_error("get_json", key, e)
             return None
 
     def delete(self, key: str) -> int:
@@ -37,7 +114,7 @@ class RedisClient:
             json_str = json.dumps(value, ensure_ascii=False)
             return self.client.hset(name, key, json_str)
         except Exception as e:
-            print(f"Redis hset_json error: {e}")
+            _log_error("hset_json", name, e)
             return 0
 
     def hget_json(self, name: str, key: str) -> Optional[Any]:
@@ -48,7 +125,7 @@ class RedisClient:
                 return None
             return json.loads(value)
         except Exception as e:
-            print(f"Redis hget_json error: {e}")
+            _log_error("hget_json", name, e)
             return None
 
     def hgetall_json(self, name: str) -> dict:
@@ -57,7 +134,7 @@ class RedisClient:
             raw_data = self.client.hgetall(name)
             return {k: json.loads(v) for k, v in raw_data.items()}
         except Exception as e:
-            print(f"Redis hgetall_json error: {e}")
+            _log_error("hgetall_json", name, e)
             return {}
 
     def hdel(self, name: str, *keys: str) -> int:
@@ -72,4 +149,110 @@ class RedisClient:
         """キーに有効期限を設定"""
         return self.client.expire(key, seconds)
 
+class AsyncRedisClient:
+    """asyncio対応のRedisクライアント（APIプロセス用）
+
+    全リクエストで1つのコネクションプールを共有する。プールが枯渇した場合は
+    接続エラーにせず、REDIS_POOL_TIMEOUT秒まで空きを待つ。
+    """
+
+    def __init__(self):
+        self.pool = aioredis.BlockingConnectionPool.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_keepalive=True,
+            health_check_interval=30,
+        )
+        self.client = _InstrumentedAsyncRedis(connection_pool=self.pool)
+        # 購読は接続を占有し続けるため、コマンド用のプールとは分ける
+        self.pubsub_pool = aioredis.ConnectionPool.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_keepalive=True,
+        )
+
+    async def set_json(self, key: str, value: Any, ex: Optional[int] = None) -> bool:
+        """JSON形式でデータを保存"""
+        try:
+            json_str = json.dumps(value, ensure_ascii=False)
+            return await self.client.set(key, json_str, ex=ex)
+        except Exception as e:
+            _log_error("set_json", key, e)
+            return False
+
+    async def get_json(self, key: str) -> Optional[Any]:
+        """JSON形式でデータを取得"""
+        try:
+            value = await self.client.get(key)
+            if value is None:
+                return None
+            return json.loads(value)
+        except Exception as e:
+            _log_error("get_json", key, e)
+            return None
+
+    async def delete(self, *keys: str) -> int:
+        """キーを削除"""
+        return await self.client.delete(*keys)
+
+    async def hset_json(self, name: str, key: str, value: Any) -> int:
+        """Hashにjson形式でデータを保存"""
+        try:
+            json_str = json.dumps(value, ensure_ascii=False)
+            return await self.client.hset(name, key, json_str)
+        except Exception as e:
+            _log_error("hset_json", name, e)
+            return 0
+
+    async def hget_json(self, name: str, key: str) -> Optional[Any]:
+        """Hashからjson形式でデータを取得"""
+        try:
+            value = await self.client.hget(name, key)
+            if value is None:
+                return None
+            return json.loads(value)
+        except Exception as e:
+            _log_error("hget_json", name, e)
+            return None
+
+    async def hgetall_json(self, name: str) -> dict:
+        """Hash内の全データをjson形式で取得"""
+        try:
+            raw_data = await self.client.hgetall(name)
+            return {k: json.loads(v) for k, v in raw_data.items()}
+        except Exception as e:
+            _log_error("hgetall_json", name, e)
+            return {}
+
+    async def hdel(self, name: str, *keys: str) -> int:
+        """Hashから指定キーを削除"""
+        return await self.client.hdel(name, *keys)
+
+    async def exists(self, key: str) -> bool:
+        """キーが存在するか確認"""
+        return await self.client.exists(key) > 0
+
+    async def expire(self, key: str, seconds: int) -> bool:
+        """キーに有効期限を設定"""
+        return await self.client.expire(key, seconds)
+
+    def pipeline(self, transaction: bool = True):
+        """パイプラインを取得（transaction=TrueでMULTI/EXECとして実行）"""
+        return self.client.pipeline(transaction=transaction)
+
+    def pubsub(self):
+        """Pub/Subオブジェクトを取得（購読専用のプールを使用）"""
+        return aioredis.Redis(connection_pool=self.pubsub_pool).pubsub()
+
+    async def close(self):
+        """コネクションプールを切断"""
+        await self.pool.disconnect()
+        await self.pubsub_pool.disconnect()
+
 redis_client = RedisClient()
+async_redis_client = AsyncRedisClient()
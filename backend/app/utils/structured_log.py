@@ -0,0 +1,46 @@
+import json
+import logging
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+# 1行1JSONの構造化ログと、APIのリクエストからCeleryのタスクまで引き継ぐ相関ID。
+# 相関IDはAPIのミドルウェアでリクエストごとに決め（X-Request-IDがあればそれを使う）、
+# タスクの投入時にメッセージのヘッダーに載せ、ワーカーでタスクの実行中に設定する。
+# 追加の項目は logger.info("...", extra={"fields": {...}}) で渡す。
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# Celeryのメッセージのヘッダー名（correlation_idはCeleryがtask_idに使うので別の名前にする）
+CELERY_HEADER = "request_id"
+
+correlation_id: ContextVar[Optional[str]] = ContextVar("correlation_id", default=None)
+
+def new_correlation_id() -> str:
+    return uuid.uuid4().hex
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "correlation_id": correlation_id.get(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def configure_logging(level: int = logging.INFO):
+    """appパッケージのロガーを標準エラーへのJSON出力にする（Celeryのルートロガーとは独立）"""
+    logger = logging.getLogger("app")
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
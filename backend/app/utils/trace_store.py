@@ -0,0 +1,227 @@
+import json
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+import numpy as np
+
+# InferenceDataを変数ごとの.npyファイルに保存する。
+# 結果を読むときはnp.load(mmap_mode="r")でメモリマップし、必要な部分だけを読み込む。
+#
+# レイアウト:
+#   index.json                    グループ・変数の次元と形状
+#   {group}/{var}.npy             変数の値（chain, drawが先頭の次元）
+#   {group}/coords/{dim}.npy      chain/draw以外の次元の座標値
+
+INDEX_FILE = "index.json"
+
+_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_.\-\[\]]+$")
+
+def _check_name(name: str) -> str:
+    if not _NAME_PATTERN.match(name) or name in (".", ".."):
+        raise ValueError(f"Invalid variable or dimension name: {name}")
+    return name
+
+def _write_array(path: Path, values, dims: Sequence[str]) -> np.ndarray:
+    """chainごとに書き込み、グループ全体を一度に複製しない"""
+    array = np.lib.format.open_memmap(path, mode="w+", dtype=values.dtype, shape=values.shape)
+    if dims and dims[0] == "chain":
+        for chain in range(values.shape[0]):
+            array[chain] = values[chain]
+    else:
+        array[...] = values
+    array.flush()
+    return array
+
+class StoreWriter:
+    """ストアに変数を1つずつ書き込み、最後にインデックスを書く
+
+    create()はディスク上の配列（メモリマップ）を返すので、大きな変数も
+    部分ごとに書き込める。index.jsonはclose()で書く（それまでは読めない）。
+    """
+
+    def __init__(self, out_dir: Path):
+        self.out_dir = out_dir
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self._groups: Dict[str, dict] = {}
+        self._coords: Dict[str, Dict[str, np.ndarray]] = {}
+
+    def create(self, group: str, name: str, dims: Sequence[str], shape: Sequence[int], dtype) -> np.ndarray:
+        group_dir = self.out_dir / _check_name(group)
+        (group_dir / "coords").mkdir(parents=True, exist_ok=True)
+        dims = [str(d) for d in dims]
+        array = np.lib.format.open_memmap(
+            group_dir / f"{_check_name(str(name))}.npy", mode="w+", dtype=dtype, shape=tuple(shape)
+        )
+        group_index = self._groups.setdefault(group, {"variables": {}, "coords": []})
+        group_index["variables"][str(name)] = {
+            "dims": dims,
+            "shape": [int(n) for n in shape],
+            "dtype": array.dtype.name,
+        }
+        group_index["coords"].extend(
+            d for d in dims if d not in group_index["coords"] and d not in ("chain", "draw")
+        )
+        return array
+
+    def set_coord(self, group: str, dim: str, values):
+        self._coords.setdefault(group, {})[dim] = np.asarray(values)
+
+    def close(self) -> dict:
+        """座標とインデックスを書く（座標を指定していない次元は0からの連番）"""
+        for group, group_index in self._groups.items():
+            coords = self._coords.get(group, {})
+            for dim in group_index["coords"]:
+                if dim in coords:
+                    values = coords[dim]
+                else:
+                    values = np.arange(next(
+                        info["shape"][info["dims"].index(dim)]
+                        for info in group_index["variables"].values()
+                        if dim in info["dims"]
+                    ))
+                if values.dtype == object:
+                    # カテゴリ名などの座標はpickleなしで読めるよう文字列配列にする
+                    values = values.astype(str)
+                np.save(self.out_dir / group / "coords" / f"{_check_name(dim)}.npy", values)
+
+        index = {"groups": self._groups}
+        with open(self.out_dir / INDEX_FILE, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+        return index
+
+def write_groups(groups: Dict[str, Dict[str, tuple]], coords: Dict[str, np.ndarray], out_dir: Path) -> dict:
+    """{グループ: {変数名: (次元名, 値)}} と座標を変数ごとの.npyファイルに保存し、インデックスを返す"""
+    writer = StoreWriter(out_dir)
+    for group, group_vars in groups.items():
+        for name, (dims, values) in group_vars.items():
+            values = np.asarray(values)
+            array = writer.create(group, name, dims, values.shape, values.dtype)
+            # chainごとに書き込み、グループ全体を一度に複製しない
+            if len(dims) and dims[0] == "chain":
+                for chain in range(values.shape[0]):
+                    array[chain] = values[chain]
+            else:
+                array[...] = values
+            array.flush()
+            for dim in dims:
+                if dim in coords:
+                    writer.set_coord(group, str(dim), coords[dim])
+    return writer.close()
+
+def write_idata(idata, out_dir: Path) -> dict:
+    """InferenceDataを変数ごとの.npyファイルに保存し、インデックスを返す"""
+    groups, coords = {}, {}
+    for group in idata.groups():
+        dataset = idata[group]
+        groups[group] = {
+            str(name): (data_array.dims, data_array.variable.values)
+            for name, data_array in dataset.data_vars.items()
+        }
+        for dim in dataset.dims:
+            if dim not in ("chain", "draw"):
+                coords[str(dim)] = dataset[dim].values
+    return write_groups(groups, coords, out_dir)
+
+def concat_stores(part_dirs: List[Path], out_dir: Path) -> dict:
+    """chain次元で複数のストアを連結（部分ごとにコピーし、全体をメモリに載せない）
+
+    chain次元を持たないグループ（observed_dataなど）は先頭のストアのものを使う。
+    """
+    indexes = [load_index(d) for d in part_dirs]
+    out_dir.mkdir(parents=True, exist_ok=True)
+    index = {"groups": {}}
+
+    for group, group_index in indexes[0]["groups"].items():
+        group_dir = out_dir / group
+        (group_dir / "coords").mkdir(parents=True, exist_ok=True)
+
+        variables = {}
+        for name, info in group_index["variables"].items():
+            if info["dims"][:1] != ["chain"]:
+                _write_array(group_dir / f"{name}.npy", open_variable(part_dirs[0], group, name), info["dims"])
+                variables[name] = info
+                continue
+
+            parts = [open_variable(d, group, name) for d in part_dirs]
+            shape = [sum(p.shape[0] for p in parts), *parts[0].shape[1:]]
+            array = np.lib.format.open_memmap(
+                group_dir / f"{name}.npy", mode="w+", dtype=parts[0].dtype, shape=tuple(shape)
+            )
+            offset = 0
+            for part in parts:
+                for chain in range(part.shape[0]):
+                    array[offset + chain] = part[chain]
+                offset += part.shape[0]
+            array.flush()
+            variables[name] = {**info, "shape": shape}
+
+        for dim in group_index["coords"]:
+            np.save(group_dir / "coords" / f"{dim}.npy", load_coord(part_dirs[0], group, dim))
+        index["groups"][group] = {"variables": variables, "coords": group_index["coords"]}
+
+    with open(out_dir / INDEX_FILE, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    return index
+
+def load_index(store_dir: Path) -> dict:
+    with open(store_dir / INDEX_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def open_variable(store_dir: Path, group: str, name: str) -> np.ndarray:
+    """変数をメモリマップで開く（読み取り専用）"""
+    return np.load(store_dir / _check_name(group) / f"{_check_name(name)}.npy", mmap_mode="r")
+
+def load_coord(store_dir: Path, group: str, dim: str) -> np.ndarray:
+    return np.load(store_dir / _check_name(group) / "coords" / f"{_check_name(dim)}.npy")
+
+def read_variable(
+    store_dir: Path,
+    group: str,
+    name: str,
+    dims: Sequence[str],
+    chains: Optional[Iterable[int]] = None,
+    draws: slice = slice(None),
+    isel: Optional[Dict[str, object]] = None,
+) -> np.ndarray:
+    """変数の一部だけを読み込む
+
+    chains/drawsでチェーンとドローを、iselで各次元のインデックス（slice または
+    整数のリスト）を指定する。指定した部分以外はディスクから読まない。
+    """
+    array = open_variable(store_dir, group, name)
+    isel = dict(isel or {})
+    if "chain" in dims and chains is not None:
+        isel["chain"] = list(chains)
+    if "draw" in dims:
+        isel["draw"] = draws
+
+    # 基本スライスを先に適用してビューのまま絞り込み、リスト指定は最後に1次元ずつ適用する
+    basic = tuple(isel.get(d, slice(None)) if isinstance(isel.get(d), slice) else slice(None) for d in dims)
+    view = array[basic]
+    for axis, dim in enumerate(dims):
+        selection = isel.get(dim)
+        if selection is not None and not isinstance(selection, slice):
+            view = np.take(view, selection, axis=axis)
+    return np.asarray(view)
+
+def to_inference_data(store_dir: Path, groups: Optional[Sequence[str]] = None, var_names=None):
+    """ストアからInferenceDataを組み立てる（ワーカーでの事後予測などに使用）"""
+    import arviz as az
+    import xarray as xr
+
+    index = load_index(store_dir)
+    datasets = {}
+    for group, group_index in index["groups"].items():
+        if groups is not None and group not in groups:
+            continue
+        coords = {dim: load_coord(store_dir, group, dim) for dim in group_index["coords"]}
+        data_vars = {}
+        for name, info in group_index["variables"].items():
+            if var_names is not None and name not in var_names:
+                continue
+            var_coords = {d: coords[d] for d in info["dims"] if d in coords}
+            data_vars[name] = xr.DataArray(
+                open_variable(store_dir, group, name), dims=info["dims"], coords=var_coords
+            )
+        datasets[group] = xr.Dataset(data_vars)
+    return az.InferenceData(**datasets)
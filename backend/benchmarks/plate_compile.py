@@ -0,0 +1,119 @@
+"""プレート（dims/coords）でベクトル化したモデルと、グループごとに確率変数を作るモデルの比較
+
+階層線形回帰 y ~ Normal(a[group] + beta * x, sigma), a ~ Normal(mu_a, 2) を
+グループ数Gを変えて構築し、モデル構築・logp/dlogpのコンパイル・勾配評価の時間を測る。
+ベクトル化版はbuild_pymc_model（グループ次元を持つ確率変数1つ）、比較対象は
+グループごとにスカラーの確率変数を作りpt.stackでまとめる素朴な実装。
+
+使い方（backend/ で実行）:
+    python -m benchmarks.plate_compile --groups 10 100 1000 10000 --rows 20000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.services.model_builder import build_pymc_model
+
+def _graph(n_groups: int):
+    """グラフ（ノード・エッジ）とデータ、プレートの座標"""
+    def node(node_id, node_type, **kw):
+        return node_id, {"node_id": node_id, "node_type": node_type, "code_name": node_id, **kw}
+
+    nodes = dict([
+        node("group", "data", shape="(n_observations,)"),
+        node("x", "data", shape="(n_observations,)"),
+        node("mu_a", "hyperparameter", distribution="Normal", parameters={"mu": 0, "sigma": 5}),
+        node("a", "latent", distribution="Normal", shape="(group,)", parameters={"sigma": 2}),
+        node("beta", "latent", distribution="Normal", parameters={"mu": 0, "sigma": 10}),
+        node("sigma", "hyperparameter", distribution="HalfNormal", parameters={"sigma": 1}),
+        node("bx", "operation", operation="multiply"),
+        node("mu", "operation", operation="add"),
+        node("y", "observed", distribution="Normal", shape="(n_observations,)"),
+    ])
+    links = [
+        ("mu_a", "a", "mu"),
+        ("x", "bx", "operand_1"),
+        ("beta", "bx", "operand_2"),
+        ("a", "mu", "operand_1"),
+        ("bx", "mu", "operand_2"),
+        ("mu", "y", "mu"),
+        ("sigma", "y", "sigma"),
+    ]
+    edges = {
+        f"edge_{i}": {"source": s, "target": t, "target_handle": h} for i, (s, t, h) in enumerate(links)
+    }
+    plates = {"group": [f"g{i}" for i in range(n_groups)]}
+    return nodes, edges, plates
+
+def _data(n_groups: int, n_rows: int, rng):
+    group = rng.integers(0, n_groups, size=n_rows).astype(np.int32)
+    x = rng.normal(size=n_rows)
+    y = rng.normal(size=n_groups)[group] + 1.5 * x + rng.normal(size=n_rows) * 0.5
+    return {"group": group, "x": x, "y": y}
+
+def _build_vectorized(n_groups: int, data: dict):
+    nodes, edges, plates = _graph(n_groups)
+    return build_pymc_model(nodes, edges, data, plates)
+
+def _build_per_group(n_groups: int, data: dict):
+    """グループごとにスカラーの確率変数を作る素朴な構築"""
+    import pymc as pm
+    import pytensor.tensor as pt
+
+    with pm.Model() as model:
+        group = pm.MutableData("group", data["group"])
+        x = pm.MutableData("x", data["x"])
+        mu_a = pm.Normal("mu_a", 0, 5)
+        a = pt.stack([pm.Normal(f"a_{i}", mu_a, 2) for i in range(n_groups)])
+        beta = pm.Normal("beta", 0, 10)
+        sigma = pm.HalfNormal("sigma", 1)
+        pm.Normal("y", a[group] + beta * x, sigma, observed=data["y"])
+    return model
+
+def _measure(build, n_groups: int, data: dict, repeats: int) -> dict:
+    start = time.perf_counter()
+    model = build(n_groups, data)
+    built = time.perf_counter()
+    logp = model.compile_logp()
+    dlogp = model.compile_dlogp()
+    compiled = time.perf_counter()
+
+    point = model.initial_point()
+    logp(point), dlogp(point)
+    start_eval = time.perf_counter()
+    for _ in range(repeats):
+        logp(point)
+        dlogp(point)
+    evaluated = time.perf_counter()
+    return {
+        "build": built - start,
+        "compile": compiled - built,
+        "eval_ms": (evaluated - start_eval) / repeats * 1000,
+    }
+
+def main(groups, n_rows: int, naive_max: int, repeats: int):
+    rng = np.random.default_rng(0)
+    print(f"rows={n_rows} repeats={repeats}")
+    print(f"{'groups':>7} {'impl':>10} {'build s':>9} {'compile s':>10} {'logp+grad ms':>13}")
+    for n_groups in groups:
+        data = _data(n_groups, n_rows, rng)
+        impls = [("vectorized", _build_vectorized)]
+        if n_groups <= naive_max:
+            impls.append(("per-group", _build_per_group))
+        for label, build in impls:
+            result = _measure(build, n_groups, data, repeats)
+            print(
+                f"{n_groups:>7} {label:>10} {result['build']:>9.3f} "
+                f"{result['compile']:>10.3f} {result['eval_ms']:>13.3f}"
+            )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--groups", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--rows", type=int, default=20000)
+    # 素朴な実装はグループ数に比例してグラフが大きくなるため、上限を設ける
+    parser.add_argument("--naive-max", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=100)
+    args = parser.parse_args()
+    main(args.groups, args.rows, args.naive_max, args.repeats)
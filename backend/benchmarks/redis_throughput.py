@@ -0,0 +1,88 @@
+"""同期RedisClientと非同期AsyncRedisClientのスループット比較
+
+ローカルのRedisに対して、ノード作成・取得と同じコマンド列
+（hset_json → expire → hgetall_json）を同時実行リクエストとして投げ、
+スループットとレイテンシ分布を比較する。
+
+使い方（backend/ で実行）:
+    REDIS_URL=redis://localhost:6379 python -m benchmarks.redis_throughput --concurrency 200 --requests 5000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+from app.utils.redis_client import RedisClient, AsyncRedisClient
+
+NODE = {
+    "node_id": "node_bench",
+    "node_type": "latent",
+    "gui_name": "回帰係数",
+    "code_name": "beta",
+    "shape": "(3,)",
+    "distribution": "Normal",
+    "parameters": {"mu": 0, "sigma": 10},
+    "operation": None,
+    "position": {"x": 100.0, "y": 200.0},
+}
+
+async def _sync_request(client: RedisClient, key: str, i: int):
+    # 従来の実装: コルーチン内で同期呼び出し（イベントループをブロックする）
+    client.hset_json(key, f"node_{i}", NODE)
+    client.expire(key, 60)
+    client.hgetall_json(key)
+
+async def _async_request(client: AsyncRedisClient, key: str, i: int):
+    await client.hset_json(key, f"node_{i}", NODE)
+    await client.expire(key, 60)
+    await client.hgetall_json(key)
+
+async def _run(label: str, request_fn, client, concurrency: int, total: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    # hgetall_jsonの負荷を一定に保つため、リクエストごとに小さなHashを使う
+    prefix = f"bench:{uuid.uuid4().hex[:8]}"
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            await request_fn(client, f"{prefix}:{i % concurrency}", i % 50)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(
+        f"{label:>6}: {total / elapsed:10.1f} req/s  "
+        f"p50={p50:7.2f} ms  p99={p99:7.2f} ms  (total {elapsed:.2f} s)"
+    )
+    return prefix
+
+async def main(concurrency: int, total: int):
+    sync_client = RedisClient()
+    async_client = AsyncRedisClient()
+
+    print(f"concurrency={concurrency} requests={total}")
+    prefixes = [
+        await _run("sync", _sync_request, sync_client, concurrency, total),
+        await _run("async", _async_request, async_client, concurrency, total),
+    ]
+
+    # 後片付け
+    for prefix in prefixes:
+        keys = [k async for k in async_client.client.scan_iter(f"{prefix}:*")]
+        if keys:
+            await async_client.delete(*keys)
+    await async_client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency, args.requests))
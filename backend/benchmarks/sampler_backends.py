@@ -0,0 +1,148 @@
+"""NUTSの実行系（pymc / nutpie / numpyro）ごとの、1秒あたりの有効サンプルサイズ（ESS/s）
+
+参照モデルをbuild_pymc_modelで構築し、ワーカーと同じ経路（tasks._sample_nuts）で
+サンプリングする。ESSは全パラメータ要素のbulk ESSの最小値、時間はモデル構築後の
+サンプリング全体（外部のサンプラーは毎回のコンパイルを含む。pymcのNUTSステップは
+ワーカーと同じく2回目以降はキャッシュを使う）。同じシードで --repeats 回繰り返し、
+中央値を出す。ワーカーに入っていないバックエンドは飛ばす。
+
+参照モデル:
+    hierarchical  階層線形回帰 y ~ Normal(a[group] + beta * x, sigma)
+    logistic      ロジスティック回帰 y ~ Bernoulli(sigmoid(X @ w + b))
+
+使い方（backend/ で実行、CPUのみ）:
+    python -m benchmarks.sampler_backends --models hierarchical logistic --draws 1000 --tune 1000
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from app.services.model_builder import build_pymc_model
+from app.services.model_cache import CompiledModel
+from app.services.sampler_backends import BACKENDS, available_backends, resolve_backend
+from app.services.tasks import _sample_nuts
+
+def _node(node_id, node_type, **kw):
+    return node_id, {"node_id": node_id, "node_type": node_type, "code_name": node_id, **kw}
+
+def _edges(links):
+    return {
+        f"edge_{i}": {"source": s, "target": t, "target_handle": h} for i, (s, t, h) in enumerate(links)
+    }
+
+def _hierarchical(rng, n_groups: int = 50, n_rows: int = 2000):
+    nodes = dict([
+        _node("group", "data", shape="(n_observations,)"),
+        _node("x", "data", shape="(n_observations,)"),
+        _node("mu_a", "hyperparameter", distribution="Normal", parameters={"mu": 0, "sigma": 5}),
+        _node("sigma_a", "hyperparameter", distribution="HalfNormal", parameters={"sigma": 2}),
+        _node("a", "latent", distribution="Normal", shape="(group,)"),
+        _node("beta", "latent", distribution="Normal", parameters={"mu": 0, "sigma": 10}),
+        _node("sigma", "hyperparameter", distribution="HalfNormal", parameters={"sigma": 1}),
+        _node("bx", "operation", operation="multiply"),
+        _node("mu", "operation", operation="add"),
+        _node("y", "observed", distribution="Normal", shape="(n_observations,)"),
+    ])
+    edges = _edges([
+        ("mu_a", "a", "mu"),
+        ("sigma_a", "a", "sigma"),
+        ("x", "bx", "operand_1"),
+        ("beta", "bx", "operand_2"),
+        ("a", "mu", "operand_1"),
+        ("bx", "mu", "operand_2"),
+        ("mu", "y", "mu"),
+        ("sigma", "y", "sigma"),
+    ])
+    group = rng.integers(0, n_groups, size=n_rows).astype(np.int32)
+    x = rng.normal(size=n_rows)
+    y = rng.normal(1.0, 0.8, size=n_groups)[group] + 1.5 * x + rng.normal(size=n_rows) * 0.5
+    plates = {"group": [f"g{i}" for i in range(n_groups)]}
+    return nodes, edges, {"group": group, "x": x, "y": y}, plates
+
+def _logistic(rng, n_features: int = 10, n_rows: int = 2000):
+    nodes = dict([
+        _node("X", "data", shape=f"(n_observations, {n_features})"),
+        _node("w", "latent", distribution="Normal", shape=f"({n_features},)", parameters={"mu": 0, "sigma": 1}),
+        _node("b", "latent", distribution="Normal", parameters={"mu": 0, "sigma": 2}),
+        _node("Xw", "operation", operation="matmul"),
+        _node("eta", "operation", operation="add"),
+        _node("p", "operation", operation="sigmoid"),
+        _node("y", "observed", distribution="Bernoulli", shape="(n_observations,)"),
+    ])
+    edges = _edges([
+        ("X", "Xw", "left"),
+        ("w", "Xw", "right"),
+        ("Xw", "eta", "operand_1"),
+        ("b", "eta", "operand_2"),
+        ("eta", "p", "input"),
+        ("p", "y", "p"),
+    ])
+    X = rng.normal(size=(n_rows, n_features))
+    logits = X @ rng.normal(0, 0.5, size=n_features) - 0.3
+    y = (rng.random(n_rows) < 1 / (1 + np.exp(-logits))).astype(np.int64)
+    return nodes, edges, {"X": X, "y": y}, {}
+
+MODELS = {"hierarchical": _hierarchical, "logistic": _logistic}
+
+def _min_ess(idata) -> float:
+    import arviz as az
+
+    ess = az.ess(idata, method="bulk")
+    return float(min(np.min(ess[name].values) for name in ess.data_vars))
+
+def _run(model_name: str, backend: str, config: dict, repeats: int) -> dict:
+    nodes, edges, data, plates = MODELS[model_name](np.random.default_rng(0))
+    entry = CompiledModel(model_name, build_pymc_model(nodes, edges, data, plates))
+    resolved, fallback = resolve_backend(backend, entry.model)
+    if fallback:
+        return {"skipped": fallback}
+
+    times, ess = [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        idata = _sample_nuts(entry, config, config["chains"], config["random_seed"], backend=resolved)
+        times.append(time.perf_counter() - start)
+        ess.append(_min_ess(idata))
+    seconds = statistics.median(times)
+    min_ess = statistics.median(ess)
+    return {"seconds": seconds, "min_ess": min_ess, "ess_per_sec": min_ess / seconds}
+
+def main(models, backends, config: dict, repeats: int):
+    print(f"installed: {available_backends()}")
+    print(f"draws={config['draws']} tune={config['tune']} chains={config['chains']} repeats={repeats}")
+    print(f"{'model':>12} {'backend':>8} {'time s':>8} {'min ESS':>9} {'ESS/s':>9}")
+    for model_name in models:
+        for backend in backends:
+            result = _run(model_name, backend, config, repeats)
+            if "skipped" in result:
+                print(f"{model_name:>12} {backend:>8}  skipped: {result['skipped']}")
+                continue
+            print(
+                f"{model_name:>12} {backend:>8} {result['seconds']:>8.2f} "
+                f"{result['min_ess']:>9.0f} {result['ess_per_sec']:>9.1f}"
+            )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models", nargs="+", choices=list(MODELS), default=list(MODELS))
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument("--draws", type=int, default=1000)
+    parser.add_argument("--tune", type=int, default=1000)
+    parser.add_argument("--chains", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    main(
+        args.models,
+        args.backends,
+        {
+            "draws": args.draws,
+            "tune": args.tune,
+            "chains": args.chains,
+            "target_accept": 0.8,
+            "random_seed": args.seed,
+        },
+        args.repeats,
+    )
@@ -0,0 +1,113 @@
+"""ワーカーの起動時間（コールドスタート）と最初のタスクの所要時間、APIの起動時間
+
+シナリオごとに新しいPythonプロセスを起動し、ワーカーの起動（タスクモジュールの
+読み込みと、bootstrapありならworker_bootstrap.bootstrap）と、最初のタスク
+（参照モデルの構築・NUTSのコンパイル・短いサンプリング）の時間を測る。
+
+    no-bootstrap/empty   変更前の動作: 起動時は何もせず、コンパイル結果も空（新しいコンテナ）
+    no-bootstrap/shared  起動時は何もせず、共有ディレクトリのコンパイル結果を使う
+    bootstrap/empty      起動時に準備する。共有ディレクトリが空（初回の起動）
+    bootstrap/shared     起動時に準備する。共有ディレクトリにコンパイル結果がある（再起動・2台目以降）
+
+sharedのシナリオの前に、同じディレクトリでbootstrap/emptyを1度実行してコンパイル結果を作る。
+APIはapp.mainのimport時間と、推論ライブラリを読み込んでいないことを確かめる。
+
+使い方（backend/ で実行）:
+    python -m benchmarks.worker_startup --model hierarchical --draws 200 --tune 200
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HEAVY_MODULES = ("pymc", "pytensor", "arviz")
+
+def _child_api() -> dict:
+    start = time.perf_counter()
+    import app.main  # noqa: F401
+    return {
+        "import": time.perf_counter() - start,
+        "heavy": [m for m in HEAVY_MODULES if m in sys.modules],
+    }
+
+def _child_worker(model_name: str, bootstrap: bool, config: dict) -> dict:
+    start = time.perf_counter()
+    import numpy as np
+    import app.services.tasks  # noqa: F401
+    from app.services import worker_bootstrap
+
+    worker_bootstrap.configure_compile_dir()
+    if bootstrap:
+        worker_bootstrap.bootstrap()
+    ready = time.perf_counter()
+
+    from benchmarks.sampler_backends import MODELS
+    from app.services.model_builder import build_pymc_model
+    from app.services.model_cache import CompiledModel
+    from app.services.tasks import _sample_nuts
+
+    nodes, edges, data, plates = MODELS[model_name](np.random.default_rng(0))
+    entry = CompiledModel(model_name, build_pymc_model(nodes, edges, data, plates))
+    _sample_nuts(entry, config, config["chains"], config["random_seed"], backend="pymc")
+    return {"startup": ready - start, "first_task": time.perf_counter() - ready}
+
+def _spawn(args, compile_dir: str) -> dict:
+    env = {**os.environ, "PYTENSOR_COMPILE_DIR": compile_dir}
+    env.pop("PYTENSOR_FLAGS", None)
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.worker_startup", "--child", json.dumps(args)],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main(model_name: str, config: dict):
+    with tempfile.TemporaryDirectory() as root:
+        api = _spawn({"kind": "api"}, os.path.join(root, "api"))
+        print(f"api: import app.main {api['import']:.2f}s, heavy modules loaded: {api['heavy'] or 'none'}")
+
+        worker = {"kind": "worker", "model": model_name, "config": config}
+        scenarios = [
+            ("no-bootstrap/empty", False, "before"),
+            ("bootstrap/empty", True, "shared"),
+            ("bootstrap/shared", True, "shared"),
+            ("no-bootstrap/shared", False, "shared"),
+        ]
+        print(f"model={model_name} draws={config['draws']} tune={config['tune']} chains={config['chains']}")
+        print(f"{'scenario':>20} {'startup s':>10} {'first task s':>13} {'total s':>8}")
+        for name, bootstrap, compile_dir in scenarios:
+            result = _spawn({**worker, "bootstrap": bootstrap}, os.path.join(root, compile_dir))
+            print(
+                f"{name:>20} {result['startup']:>10.2f} {result['first_task']:>13.2f} "
+                f"{result['startup'] + result['first_task']:>8.2f}"
+            )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", choices=["hierarchical", "logistic"], default="hierarchical")
+    parser.add_argument("--draws", type=int, default=200)
+    parser.add_argument("--tune", type=int, default=200)
+    parser.add_argument("--chains", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child = json.loads(args.child)
+        if child["kind"] == "api":
+            result = _child_api()
+        else:
+            result = _child_worker(child["model"], child["bootstrap"], child["config"])
+        print(json.dumps(result))
+    else:
+        main(
+            args.model,
+            {
+                "draws": args.draws,
+                "tune": args.tune,
+                "chains": args.chains,
+                "target_accept": 0.8,
+                "random_seed": args.seed,
+            },
+        )
@@ -0,0 +1,25 @@
+import fakeredis
+import fakeredis.aioredis
+import pytest
+from app.config import settings
+from app.utils import redis_client as rc
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+def redis(monkeypatch):
+    """同期・非同期のクライアントを同じfakeredisのサーバーに向ける（同期クライアントを返す）"""
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    monkeypatch.setattr(rc.redis_client, "client", client)
+    monkeypatch.setattr(
+        rc.async_redis_client, "client", fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    )
+    return client
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_PATH", str(tmp_path))
+    return tmp_path
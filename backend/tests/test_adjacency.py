@@ -0,0 +1,75 @@
+import json
+import pytest
+from app.models.schemas import EdgeCreate, GraphBatchRequest
+from app.services.model_service import ModelService
+from app.services.node_service import NodeService
+
+pytestmark = pytest.mark.anyio
+
+SESSION = "sess_test"
+MODEL = "model_test"
+PREFIX = f"sessions:{SESSION}:models:{MODEL}"
+
+def write_legacy_graph(redis):
+    """隣接インデックスの導入前の形式で a → b → c と a → c を書く"""
+    for node_id in ("a", "b", "c"):
+        redis.hset(f"{PREFIX}:nodes", node_id, json.dumps({"node_id": node_id}))
+    for edge_id, source, target in (("e1", "a", "b"), ("e2", "b", "c"), ("e3", "a", "c")):
+        redis.hset(f"{PREFIX}:edges", edge_id, json.dumps({"edge_id": edge_id, "source": source, "target": target}))
+
+async def test_edges_maintain_index(redis):
+    service = NodeService(SESSION)
+    edge = await service.create_edge(MODEL, EdgeCreate(source="a", target="b"))
+    other = await service.create_edge(MODEL, EdgeCreate(source="b", target="c"))
+
+    adjacency = await service.get_adjacency(MODEL, ["a", "b", "c"])
+    assert adjacency["a"] == {"in": {}, "out": {edge.edge_id: "b"}}
+    assert adjacency["b"] == {"in": {edge.edge_id: "a"}, "out": {other.edge_id: "c"}}
+
+    await service.delete_edge(MODEL, edge.edge_id)
+    adjacency = await service.get_adjacency(MODEL, ["a", "b"])
+    assert adjacency["a"]["out"] == {} and adjacency["b"]["in"] == {}
+
+async def test_legacy_model_index_is_rebuilt_on_read(redis):
+    write_legacy_graph(redis)
+    service = NodeService(SESSION)
+
+    adjacency = await service.get_adjacency(MODEL, ["a", "c"])
+    assert adjacency["a"] == {"in": {}, "out": {"e1": "b", "e3": "c"}}
+    assert adjacency["c"] == {"in": {"e2": "b", "e3": "a"}, "out": {}}
+    assert redis.exists(f"{PREFIX}:adj")
+
+async def test_delete_node_removes_legacy_edges(redis):
+    write_legacy_graph(redis)
+    service = NodeService(SESSION)
+
+    await service.delete_node(MODEL, "b")
+
+    assert set(redis.hkeys(f"{PREFIX}:nodes")) == {"a", "c"}
+    assert set(redis.hkeys(f"{PREFIX}:edges")) == {"e3"}
+    assert redis.hgetall(f"{PREFIX}:adj:a:out") == {"e3": "c"}
+    assert redis.hgetall(f"{PREFIX}:adj:c:in") == {"e3": "a"}
+    assert not redis.exists(f"{PREFIX}:adj:b:in", f"{PREFIX}:adj:b:out")
+
+async def test_batch_delete_removes_legacy_edges(redis):
+    write_legacy_graph(redis)
+    service = NodeService(SESSION)
+
+    response = await service.apply_batch(MODEL, GraphBatchRequest(operations=[
+        {"op": "delete", "kind": "node", "id": "a"},
+    ]))
+
+    assert set(redis.hkeys(f"{PREFIX}:edges")) == {"e2"}
+    assert redis.hgetall(f"{PREFIX}:adj:b:in") == {}
+    assert redis.hgetall(f"{PREFIX}:adj:c:in") == {"e2": "b"}
+    changed = {m for m, _ in redis.zrange(f"{PREFIX}:changes", 0, -1, withscores=True)}
+    assert changed == {"node:a", "edge:e1", "edge:e3"}
+    assert response.version == 1
+
+async def test_delete_model_removes_index(redis):
+    write_legacy_graph(redis)
+    await NodeService(SESSION).get_adjacency(MODEL, ["a"])
+
+    await ModelService(SESSION).delete_model(MODEL)
+
+    assert redis.keys(f"{PREFIX}:*") == []
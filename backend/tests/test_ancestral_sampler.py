@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+from app.models.schemas import GraphBatchRequest, PriorPredictiveConfig
+from app.services import ancestral_sampler, tasks
+from app.services.ancestral_sampler import UnsupportedGraph, check_supported, sample_prior_predictive
+from app.services.inference_service import InferenceService
+from app.services.node_service import NodeService
+from app.services.queues import INTERACTIVE_QUEUE
+
+pm = pytest.importorskip("pymc")
+
+SESSION = "sess_test"
+MODEL = "model_test"
+DRAWS = 4000
+
+def node(node_type, code_name, **fields):
+    return {"node_type": node_type, "code_name": code_name, **fields}
+
+# プレート（g）と演算（beta * x + alpha[g]）を含むモデル
+NODES = {
+    "g": node("data", "g"),
+    "x": node("data", "x"),
+    "tau": node("hyperparameter", "tau", distribution="HalfNormal", parameters={"sigma": 2.0}),
+    "alpha": node("latent", "alpha", shape="g", distribution="Normal", parameters={"mu": 1.0}),
+    "beta": node("latent", "beta", distribution="Normal"),
+    "bx": node("operation", "bx", operation="multiply"),
+    "mu": node("operation", "mu", operation="add"),
+    "y": node("observed", "y", distribution="Normal", parameters={"sigma": 0.5}),
+}
+EDGES = {
+    f"e{i}": {"edge_id": f"e{i}", "source": source, "target": target, "target_handle": handle}
+    for i, (source, target, handle) in enumerate([
+        ("tau", "alpha", "sigma"),
+        ("beta", "bx", "operand_1"),
+        ("x", "bx", "operand_2"),
+        ("alpha", "mu", "operand_1"),
+        ("bx", "mu", "operand_2"),
+        ("mu", "y", "mu"),
+    ])
+}
+DATA = {
+    "g": np.array([0, 1, 2, 0, 1, 2, 0, 1], dtype=np.int32),
+    "x": np.linspace(-1.0, 1.0, 8),
+    "y": np.random.default_rng(0).normal(size=8),
+}
+PLATES = {"g": ["a", "b", "c"]}
+
+def test_matches_pymc_prior_predictive():
+    from app.services.model_builder import build_pymc_model
+
+    with build_pymc_model(NODES, EDGES, DATA, PLATES):
+        expected = pm.sample_prior_predictive(samples=DRAWS, random_seed=1)
+    groups, coords = sample_prior_predictive(NODES, EDGES, DATA, PLATES, DRAWS, 2)
+
+    assert set(groups) == set(expected.groups())
+    for group, variables in groups.items():
+        assert set(variables) == set(expected[group].data_vars), group
+        for name, (dims, values) in variables.items():
+            reference = expected[group][name]
+            assert tuple(dims) == reference.dims and values.shape == reference.shape, name
+            for dim in dims:
+                if dim not in ("chain", "draw"):
+                    assert list(coords[dim]) == list(reference.coords[dim].values), dim
+            if group in ("observed_data", "constant_data"):
+                np.testing.assert_array_equal(values, reference.values)
+            else:
+                # 乱数列は異なるので、ドローについての平均・標準偏差を比べる
+                np.testing.assert_allclose(values.mean(axis=(0, 1)), reference.mean(("chain", "draw")), atol=0.15, err_msg=name)
+                np.testing.assert_allclose(values.std(axis=(0, 1)), reference.std(("chain", "draw")), rtol=0.1, err_msg=name)
+
+def test_unsupported_distribution_or_operation(monkeypatch):
+    check_supported(NODES)
+    monkeypatch.delitem(ancestral_sampler._OPERATIONS, "pm.math.multiply")
+    with pytest.raises(UnsupportedGraph, match="multiply"):
+        check_supported(NODES)
+
+    monkeypatch.undo()
+    monkeypatch.delitem(ancestral_sampler._DISTRIBUTIONS, "pm.HalfNormal")
+    with pytest.raises(UnsupportedGraph, match="HalfNormal"):
+        check_supported(NODES)
+    assert tasks.run_prior_predictive_fast(SESSION, MODEL, NODES, EDGES, {"draws": 10}) is None
+
+@pytest.mark.anyio
+async def test_unsupported_graph_falls_back_to_the_task(redis, storage, monkeypatch):
+    await NodeService(SESSION).apply_batch(MODEL, GraphBatchRequest(operations=[
+        {"op": "create", "kind": "node", "ref": ref, "data": {
+            "node_type": node_type, "gui_name": ref, "code_name": ref, "position": {"x": 0, "y": 0},
+            "distribution": distribution,
+        }}
+        for ref, node_type, distribution in (("s", "hyperparameter", "HalfNormal"), ("m", "latent", "Normal"))
+    ] + [{"op": "create", "kind": "edge", "data": {"source": "s", "target": "m", "target_handle": "sigma"}}]))
+    submitted = []
+
+    async def submit(self, signature, kind, model_id, task_id=None, queue=None, cost=None):
+        submitted.append((signature, queue))
+        return task_id
+
+    monkeypatch.setattr(InferenceService, "_submit", submit)
+    service = InferenceService(SESSION)
+
+    # 扱える分布だけならタスクを投入せずに完了する
+    response = await service.submit_prior_predictive(MODEL, PriorPredictiveConfig(draws=10, random_seed=1))
+    assert response.status == "completed" and response.result_id and not submitted
+
+    monkeypatch.delitem(ancestral_sampler._DISTRIBUTIONS, "pm.HalfNormal")
+    response = await service.submit_prior_predictive(MODEL, PriorPredictiveConfig(draws=10, random_seed=2))
+    assert response.status == "pending" and response.queue == INTERACTIVE_QUEUE
+    (signature, queue), = submitted
+    assert signature.task == tasks.prior_predictive_task.name and queue == INTERACTIVE_QUEUE
+    assert signature.args[2] == {"draws": 10, "random_seed": 2}
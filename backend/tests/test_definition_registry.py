@@ -0,0 +1,79 @@
+import json
+import os
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+from app.api import distributions
+from app.services import distribution_service
+from app.services.definition_registry import DefinitionRegistry, etag_matches
+
+class Item(BaseModel):
+    name: str
+    value: int
+
+def write(path, items, mtime=None):
+    path.write_text(json.dumps(items), encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, ns=(mtime, mtime))
+
+@pytest.fixture
+def files(tmp_path):
+    standard, custom = tmp_path / "standard.json", tmp_path / "custom.json"
+    write(standard, [{"name": "a", "value": 1}, {"name": "b", "value": 2}], mtime=1_000_000_000)
+    return standard, custom
+
+def test_custom_definitions_override_and_missing_files_are_skipped(files):
+    standard, custom = files
+    registry = DefinitionRegistry([standard, custom], Item)
+    assert registry.get("a").value == 1
+
+    write(custom, [{"name": "a", "value": 10}])
+    assert registry.get("a").value == 10
+
+def test_etag_follows_the_body(files):
+    standard, custom = files
+    registry = DefinitionRegistry([standard, custom], Item)
+    body, etag = registry.get_serialized()
+    assert registry.get_serialized() == (body, etag)
+
+    write(standard, [{"name": "a", "value": 3}], mtime=2_000_000_000)
+    new_body, new_etag = registry.get_serialized()
+    assert json.loads(new_body) == [{"name": "a", "value": 3}]
+    assert new_etag != etag
+
+def test_etag_matches():
+    assert etag_matches('"x"', '"x"')
+    assert etag_matches('W/"x"', '"x"')
+    assert etag_matches('"y", "x"', '"x"')
+    assert etag_matches("*", '"x"')
+    assert not etag_matches('"y"', '"x"')
+    assert not etag_matches(None, '"x"')
+
+def test_endpoint_decides_304_from_the_body_it_returns(files, monkeypatch):
+    standard, custom = files
+    registry = DefinitionRegistry([standard, custom], Item)
+    monkeypatch.setattr(distribution_service, "distribution_registry", registry)
+    app = FastAPI()
+    app.include_router(distributions.router, prefix="/api/distributions")
+    client = TestClient(app)
+
+    first = client.get("/api/distributions")
+    etag = first.headers["etag"]
+    assert first.status_code == 200
+    assert client.get("/api/distributions", headers={"If-None-Match": etag}).status_code == 304
+
+    # 1回目の取得の直後にファイルが変わっても、返すボディとETagの組で判定する
+    get_serialized = registry.get_serialized
+    calls = []
+
+    def changing(*args):
+        calls.append(1)
+        result = get_serialized()
+        write(standard, [{"name": "a", "value": len(calls) + 100}], mtime=3_000_000_000 + len(calls))
+        return result
+
+    monkeypatch.setattr(registry, "get_serialized", changing)
+    response = client.get("/api/distributions", headers={"If-None-Match": etag})
+    assert len(calls) == 1
+    assert response.status_code == 304 and response.headers["etag"] == etag
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from app.utils.diagnostics import STAT_NAMES, summarize, summarize_chunked
+
+az = pytest.importorskip("arviz")
+
+def ar1(rng, chains, draws, phi):
+    x = np.empty((chains, draws))
+    x[:, 0] = rng.normal(size=chains)
+    for t in range(1, draws):
+        x[:, t] = phi * x[:, t - 1] + rng.normal(size=chains)
+    return x
+
+def make_samples(chains, draws, seed=0):
+    """(chain, draw, K) に連続・自己相関・離散・定数・チェーン間でずれたパラメータを並べる"""
+    rng = np.random.default_rng(seed)
+    columns = [
+        rng.normal(size=(chains, draws)),
+        ar1(rng, chains, draws, 0.9),
+        ar1(rng, chains, draws, -0.5),
+        rng.binomial(1, 0.3, size=(chains, draws)).astype(float),
+        rng.poisson(2.0, size=(chains, draws)).astype(float),
+        np.full((chains, draws), 1.5),
+        rng.normal(size=(chains, draws)) + np.arange(chains)[:, None],
+    ]
+    return np.stack(columns, axis=2)
+
+def arviz_summary(ary):
+    posterior = {f"p{i}": ary[:, :, i] for i in range(ary.shape[2])}
+    table = az.summary(az.from_dict(posterior=posterior), round_to="none")
+    return {name: table[name].to_numpy(dtype=float) for name in STAT_NAMES}
+
+@pytest.mark.parametrize("chains, draws", [(4, 500), (4, 101), (1, 100), (2, 7)])
+def test_summarize_matches_arviz(chains, draws):
+    ary = make_samples(chains, draws)
+    expected = arviz_summary(ary)
+    for actual in (summarize(ary), summarize_chunked(ary, chunk_elements=2 * chains * draws)):
+        for name in STAT_NAMES:
+            np.testing.assert_allclose(actual[name], expected[name], rtol=1e-6, atol=1e-12, err_msg=name)
+
+def test_constant_parameter():
+    stats = summarize(np.full((4, 100, 1), 2.0))
+    assert stats["ess_bulk"][0] == stats["ess_tail"][0] == 400
+    assert stats["mcse_mean"][0] == stats["mcse_sd"][0] == 0
+    assert np.isnan(stats["r_hat"][0])
+
+def test_too_few_draws_skips_diagnostics():
+    stats = summarize(np.random.default_rng(0).normal(size=(4, 3, 2)))
+    assert not np.isnan(stats["mean"]).any()
+    for name in STAT_NAMES[4:]:
+        assert np.isnan(stats[name]).all()
@@ -0,0 +1,121 @@
+import json
+import pytest
+from fastapi import HTTPException
+from app.models.schemas import GraphBatchRequest
+from app.services.node_service import NodeService
+
+pytestmark = pytest.mark.anyio
+
+SESSION = "sess_test"
+MODEL = "model_test"
+PREFIX = f"sessions:{SESSION}:models:{MODEL}"
+
+def node(ref, code_name, node_type="latent"):
+    return {
+        "op": "create", "kind": "node", "ref": ref,
+        "data": {
+            "node_type": node_type, "gui_name": code_name, "code_name": code_name,
+            "position": {"x": 0, "y": 0},
+        },
+    }
+
+def batch(*operations):
+    return GraphBatchRequest(operations=list(operations))
+
+async def create_graph(service):
+    """a → b のグラフを作り、(ref → ID, バージョン) を返す"""
+    response = await service.apply_batch(MODEL, batch(
+        node("a", "alpha"),
+        node("b", "beta", "observed"),
+        {"op": "create", "kind": "edge", "ref": "e", "data": {"source": "a", "target": "b", "target_handle": "mu"}},
+    ))
+    ids = {r.ref: r.id for r in response.results}
+    return ids, response.version
+
+async def test_batch_resolves_refs_and_indexes_edges(redis):
+    service = NodeService(SESSION)
+    ids, version = await create_graph(service)
+
+    assert version == 1
+    edge = json.loads(redis.hget(f"{PREFIX}:edges", ids["e"]))
+    assert (edge["source"], edge["target"]) == (ids["a"], ids["b"])
+    assert redis.hgetall(f"{PREFIX}:adj:{ids['a']}:out") == {ids["e"]: ids["b"]}
+    assert redis.hgetall(f"{PREFIX}:adj:{ids['b']}:in") == {ids["e"]: ids["a"]}
+    assert {m for m, _ in redis.zrange(f"{PREFIX}:changes", 0, -1, withscores=True)} == {
+        f"node:{ids['a']}", f"node:{ids['b']}", f"edge:{ids['e']}",
+    }
+
+async def test_failed_operation_writes_nothing(redis):
+    service = NodeService(SESSION)
+    with pytest.raises(HTTPException) as error:
+        await service.apply_batch(MODEL, batch(
+            node("a", "alpha"),
+            {"op": "update", "kind": "node", "id": "node_missing", "data": {"gui_name": "x"}},
+        ))
+
+    assert error.value.status_code == 404
+    assert "operations[1]" in error.value.detail
+    assert redis.hlen(f"{PREFIX}:nodes") == 0
+    assert redis.get(f"{PREFIX}:version") is None
+
+async def test_edge_update_only_changes_handles(redis):
+    service = NodeService(SESSION)
+    ids, _ = await create_graph(service)
+
+    response = await service.apply_batch(MODEL, batch(
+        {"op": "update", "kind": "edge", "id": ids["e"], "data": {"target_handle": "sigma"}},
+    ))
+    assert response.results[0].edge.target_handle == "sigma"
+    assert response.results[0].edge.source == ids["a"]
+
+    for field, value in (("source", ids["b"]), ("target", ids["a"]), ("edge_id", "edge_other")):
+        with pytest.raises(HTTPException) as error:
+            await service.apply_batch(MODEL, batch(
+                {"op": "update", "kind": "edge", "id": ids["e"], "data": {field: value}},
+            ))
+        assert error.value.status_code == 422
+    edge = json.loads(redis.hget(f"{PREFIX}:edges", ids["e"]))
+    assert (edge["edge_id"], edge["source"], edge["target"]) == (ids["e"], ids["a"], ids["b"])
+
+async def test_concurrent_write_is_retried_not_lost(redis, monkeypatch):
+    service = NodeService(SESSION)
+    ids, _ = await create_graph(service)
+    apply = NodeService._apply_node_operation
+    calls = []
+
+    def interleaved(self, operation, state):
+        # 1回目の読み込みの後、書き込みの前に別のリクエストが同じノードを更新する
+        if not calls:
+            current = json.loads(redis.hget(f"{PREFIX}:nodes", ids["a"]))
+            redis.hset(f"{PREFIX}:nodes", ids["a"], json.dumps({**current, "gui_name": "renamed"}))
+        calls.append(operation)
+        return apply(self, operation, state)
+
+    monkeypatch.setattr(NodeService, "_apply_node_operation", interleaved)
+    await service.apply_batch(MODEL, batch(
+        {"op": "update", "kind": "node", "id": ids["a"], "data": {"position": {"x": 5, "y": 6}}},
+    ))
+
+    assert len(calls) == 2
+    stored = json.loads(redis.hget(f"{PREFIX}:nodes", ids["a"]))
+    assert stored["gui_name"] == "renamed"
+    assert stored["position"] == {"x": 5, "y": 6}
+
+async def test_persistent_conflict_returns_409(redis, monkeypatch):
+    service = NodeService(SESSION)
+    ids, _ = await create_graph(service)
+    apply = NodeService._apply_node_operation
+
+    def always_conflicting(self, operation, state):
+        redis.hset(f"{PREFIX}:nodes", "node_other", "{}")
+        return apply(self, operation, state)
+
+    monkeypatch.setattr(NodeService, "_apply_node_operation", always_conflicting)
+    with pytest.raises(HTTPException) as error:
+        await service.apply_batch(MODEL, batch(
+            {"op": "update", "kind": "node", "id": ids["a"], "data": {"gui_name": "x"}},
+        ))
+
+    assert error.value.status_code == 409
+    assert json.loads(redis.hget(f"{PREFIX}:nodes", ids["a"]))["gui_name"] == "alpha"
+    assert redis.get(f"{PREFIX}:version") == "1"
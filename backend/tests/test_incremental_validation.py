@@ -0,0 +1,158 @@
+import json
+import pytest
+from app.config import settings
+from app.models.schemas import GraphBatchRequest
+from app.services.data_service import DataService
+from app.services.graph_validator import GraphValidator, format_shape
+from app.services.node_service import NodeService
+from app.services.validation_service import ValidationService
+
+pytestmark = pytest.mark.anyio
+
+SESSION = "sess_test"
+MODEL = "model_test"
+PREFIX = f"sessions:{SESSION}:models:{MODEL}"
+
+# アップロード済みデータの代わり（列名 → カテゴリ数、数値列はNone）
+COLUMNS = {"x": None, "x2": None, "y": None, "g": 3}
+
+def describe(csv_mapping):
+    names = [c.strip() for c in (csv_mapping.get("columns") or csv_mapping["column"]).split(",")]
+    missing = [c for c in names if c not in COLUMNS]
+    if missing:
+        raise ValueError(f"Columns not found: {missing}")
+    categorical = len(names) == 1 and COLUMNS[names[0]] is not None
+    return {
+        "n_rows": 10,
+        "n_columns": len(names),
+        "categorical": categorical,
+        "n_categories": COLUMNS[names[0]] if categorical else None,
+        "null_count": 0,
+    }
+
+@pytest.fixture(autouse=True)
+def data(monkeypatch):
+    monkeypatch.setattr(DataService, "describe_mapping", lambda self, csv_mapping: describe(csv_mapping))
+
+def node(ref, node_type, code_name=None, **fields):
+    data = {"node_type": node_type, "gui_name": ref, "code_name": code_name or ref, "position": {"x": 0, "y": 0}}
+    return {"op": "create", "kind": "node", "ref": ref, "data": {**data, **fields}}
+
+def edge(ref, source, target, handle):
+    return {"op": "create", "kind": "edge", "ref": ref, "data": {"source": source, "target": target, "target_handle": handle}}
+
+async def apply(*operations):
+    response = await NodeService(SESSION).apply_batch(MODEL, GraphBatchRequest(operations=list(operations)))
+    return {r.ref: r.id for r in response.results if r.ref}
+
+async def check(redis):
+    """増分の検査結果が、キャッシュを使わない検査と一致することを確かめる"""
+    result = await ValidationService(SESSION).validate(MODEL)
+    nodes = {k: json.loads(v) for k, v in redis.hgetall(f"{PREFIX}:nodes").items()}
+    edges = {k: json.loads(v) for k, v in redis.hgetall(f"{PREFIX}:edges").items()}
+    cold_cache, cold_issues, _ = GraphValidator(nodes, edges, describe).run()
+
+    assert [i.model_dump() for i in result.issues] == cold_issues
+    assert result.shapes == {
+        node_id: format_shape(tuple(s["shape"]) if s["shape"] is not None else None)
+        for node_id, s in cold_cache["nodes"].items()
+    }
+    assert result.valid == (not any(i["severity"] == "error" for i in cold_issues))
+    return result
+
+def codes(result):
+    return sorted(i.code for i in result.issues if i.severity == "error")
+
+async def test_cycle_is_found_and_cleared(redis):
+    ids = await apply(
+        node("a", "latent", distribution="Normal"),
+        node("b", "latent", distribution="Normal"),
+        node("c", "latent", distribution="Normal"),
+        node("y", "observed", distribution="Normal", csv_mapping={"data_id": "d", "column": "y"}),
+        edge("ab", "a", "b", "mu"),
+        edge("bc", "b", "c", "mu"),
+        edge("cy", "c", "y", "mu"),
+    )
+    assert (await check(redis)).valid
+
+    cycle = await apply(edge("ca", ids["c"], ids["a"], "mu"))
+    result = await check(redis)
+    assert codes(result) == ["cycle"]
+
+    await apply({"op": "delete", "kind": "edge", "id": cycle["ca"]})
+    result = await check(redis)
+    assert result.valid and result.checked_nodes == 4
+
+async def test_retargeted_and_deleted_edges_recheck_the_old_target(redis):
+    ids = await apply(
+        node("v", "latent", shape="3", distribution="Normal"),
+        node("s", "hyperparameter", distribution="HalfNormal"),
+        node("w", "latent", distribution="Normal"),
+        node("y", "observed", distribution="Normal", csv_mapping={"data_id": "d", "column": "y"}),
+        edge("sw", "s", "w", "sigma"),
+        edge("wy", "w", "y", "mu"),
+    )
+    assert (await check(redis)).valid
+
+    # ハンドルの付け替えで形状が合わなくなる
+    wrong = await apply(edge("vy", ids["v"], ids["y"], "sigma"))
+    assert codes(await check(redis)) == ["shape_mismatch"]
+    await apply({"op": "update", "kind": "edge", "id": wrong["vy"], "data": {"target_handle": "mu"}})
+    assert codes(await check(redis)) == ["duplicate_input"]
+
+    await apply({"op": "delete", "kind": "edge", "id": wrong["vy"]})
+    result = await check(redis)
+    assert result.valid and result.checked_nodes == 1
+
+    # ノードの削除で接続していたエッジも消え、子の入力が変わる
+    await apply({"op": "delete", "kind": "node", "id": ids["s"]})
+    result = await check(redis)
+    assert result.valid and result.checked_nodes == 2
+    assert result.shapes[ids["w"]] == "()"
+
+async def test_categorical_remap_toggles_the_plate(redis):
+    ids = await apply(
+        node("g", "data", csv_mapping={"data_id": "d", "column": "x2"}),
+        node("alpha", "latent", shape="g", distribution="Normal"),
+        node("x", "data", csv_mapping={"data_id": "d", "column": "x"}),
+        node("mu", "operation", operation="add"),
+        node("y", "observed", distribution="Normal", csv_mapping={"data_id": "d", "column": "y"}),
+        edge("e1", "alpha", "mu", "operand_1"),
+        edge("e2", "x", "mu", "operand_2"),
+        edge("e3", "mu", "y", "mu"),
+    )
+    assert codes(await check(redis)) == ["unknown_dimension"]
+
+    # gをカテゴリ列に対応付けると、変更していないalphaの次元が解釈できるようになる
+    await apply({"op": "update", "kind": "node", "id": ids["g"], "data": {"csv_mapping": {"data_id": "d", "column": "g"}}})
+    result = await check(redis)
+    assert result.valid and result.checked_nodes == 5
+    assert result.shapes[ids["alpha"]] == "(g,)" and result.shapes[ids["mu"]] == "(n_observations,)"
+
+    await apply({"op": "update", "kind": "node", "id": ids["g"], "data": {"csv_mapping": {"data_id": "d", "column": "x"}}})
+    assert codes(await check(redis)) == ["unknown_dimension"]
+
+async def test_truncated_change_log_runs_a_full_check(redis, monkeypatch):
+    monkeypatch.setattr(settings, "MODEL_CHANGE_LOG_SIZE", 3)
+    ids = await apply(
+        node("a", "latent", distribution="Normal"),
+        node("b", "latent", distribution="Normal"),
+        node("y", "observed", distribution="Normal", csv_mapping={"data_id": "d", "column": "y"}),
+        edge("ay", "a", "y", "mu"),
+        edge("by", "b", "y", "sigma"),
+    )
+    await check(redis)
+
+    # 変更ログに残る範囲なら変更したノードとその子孫だけ
+    await apply({"op": "update", "kind": "node", "id": ids["a"], "data": {"shape": "2"}})
+    result = await check(redis)
+    assert result.checked_nodes == 2 and codes(result) == ["shape_mismatch"]
+
+    # 最後の検査より後の変更が切り詰められると、変更ログからは差分が分からない
+    await apply({"op": "update", "kind": "node", "id": ids["b"], "data": {"distribution": "Missing"}})
+    for i in range(3):
+        await apply(node(f"n{i}", "latent", distribution="Normal"))
+    assert redis.zcard(f"{PREFIX}:changes") == 3
+    result = await check(redis)
+    assert result.checked_nodes == 6
+    assert codes(result) == ["shape_mismatch", "unknown_distribution"]
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from app.services import tasks
+from app.services.model_cache import CompiledModelCache
+
+NODES = {
+    "x": {"node_type": "data", "code_name": "x"},
+    "mu": {"node_type": "latent", "code_name": "mu", "distribution": "Normal", "parameters": {}},
+    "y": {"node_type": "observed", "code_name": "y", "distribution": "Normal", "parameters": {}},
+}
+EDGES = {"e": {"source": "mu", "target": "y", "target_handle": "mu"}}
+
+def data(n_rows=5, x_columns=2, y_dtype=np.int64):
+    return {"x": np.ones((n_rows, x_columns)), "y": np.arange(n_rows).astype(y_dtype)}
+
+@pytest.fixture
+def cache(redis, monkeypatch):
+    cache = CompiledModelCache(max_bytes=1 << 40, max_entries=10)
+    monkeypatch.setattr(tasks, "model_cache", cache)
+    return cache
+
+def get(values):
+    return tasks._get_or_build_model("graph", "structure", NODES, EDGES, values, {})
+
+def test_same_layout_reuses_the_model(cache):
+    first, hit = get(data())
+    assert not hit
+    second, hit = get(data(n_rows=8, y_dtype=np.int32))
+    assert hit and second is first
+    assert second.model.dim_lengths["n_observations"].eval() == 8
+
+def test_remapped_columns_build_a_new_model(cache):
+    first, _ = get(data())
+    wider, hit = get(data(x_columns=3))
+    assert not hit and wider is not first
+    assert len(wider.model.coords["x_dim_1"]) == 3
+
+    real, hit = get(data(y_dtype=np.float64))
+    assert not hit
+    assert real.model["y_observed"].dtype.startswith("float")
+    assert real.graph_hash != first.graph_hash and real.structure_hash != first.structure_hash
+
+def test_rejected_data_rebuilds_the_entry(cache, monkeypatch):
+    # キーが同じでもpm.set_dataが失敗したら、破棄して作り直す
+    monkeypatch.setattr(tasks, "compute_data_layout", lambda nodes, values: "same")
+    first, _ = get(data())
+    rebuilt, hit = get(data(x_columns=3))
+    assert not hit and rebuilt is not first
+    assert len(rebuilt.model.coords["x_dim_1"]) == 3
+    assert cache.stats()["entries"] == 1 and cache.evictions == 1
+
+def test_chains_start_from_jittered_points(cache):
+    entry, _ = get(data())
+    start = entry.model.initial_point()
+    points = entry.jittered_initial_points([1, 2, 3])
+
+    assert entry.jittered_initial_points([1, 2, 3]) == points
+    assert len({float(p["mu"]) for p in points} | {float(start["mu"])}) == 4
+    step = entry.get_nuts_step(initial_points=points)
+    np.testing.assert_allclose(step.potential._initial_mean, [np.mean([p["mu"] for p in points])])
+
+def test_sample_passes_jittered_initvals(cache, monkeypatch):
+    import pymc as pm
+
+    entry, _ = get(data())
+    calls = []
+    monkeypatch.setattr(pm, "sample", lambda **kwargs: calls.append(kwargs))
+    tasks._sample_nuts(entry, {}, 2, 7)
+    tasks._sample_nuts(entry, {}, 1, tasks._chain_seeds(7, 2)[1:], first_chain=1)
+
+    whole, split = calls
+    assert whole["random_seed"] == tasks._chain_seeds(7, 2)
+    assert whole["initvals"] == entry.jittered_initial_points(whole["random_seed"])
+    # サブタスクに分けたチェーンも、分けない場合と同じ初期値とシードになる
+    assert split["initvals"] == whole["initvals"][1:] and split["random_seed"] == whole["random_seed"][1:]
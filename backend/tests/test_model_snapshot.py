@@ -0,0 +1,86 @@
+import pytest
+from fastapi import HTTPException
+from app.config import settings
+from app.models.schemas import EdgeCreate, GraphBatchRequest, ModelCreate, NodeCreate, NodeUpdate
+from app.services.model_service import ModelService
+from app.services.node_service import NodeService
+
+pytestmark = pytest.mark.anyio
+
+SESSION = "sess_test"
+
+def node_data(code_name):
+    return NodeCreate(node_type="latent", gui_name=code_name, code_name=code_name, position={"x": 0, "y": 0})
+
+@pytest.fixture
+async def model_id(redis):
+    return (await ModelService(SESSION).create_model(ModelCreate(name="m"))).model_id
+
+async def test_every_mutation_bumps_the_version_once(redis, model_id):
+    models, nodes = ModelService(SESSION), NodeService(SESSION)
+    assert (await models.get_snapshot(model_id)).version == 0
+
+    a = await nodes.create_node(model_id, node_data("a"))
+    b = await nodes.create_node(model_id, node_data("b"))
+    await nodes.update_node(model_id, a.node_id, NodeUpdate(gui_name="A"))
+    edge = await nodes.create_edge(model_id, EdgeCreate(source=a.node_id, target=b.node_id))
+    response = await nodes.apply_batch(model_id, GraphBatchRequest(operations=[
+        {"op": "create", "kind": "node", "data": node_data("c").model_dump()},
+        {"op": "update", "kind": "node", "id": b.node_id, "data": {"gui_name": "B"}},
+    ]))
+
+    assert response.version == 5
+    changes = dict(redis.zrange(f"sessions:{SESSION}:models:{model_id}:changes", 0, -1, withscores=True))
+    assert changes[f"node:{a.node_id}"] == 3
+    assert changes[f"edge:{edge.edge_id}"] == 4
+    assert changes[f"node:{b.node_id}"] == 5
+
+async def test_since_returns_changes_and_deletions(redis, model_id):
+    models, nodes = ModelService(SESSION), NodeService(SESSION)
+    a = await nodes.create_node(model_id, node_data("a"))
+    b = await nodes.create_node(model_id, node_data("b"))
+    edge = await nodes.create_edge(model_id, EdgeCreate(source=a.node_id, target=b.node_id))
+    since = (await models.get_snapshot(model_id)).version
+
+    c = await nodes.create_node(model_id, node_data("c"))
+    await nodes.delete_node(model_id, b.node_id)
+
+    diff = await models.get_snapshot(model_id, since=since)
+    assert not diff.full
+    assert diff.version == since + 2
+    assert [n.node_id for n in diff.nodes] == [c.node_id]
+    assert diff.deleted_nodes == [b.node_id]
+    assert diff.deleted_edges == [edge.edge_id]
+    assert diff.edges == []
+
+    unchanged = await models.get_snapshot(model_id, since=diff.version)
+    assert not unchanged.full and unchanged.nodes == [] and unchanged.deleted_nodes == []
+
+async def test_truncated_log_falls_back_to_full_snapshot(redis, model_id, monkeypatch):
+    monkeypatch.setattr(settings, "MODEL_CHANGE_LOG_SIZE", 3)
+    models, nodes = ModelService(SESSION), NodeService(SESSION)
+    created = [await nodes.create_node(model_id, node_data(f"n{i}")) for i in range(5)]
+
+    # 直近の3件（バージョン3〜5）だけが残る
+    changes_key = f"sessions:{SESSION}:models:{model_id}:changes"
+    assert redis.zrange(changes_key, 0, -1, withscores=True) == [
+        (f"node:{n.node_id}", float(v)) for v, n in zip((3, 4, 5), created[2:])
+    ]
+
+    full = await models.get_snapshot(model_id, since=1)
+    assert full.full and len(full.nodes) == 5
+
+    diff = await models.get_snapshot(model_id, since=3)
+    assert not diff.full
+    assert [n.node_id for n in diff.nodes] == [n.node_id for n in created[3:]]
+
+async def test_since_ahead_of_version_returns_full_snapshot(redis, model_id):
+    await NodeService(SESSION).create_node(model_id, node_data("a"))
+    snapshot = await ModelService(SESSION).get_snapshot(model_id, since=10)
+    assert snapshot.full and snapshot.version == 1 and len(snapshot.nodes) == 1
+
+async def test_missing_model_is_404(redis):
+    for since in (None, 0):
+        with pytest.raises(HTTPException) as error:
+            await ModelService(SESSION).get_snapshot("mdl_missing", since=since)
+        assert error.value.status_code == 404
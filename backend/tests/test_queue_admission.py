@@ -0,0 +1,92 @@
+import time
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+from app.celery_app import celery_app
+from app.config import settings
+from app.services import queues
+from app.services.queue_service import QueueService
+from app.services.queues import BATCH_QUEUE, INTERACTIVE_QUEUE
+
+pytestmark = pytest.mark.anyio
+
+SESSION = "sess_test"
+ACTIVE_KEY = f"sessions:{SESSION}:active:{BATCH_QUEUE}"
+
+class FakeResult:
+    def __init__(self, state):
+        self.state = state
+
+@pytest.fixture
+def states(monkeypatch):
+    """タスクID → Celeryの状態（記録のないタスクはPENDING）"""
+    states = {}
+    monkeypatch.setattr(celery_app, "AsyncResult", lambda task_id: FakeResult(states.get(task_id, "PENDING")))
+    monkeypatch.setattr(settings, "SESSION_MAX_BATCH_TASKS", 2)
+    return states
+
+async def test_admit_rejects_over_the_limit(redis, states):
+    service = QueueService(SESSION)
+    await service.admit(BATCH_QUEUE, "t1")
+    await service.admit(BATCH_QUEUE, "t2")
+
+    with pytest.raises(HTTPException) as error:
+        await service.admit(BATCH_QUEUE, "t3")
+    assert error.value.status_code == 429
+    assert set(redis.zrange(ACTIVE_KEY, 0, -1)) == {"t1", "t2"}
+
+    # 上限はキューごと・セッションごと
+    await service.admit(INTERACTIVE_QUEUE, "t4")
+    await QueueService("sess_other").admit(BATCH_QUEUE, "t5")
+
+async def test_finished_tasks_free_their_slot(redis, states):
+    service = QueueService(SESSION)
+    await service.admit(BATCH_QUEUE, "t1")
+    await service.admit(BATCH_QUEUE, "t2")
+
+    states["t1"] = "SUCCESS"
+    await service.admit(BATCH_QUEUE, "t3")
+    assert set(redis.zrange(ACTIVE_KEY, 0, -1)) == {"t2", "t3"}
+
+    # 実行中（STARTED）や再試行中のタスクは数に残る
+    states["t2"] = "STARTED"
+    states["t3"] = "RETRY"
+    with pytest.raises(HTTPException):
+        await service.admit(BATCH_QUEUE, "t4")
+
+async def test_release_and_stale_entries(redis, states):
+    service = QueueService(SESSION)
+    await service.admit(BATCH_QUEUE, "t1")
+    await service.release(BATCH_QUEUE, "t1")
+    assert redis.zcard(ACTIVE_KEY) == 0
+
+    # 1日以上前に投入されたタスクは状態を確かめずに除く
+    redis.zadd(ACTIVE_KEY, {"old1": time.time() - 90000, "old2": time.time() - 90000})
+    await service.admit(BATCH_QUEUE, "t2")
+    await service.admit(BATCH_QUEUE, "t3")
+    assert set(redis.zrange(ACTIVE_KEY, 0, -1)) == {"t2", "t3"}
+
+async def test_status_reports_waits_and_session_counts(redis, states, monkeypatch):
+    monkeypatch.setattr(QueueService, "_queue_depth", lambda self, queue: 3)
+    monkeypatch.setattr(queues, "_WAITS_SIZE", 4)
+    now = [1000.0]
+    monkeypatch.setattr(queues, "time", SimpleNamespace(time=lambda: now[0]))
+
+    for i, wait in enumerate((1.0, 2.0, 3.0, 4.0, 5.0)):
+        queues._record_enqueued(headers={"id": f"w{i}"}, routing_key=BATCH_QUEUE)
+        now[0] += wait
+        queues._record_wait(task_id=f"w{i}")
+    # 対象外のキューと記録のないタスクは無視する
+    queues._record_enqueued(headers={"id": "x"}, routing_key="celery")
+    queues._record_wait(task_id="x")
+
+    await QueueService(SESSION).admit(BATCH_QUEUE, "t1")
+    status = {q.name: q for q in (await QueueService(SESSION).get_status()).queues}
+
+    batch = status[BATCH_QUEUE]
+    assert batch.depth == 3
+    assert batch.recent_tasks == 4  # 直近の_WAITS_SIZE件だけ残る
+    assert batch.wait_max == 5.0 and batch.wait_p50 == 3.5
+    assert (batch.session_active, batch.session_limit) == (1, 2)
+    assert status[INTERACTIVE_QUEUE].recent_tasks == 0 and status[INTERACTIVE_QUEUE].wait_p50 is None
+    assert redis.keys("queues:enqueued:*") == []
@@ -0,0 +1,130 @@
+import os
+import time
+import pytest
+from app.config import settings
+from app.services.storage_manager import (
+    ACTIVITY_KEY,
+    USAGE_KEY,
+    StorageManager,
+    StorageQuotaExceeded,
+    get_lru_key,
+    sweep,
+)
+
+SESSION = "sess_test"
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setattr(settings, "SESSION_STORAGE_QUOTA", 1000)
+    monkeypatch.setattr(settings, "SESSION_TIMEOUT", 3600)
+
+def write(storage, session_id, kind, item_id, size):
+    path = storage / session_id / ("data" if kind == "data" else "results") / item_id
+    path.mkdir(parents=True, exist_ok=True)
+    (path / "payload.bin").write_bytes(b"x" * size)
+    return path
+
+def age(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+def test_add_evicts_least_recently_used_results(redis, storage):
+    manager = StorageManager(SESSION)
+    write(storage, SESSION, "data", "d1", 100)
+    assert manager.add("data", "d1") == 100
+    for result_id in ("r1", "r2"):
+        write(storage, SESSION, "result", result_id, 400)
+        manager.add("result", result_id)
+    # r1の方が最近参照された
+    redis.zadd(get_lru_key(SESSION), {"r1": time.time() + 10})
+
+    r3 = write(storage, SESSION, "result", "r3", 400)
+    assert manager.add("result", "r3") == 900
+
+    assert manager.items() == {"data:d1": 100, "result:r1": 400, "result:r3": 400}
+    assert manager.usage() == 900
+    assert not (storage / SESSION / "results" / "r2").exists() and r3.exists()
+    assert redis.zrange(get_lru_key(SESSION), 0, -1) == ["r3", "r1"]
+
+def test_item_that_cannot_fit_is_rejected_without_eviction(redis, storage):
+    manager = StorageManager(SESSION)
+    write(storage, SESSION, "data", "d1", 300)
+    manager.add("data", "d1")
+    write(storage, SESSION, "result", "r1", 500)
+    manager.add("result", "r1")
+
+    # 結果を全て消してもデータが収まらない
+    big = write(storage, SESSION, "data", "d2", 800)
+    with pytest.raises(StorageQuotaExceeded):
+        manager.add("data", "d2")
+    # データと合わせると上限を超える結果
+    huge = write(storage, SESSION, "result", "r2", 750)
+    with pytest.raises(StorageQuotaExceeded):
+        manager.add("result", "r2")
+
+    assert not big.exists() and not huge.exists()
+    assert manager.items() == {"data:d1": 300, "result:r1": 500}
+    assert manager.usage() == 800
+    assert manager.available_bytes() == 700
+
+def test_refresh_and_remove(redis, storage):
+    manager = StorageManager(SESSION)
+    path = write(storage, SESSION, "result", "r1", 200)
+    manager.add("result", "r1")
+
+    # refreshは上限を適用しない
+    (path / "plot.png").write_bytes(b"x" * 900)
+    assert manager.refresh("result", "r1") == 1100
+
+    manager.remove("result", "r1")
+    assert not path.exists()
+    assert manager.items() == {} and manager.usage() == 0
+    assert redis.zcard(get_lru_key(SESSION)) == 0
+
+def test_sweep_removes_expired_sessions_and_leftovers(redis, storage):
+    now = time.time()
+    for session_id, last_activity in (("old1", now - 7200), ("old2", now - 5000), ("live", now)):
+        manager = StorageManager(session_id)
+        write(storage, session_id, "data", "d1", 10)
+        manager.add("data", "d1")
+        redis.zadd(ACTIVITY_KEY, {session_id: last_activity})
+        redis.set(f"sessions:{session_id}:models:m1:version", 1)
+    redis.set("sessions:live:meta", "{}")
+
+    stale_tmp = storage / "live" / "tmp" / "task_old"
+    fresh_tmp = storage / "live" / "tmp" / "task_new"
+    for path in (stale_tmp, fresh_tmp):
+        path.mkdir(parents=True)
+    age(stale_tmp, 7200)
+    orphan, recent_orphan, pytensor = storage / "orphan", storage / "recent", storage / ".pytensor"
+    for path in (orphan, recent_orphan, pytensor):
+        path.mkdir()
+    age(orphan, 7200)
+    age(pytensor, 7200)
+
+    stats = sweep(batch_size=1)
+
+    assert stats == {"sessions": 2, "keys": 4, "orphans": 1, "tmp": 1}
+    assert sorted(p.name for p in storage.iterdir()) == [".pytensor", "live", "recent"]
+    assert sorted(redis.keys("sessions:*")) == [
+        "sessions:live:meta", "sessions:live:models:m1:version", "sessions:live:storage:items",
+    ]
+    assert redis.zrange(ACTIVITY_KEY, 0, -1) == ["live"]
+    assert redis.hgetall(USAGE_KEY) == {"live": "10"}
+    assert not stale_tmp.exists() and fresh_tmp.exists()
+
+def test_sweep_skips_session_touched_after_selection(redis, storage, monkeypatch):
+    redis.zadd(ACTIVITY_KEY, {"sess_a": time.time() - 7200})
+    redis.set("sessions:sess_a:meta", "{}")
+    (storage / "sess_a").mkdir()
+    zrangebyscore = redis.zrangebyscore
+
+    def touched_meanwhile(*args, **kwargs):
+        # 候補を選んだ直後にリクエストが来て最終アクセスが更新された
+        candidates = zrangebyscore(*args, **kwargs)
+        redis.zadd(ACTIVITY_KEY, {"sess_a": time.time()})
+        return candidates
+
+    monkeypatch.setattr(redis, "zrangebyscore", touched_meanwhile)
+    assert sweep()["sessions"] == 0
+    assert redis.exists("sessions:sess_a:meta") and (storage / "sess_a").exists()
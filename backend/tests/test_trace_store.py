@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from app.config import settings
+from app.services.result_service import ResultService
+from app.services.tasks import merge_chains_task
+from app.utils.trace_store import concat_stores, load_index, read_variable, to_inference_data, write_idata
+
+az = pytest.importorskip("arviz")
+
+SESSION = "sess_test"
+SCHOOLS = ["A", "B", "C"]
+
+def make_idata(chains=3, draws=20, seed=0):
+    rng = np.random.default_rng(seed)
+    return az.from_dict(
+        posterior={
+            "mu": rng.normal(size=(chains, draws)),
+            "theta": rng.normal(size=(chains, draws, len(SCHOOLS))),
+            "count": rng.poisson(3.0, size=(chains, draws, 2)),
+        },
+        observed_data={"y": rng.normal(size=len(SCHOOLS))},
+        coords={"school": SCHOOLS},
+        dims={"theta": ["school"], "y": ["school"]},
+    )
+
+def assert_same(actual, expected):
+    """chain/draw以外の座標と値・次元が一致することを確かめる"""
+    assert set(actual.groups()) == set(expected.groups())
+    for group in expected.groups():
+        assert set(actual[group].data_vars) == set(expected[group].data_vars), group
+        for name, reference in expected[group].data_vars.items():
+            values = actual[group][name]
+            assert values.dims == reference.dims and values.dtype == reference.dtype, name
+            np.testing.assert_array_equal(values.values, reference.values)
+            for dim in reference.dims:
+                if dim not in ("chain", "draw"):
+                    assert list(values[dim].values) == list(reference[dim].values)
+
+def test_write_and_concat_round_trip(tmp_path):
+    idata = make_idata()
+    write_idata(idata, tmp_path / "whole")
+    assert_same(to_inference_data(tmp_path / "whole"), idata)
+
+    parts = []
+    for i, chains in enumerate(([0, 1], [2])):
+        write_idata(idata.isel(chain=chains), tmp_path / f"part{i}")
+        parts.append(tmp_path / f"part{i}")
+    index = concat_stores(parts, tmp_path / "merged")
+
+    assert index == load_index(tmp_path / "whole")
+    assert_same(to_inference_data(tmp_path / "merged"), idata)
+    subset = to_inference_data(tmp_path / "merged", groups=["posterior"], var_names=["theta"])
+    assert subset.groups() == ["posterior"] and list(subset.posterior.data_vars) == ["theta"]
+
+def test_read_variable_slices(tmp_path):
+    idata = make_idata(chains=4, draws=30)
+    write_idata(idata, tmp_path)
+    theta = idata.posterior["theta"].values
+    dims = ["chain", "draw", "school"]
+
+    np.testing.assert_array_equal(read_variable(tmp_path, "posterior", "theta", dims), theta)
+    np.testing.assert_array_equal(
+        read_variable(tmp_path, "posterior", "theta", dims, chains=[3, 1], draws=slice(5, 25, 4), isel={"school": [2, 0]}),
+        theta[[3, 1]][:, 5:25:4][:, :, [2, 0]],
+    )
+    np.testing.assert_array_equal(
+        read_variable(tmp_path, "posterior", "theta", dims, isel={"school": slice(1, None)}),
+        theta[:, :, 1:],
+    )
+    np.testing.assert_array_equal(
+        read_variable(tmp_path, "observed_data", "y", ["school"], chains=[0], draws=slice(0, 1)),
+        idata.observed_data["y"].values,
+    )
+
+@pytest.fixture
+def merged(redis, storage):
+    """チェーンを分けて書いた部分トレースを、chordの結合タスクで1つの結果にする"""
+    idata = make_idata(chains=4, draws=30)
+    partials = []
+    for first_chain in (2, 0):
+        part_dir = storage / SESSION / "tmp" / "task_parent" / f"chains_{first_chain}"
+        write_idata(idata.isel(chain=[first_chain, first_chain + 1]), part_dir)
+        partials.append({
+            "dir": str(part_dir),
+            "first_chain": first_chain,
+            "graph_hash": "graph",
+            "structure_hash": "structure",
+            "warm_start": None,
+        })
+    # 完了順に届いても、チェーン番号順に並べて結合する
+    result = merge_chains_task(partials, "model_test", SESSION, {"chains": 4})
+    assert result["chain_groups"] == 2
+    assert not (storage / SESSION / "tmp" / "task_parent").exists()
+    return idata, result["result_id"]
+
+@pytest.mark.anyio
+async def test_chord_merge_and_result_selection(merged, storage):
+    idata, result_id = merged
+    trace_dir = storage / SESSION / "results" / result_id / "trace"
+    assert_same(to_inference_data(trace_dir), idata)
+
+    service = ResultService(SESSION)
+    values = await service.get_variable(
+        result_id, "theta", chains=[3, 0], draw_start=2, draw_stop=20, thin=3, isel={"school": [1]}
+    )
+    expected = idata.posterior["theta"].values[[3, 0]][:, 2:20:3][:, :, [1]]
+    assert values.shape == list(expected.shape)
+    np.testing.assert_array_equal(values.values, expected)
+    assert values.coords == {"chain": [3, 0], "draw": [2, 5, 8, 11, 14, 17], "school": ["B"]}
+
+@pytest.mark.anyio
+async def test_selection_over_the_limit_is_rejected(merged, monkeypatch):
+    _, result_id = merged
+    monkeypatch.setattr(settings, "RESULT_MAX_ELEMENTS", 100)
+    service = ResultService(SESSION)
+
+    # 4チェーン × 30ドロー × 3校 = 360要素
+    with pytest.raises(HTTPException) as error:
+        await service.get_variable(result_id, "theta")
+    assert error.value.status_code == 413
+    with pytest.raises(HTTPException) as error:
+        await service.get_variable(result_id, "theta", thin=2, isel={"school": slice(0, 2)})
+    assert error.value.status_code == 413
+
+    # 上限ちょうどまでは読める（2チェーン × 25ドロー × 2校）
+    values = await service.get_variable(result_id, "theta", chains=[0, 1], draw_stop=25, isel={"school": [0, 2]})
+    assert values.shape == [2, 25, 2]